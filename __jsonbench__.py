@@ -0,0 +1,87 @@
+# -------------------------------------------------------------------------------
+#
+# Compares the json backends of jsonlib.py on the decks in examples/: page
+# extraction for the .html files, webapi decoding from bytes for the .json
+# files and the deck cache round trip. Fails if the backends don't give the
+# same objects.
+#
+#   python __jsonbench__.py --repeat 20
+#
+# -------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import jsonlib
+import quizlet
+
+examples = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples")
+
+
+def loadExamples():
+    # (name, what to run on it) for every example the importer can read
+    cases = []
+    for name in sorted(os.listdir(examples)):
+        with open(os.path.join(examples, name), 'rb') as f:
+            data = f.read()
+        if name.endswith('.html'):
+            text = data.decode('utf-8')
+            try:
+                quizlet.extractItems(text)
+            except Exception:
+                continue
+            cases.append((name, "page", lambda text=text: quizlet.extractItems(text)))
+        elif name.endswith('.json'):
+            cases.append((name, "webapi", lambda data=data: jsonlib.loads(data)))
+            # what the deck cache writes and reads back for it
+            cases.append((name, "cache", lambda data=data: jsonlib.loads(jsonlib.dumps(jsonlib.loads(data)))))
+    return cases
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for i in range(repeat):
+        result = fn()
+    return time.perf_counter() - started, result
+
+
+def main(args):
+    backends = ["json"] + (["orjson"] if jsonlib.orjson else [])
+    if len(backends) == 1:
+        print("orjson is not installed, only the standard library is measured")
+
+    failed = 0
+    totals = dict((backend, 0.0) for backend in backends)
+    print("{0:<14} {1:<7} ".format("example", "") + "".join("{0:>10}".format(b) for b in backends))
+    for name, kind, fn in loadExamples():
+        results = []
+        row = "{0:<14} {1:<7} ".format(name, kind)
+        for backend in backends:
+            jsonlib.useBackend(backend)
+            seconds, result = timed(fn, args.repeat)
+            totals[backend] += seconds
+            # the stdlib dump tells 1 from 1.0 and keeps the key order
+            results.append(json.dumps(result))
+            row += "{0:>9.1f}ms".format(seconds * 1000 / args.repeat)
+        if any(result != results[0] for result in results):
+            failed += 1
+            row += "  DIFFERENT"
+        print(row)
+
+    print("{0:<22} ".format("total") + "".join("{0:>9.1f}ms".format(totals[b] * 1000 / args.repeat)
+                                               for b in backends))
+    if len(backends) > 1:
+        print("orjson: {0:.1f}x".format(totals["json"] / totals["orjson"]))
+    jsonlib.useBackend("auto")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=10, help="runs per example and backend")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,167 @@
+# -------------------------------------------------------------------------------
+#
+# End-to-end import harness, runs fetch -> parse -> media -> note against
+# the local stand-in server and a temporary Anki collection, no Anki GUI and
+# no network needed (pip install anki requests).
+#
+#   python __loadtest__.py --imports 5 --concurrency 3 --captcha-rate 0.5
+#   python __loadtest__.py --server http://127.0.0.1:8765 --sets 363366586
+#
+# -------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import quizlet
+from timing import ImportTrace
+from pipeline import ImportPipeline, ImportJob
+from __mockserver__ import addArguments, mockFromArguments, serve
+
+from anki.collection import Collection
+
+
+def fetch(setId, trace):
+    fetcher = quizlet.QuizletFetcher(quizlet.deckUrl(setId), setId, '', trace=trace)
+    fetcher.fetch()
+    return fetcher
+
+
+def runSerial(args, col, jobs, traces, failed):
+    # fetches in parallel, then media and notes deck by deck as in the add-on before the pipeline
+    def downloader(trace):
+        def download(url, suffix, fallback):
+            try:
+                return quizlet.downloadFile(url, col.media.dir(), suffix, fallback, None, trace)
+            except urllib.error.HTTPError as e:
+                failed.append((url, e.code))
+                return None
+        return download
+
+    notes = 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = {}
+        for setId in jobs:
+            trace = ImportTrace(setId, profile=args.profile)
+            traces.append(trace)
+            futures[pool.submit(fetch, setId, trace)] = trace
+
+        # the collection is not thread safe, notes are written here one deck at a time
+        for future in as_completed(futures):
+            trace = futures[future]
+            fetcher = future.result()
+            if fetcher.error:
+                print("{0}: error {1} captcha={2}".format(
+                    trace.name, fetcher.errorCode, fetcher.errorCaptcha))
+                continue
+
+            with trace.profiled():
+                notes += quizlet.createDeck(col, fetcher.results, downloader(trace),
+                                            downloadAudio=not args.no_audio, trace=trace)
+            print(trace.summary())
+
+            if args.trace_dir:
+                trace.dump(args.trace_dir)
+
+    return notes
+
+
+def runPipeline(args, col, jobs, traces, failed):
+    pipeline = ImportPipeline(col, {"memory_budget_mb": args.budget_mb},
+                              downloadAudio=not args.no_audio, skipErrors=True,
+                              fetchWorkers=args.concurrency, mediaWorkers=args.media_workers,
+                              processes=args.processes)
+    for setId in jobs:
+        trace = ImportTrace(setId, profile=args.profile)
+        traces.append(trace)
+        pipeline.add(ImportJob(setId, quizlet.deckUrl(setId), trace=trace))
+
+    notes = 0
+    for job in pipeline.run():
+        notes += job.count
+        if job.error:
+            print("{0}: error {1} captcha={2}".format(
+                job.quizletDeckID, job.errorCode, job.errorCaptcha))
+        print(job.trace.summary())
+
+        if args.trace_dir:
+            job.trace.dump(args.trace_dir)
+
+    print("peak memory budget use {0:.1f} MB of {1} MB".format(
+        pipeline.budget.peak / 1048576.0, args.budget_mb))
+    return notes
+
+
+def run(args):
+    if args.server:
+        base = args.server.rstrip("/")
+        server = None
+    else:
+        server = serve(mockFromArguments(args))
+        base = "http://127.0.0.1:{0}".format(server.server_port)
+
+    quizlet.quizlet_url = base
+    quizlet.proxy_url = base
+
+    sets = args.sets.split(",") if args.sets else \
+        json.loads(urllib.request.urlopen(base + "/__sets").read())
+    jobs = [sets[i % len(sets)] for i in range(args.imports or len(sets))]
+
+    folder = tempfile.mkdtemp(prefix="quizlet-loadtest-")
+    col = Collection(os.path.join(folder, "collection.anki2"))
+    failed = []
+    traces = []
+    started = time.perf_counter()
+
+    try:
+        notes = (runPipeline if args.pipeline else runSerial)(args, col, jobs, traces, failed)
+
+        elapsed = time.perf_counter() - started
+        requests = [r for trace in traces for r in trace.requests]
+        size = sum(r["bytes"] or 0 for r in requests)
+        routes = {}
+        for r in requests:
+            routes[r["route"]] = routes.get(r["route"], 0) + 1
+
+        print("")
+        print("{0} imports, {1} notes in {2:.2f}s, {3:.1f} notes/s".format(
+            len(jobs), notes, elapsed, notes / elapsed if elapsed else 0))
+        print("{0} requests, {1:.1f} MB, {2:.2f} MB/s, by route {3}".format(
+            len(requests), size / 1048576.0, size / 1048576.0 / elapsed if elapsed else 0, routes))
+        print("{0} media files failed".format(
+            len(failed) or sum(1 for r in requests if r["route"] == "proxy" and r["status"] != 200)))
+        print("server: {0}".format(urllib.request.urlopen(base + "/__stats").read().decode()))
+    finally:
+        col.close()
+        if server:
+            server.shutdown()
+        if args.keep:
+            print("collection kept in {0}".format(folder))
+        else:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", help="use an already running __mockserver__.py")
+    parser.add_argument("--sets", help="comma separated set ids, all example decks by default")
+    parser.add_argument("--imports", type=int, default=0, help="number of imports, cycles through the sets")
+    parser.add_argument("--concurrency", type=int, default=1, help="parallel fetches")
+    parser.add_argument("--pipeline", action="store_true", help="use the staged import pipeline")
+    parser.add_argument("--media-workers", type=int, default=4, help="parallel media downloads with --pipeline")
+    parser.add_argument("--processes", type=int, default=0, help="parse processes with --pipeline")
+    parser.add_argument("--budget-mb", type=int, default=256, help="memory budget with --pipeline")
+    parser.add_argument("--no-audio", action="store_true")
+    parser.add_argument("--trace-dir", help="save a json trace per import here")
+    parser.add_argument("--profile", action="store_true", help="save cProfile dumps with the traces")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary collection")
+    addArguments(parser)
+    run(parser.parse_args())
@@ -0,0 +1,254 @@
+# -------------------------------------------------------------------------------
+#
+# Headless batch import, no Anki window needed (pip install anki requests)
+#
+#   python <addon folder> urls.txt --collection learner.anki2
+#   python <addon folder> urls.txt --apkg out/
+#
+# urls.txt has one Quizlet set, folder, class or user sets URL or saved page
+# (.html) per line, blank lines and lines starting with # are skipped. Decks go
+# through the same pipeline, mapping and note type as the add-on.
+#
+# -------------------------------------------------------------------------------
+
+import os
+import re
+import sys
+import argparse
+import tempfile
+import shutil
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import quizlet
+from timing import ImportTrace
+from pipeline import ImportPipeline, ImportJob
+from cache import DeckCache
+from sync import subscribe
+from httparchive import HttpRecorder, HttpReplay
+from planner import ImportPlan
+
+
+def mediaBudget(value):
+    # kind=number, e.g. image=30
+    kind, _, number = value.partition("=")
+    if kind not in quizlet.media_kinds:
+        raise argparse.ArgumentTypeError("media kind is one of " + ", ".join(quizlet.media_kinds))
+    return kind, float(number)
+
+
+def readSources(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+
+
+def listingIds(url, kind, config, workers):
+    # returns the subdeck name and the set ids of a folder, class or user sets page
+    parts = urllib.parse.urlparse(url if "://" in url else "https://" + url)
+    listing = quizlet.SetListing(quizlet.quizlet_url + parts.path + ("?" + parts.query if parts.query else ""),
+                                 kind, config=config, workers=workers)
+    listing.fetch()
+    if listing.error:
+        print("{0}: can't read the {1} ({2})".format(url, kind, listing.errorCode or listing.errorMessage))
+    return listing.name, listing.ids
+
+
+def makeJobs(sources, config, workers, profile=False):
+    # listings are walked in parallel, their sets join the job list in order
+    def resolve(source):
+        if os.path.isfile(source):
+            with open(source, encoding='utf-8') as f:
+                html = f.read()
+            m = re.search(r"\d+", os.path.basename(source))
+            return [(m.group(0) if m else source, source, html, '')]
+
+        try:
+            quizletDeckID = quizlet.parseDeckUrl(source)
+        except ValueError as e:
+            print("{0}: {1}".format(source, re.sub(r'<[^>]+>', '', str(e))))
+            return []
+
+        if quizletDeckID in quizlet.listing_kinds:
+            name, ids = listingIds(source, quizletDeckID, config, workers)
+            return [(id, quizlet.deckUrl(id), '', name) for id in ids]
+        return [(quizletDeckID, quizlet.deckUrl(quizletDeckID), '', '')]
+
+    jobs = []
+    seen = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for resolved in pool.map(resolve, sources):
+            for quizletDeckID, url, html, parent in resolved:
+                if quizletDeckID in seen:
+                    continue
+                seen.add(quizletDeckID)
+                jobs.append(ImportJob(quizletDeckID, url, html,
+                                      ImportTrace(str(quizletDeckID), profile=profile), parent=parent))
+    return jobs
+
+
+def exportDecks(col, jobs, folder):
+    from anki.collection import ExportAnkiPackageOptions, DeckIdLimit
+
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    for job in jobs:
+        if job.error or not job.deckId:
+            continue
+        # sets of a folder often share a title, the set id keeps their packages apart
+        name = re.sub(r'[\\/:*?"<>|]+', '_', job.title or "").strip()
+        path = os.path.join(folder, "{0} {1}".format(name, job.quizletDeckID).strip() + ".apkg")
+        col.export_anki_package(
+            out_path=path,
+            options=ExportAnkiPackageOptions(with_scheduling=False, with_deck_configs=False,
+                                             with_media=True, legacy=True),
+            limit=DeckIdLimit(deck_id=job.deckId))
+        print("{0}: {1}".format(job.quizletDeckID, path))
+
+
+def plan(args, config, jobs):
+    # --plan: what the import would fetch and how long it takes, nothing is imported
+    cache = DeckCache(args.cache) if args.cache else None
+    try:
+        importPlan = ImportPlan([(job.quizletDeckID, job.url, job.html) for job in jobs],
+                                dict(config, fetch_workers=args.workers, media_workers=args.media_workers),
+                                cache, downloadAudio=not args.no_audio)
+        print(importPlan.run().report())
+    finally:
+        if cache:
+            cache.close()
+    return 0 if not any(deck["error"] for deck in importPlan.decks) else 1
+
+
+def run(args):
+    config = {
+        "qlts": args.qlts or "",
+        "cookies": args.cookies or "",
+        "memory_budget_mb": args.budget_mb,
+        "requests_per_second": args.requests_per_second,
+        "media_deadline_seconds": dict(args.media_deadline),
+        "media_limit_mb": dict(args.media_limit_mb),
+        "preferred_route": args.route,
+        "page_timeout_seconds": args.page_timeout,
+        "media_timeout_seconds": args.media_timeout,
+        "duplicate_policy": args.duplicates
+    }
+    if args.license:
+        config["license"] = args.license
+
+    jobs = makeJobs(list(readSources(args.sources)), config, args.workers)
+    if not jobs:
+        print("Nothing to import")
+        return 1
+    if args.plan:
+        return plan(args, config, jobs)
+
+    from anki.collection import Collection
+
+    # .apkg files are built in a throwaway collection
+    folder = tempfile.mkdtemp(prefix="quizlet-import-") if args.apkg else None
+    col = Collection(args.collection or os.path.join(folder, "collection.anki2"))
+
+    cache = DeckCache(args.cache) if args.cache else None
+
+    try:
+        pipeline = ImportPipeline(col, config,
+                                  downloadAudio=not args.no_audio, addReverse=args.reverse,
+                                  skipErrors=args.skip_errors, fetchWorkers=args.workers,
+                                  mediaWorkers=args.media_workers, chunkSize=args.chunk_size, cache=cache,
+                                  processes=args.processes)
+        for job in jobs:
+            pipeline.add(job)
+
+        def progress(job):
+            if job.done:
+                print("{0}: {1}".format(job.quizletDeckID, "error {0}".format(
+                    job.errorCode or job.errorMessage) if job.error else "{0} notes in {1}{2}".format(
+                    job.count, job.title, ", {0} media files left out".format(len(job.deferred)) if job.deferred else "")
+                    + (", {0} duplicates".format(job.duplicates) if job.duplicates else "")
+                    + (", {0} media files failed".format(len(job.failed)) if job.failed else "")
+                    + (", first notes after {0:.1f}s".format(job.firstChunk) if job.firstChunk is not None else "")))
+
+        pipeline.run(progress=progress)
+
+        if args.apkg:
+            exportDecks(col, jobs, args.apkg)
+        else:
+            for job in jobs:
+                if not job.error and job.notes:
+                    subscribe(col, job, args.reverse, not args.no_audio)
+    finally:
+        col.close()
+        if cache:
+            cache.close()
+        if folder:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    failed = [job for job in jobs if job.error]
+    print("Imported {0} of {1} decks, {2} notes".format(
+        len(jobs) - len(failed), len(jobs), sum(job.count for job in jobs)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="quizlet-import")
+    parser.add_argument("sources", help="file with one set/folder/class/user sets URL or saved page per line")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--collection", help="import into this .anki2 collection (created if missing)")
+    target.add_argument("--apkg", help="write one .apkg per deck into this folder")
+    target.add_argument("--plan", action="store_true",
+                        help="only print the cards, media files, bytes and estimated time of the import")
+    parser.add_argument("--workers", type=int, default=4, help="parallel page fetches")
+    parser.add_argument("--requests-per-second", type=float, default=5,
+                        help="limit on quizlet page requests over all workers, 0 for none")
+    parser.add_argument("--processes", type=int, default=max(0, min(4, (os.cpu_count() or 1) - 1)),
+                        help="processes decoding and mapping pages, 0 keeps it in this process")
+    parser.add_argument("--media-workers", type=int, default=8, help="parallel media downloads")
+    parser.add_argument("--route", choices=("page", "proxy"), default="page",
+                        help="where set pages are fetched first, the other route is the fallback")
+    parser.add_argument("--page-timeout", type=float, default=60, help="seconds to wait for a page or webapi answer")
+    parser.add_argument("--media-timeout", type=float, default=60, help="seconds to wait for a media download")
+    parser.add_argument("--chunk-size", type=int, default=20,
+                        help="notes written (and undone) together, each chunk with its media complete")
+    parser.add_argument("--budget-mb", type=int, default=256, help="memory budget for pages and items")
+    parser.add_argument("--media-deadline", type=mediaBudget, action="append", default=[], metavar="KIND=SECONDS",
+                        help="stop downloading termAudio, definitionAudio or image files this long after the start")
+    parser.add_argument("--media-limit-mb", type=mediaBudget, action="append", default=[], metavar="KIND=MB",
+                        help="stop downloading files of a kind after this much")
+    parser.add_argument("--duplicates", choices=("off", "skip", "tag", "link"), default="off",
+                        help="cards another set of the import already had: skip, tag or link them (see duplicates.py)")
+    parser.add_argument("--no-audio", action="store_true")
+    parser.add_argument("--reverse", action="store_true", help="add reverse cards")
+    parser.add_argument("--skip-errors", action="store_true", help="don't retry failed audio/images, leave them to the next sync")
+    parser.add_argument("--cache", help="deck cache file, unchanged sets are taken from there")
+    parser.add_argument("--qlts", help="qlts cookie, same as the add-on config")
+    parser.add_argument("--cookies", help="cookie header, same as the add-on config")
+    parser.add_argument("--license", help="proxy api key")
+    parser.add_argument("--record", metavar="ZIP", help="save every request and response of the import into this file")
+    parser.add_argument("--replay", metavar="ZIP", help="answer the requests from a --record file, without the network")
+    parser.add_argument("--replay-latency", type=float, default=1.0, metavar="SCALE",
+                        help="times the recorded response times to wait when replaying, 0 for none")
+    parser.add_argument("--quizlet-url", help=argparse.SUPPRESS)
+    parser.add_argument("--proxy-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # used to point the importer at __mockserver__.py
+    if args.quizlet_url:
+        quizlet.quizlet_url = args.quizlet_url.rstrip("/")
+    if args.proxy_url:
+        quizlet.proxy_url = args.proxy_url.rstrip("/")
+
+    if args.record:
+        quizlet.archive = HttpRecorder()
+    elif args.replay:
+        quizlet.archive = HttpReplay(args.replay, args.replay_latency)
+
+    code = run(args)
+    if args.record:
+        print("{0} requests recorded into {1}".format(quizlet.archive.save(args.record), args.record))
+    sys.exit(code)
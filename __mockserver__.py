@@ -0,0 +1,326 @@
+# -------------------------------------------------------------------------------
+#
+# Local stand-in for quizlet.com, the media CDN and quizlet-proxy.proto.click
+#
+# Serves the decks from examples/ as set pages, webapi/3.9 json, tts audio
+# and images, with configurable latency, error rates, captcha responses and
+# a bandwidth cap. Used by __loadtest__.py, can also be run on its own and
+# the add-on pointed at it by changing quizlet.quizlet_url / proxy_url.
+#
+#   python __mockserver__.py --port 8765 --latency 0.1 --captcha-rate 1
+#
+# -------------------------------------------------------------------------------
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import quizlet
+
+examples = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples")
+
+# image hosts used by the example decks, rewritten to /media/<host>/ on this server
+media_hosts = re.compile(r'https:\\?/\\?/((?:o\.quizlet|farm\d+\.staticflickr)\.com)\\?/')
+
+# sets per page of a user or class listing
+listing_page_size = 2
+
+page_template = """<html><head><title>Flashcards {title} | Quizlet</title></head><body><script>
+window.Quizlet["assistantModeData"] = {data}; QLoad("Quizlet.assistantModeData");
+</script></body></html>"""
+
+
+class MockQuizlet(object):
+
+    def __init__(self, latency=0.0, jitter=0.0, errorRate=0.0, mediaErrorRate=0.0,
+                 captchaRate=0.0, bandwidth=0, repeat=1, audioSize=16384, imageSize=65536, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.errorRate = errorRate
+        self.mediaErrorRate = mediaErrorRate
+        self.captchaRate = captchaRate
+        self.bandwidth = bandwidth
+        self.audioSize = audioSize
+        self.imageSize = imageSize
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.sets = {}
+        self.loadExamples(repeat)
+
+    def loadExamples(self, repeat):
+        for name in sorted(os.listdir(examples)):
+            path = os.path.join(examples, name)
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+
+            if name.endswith('.html'):
+                try:
+                    items, diagrams = quizlet.extractItems(text)
+                except Exception:
+                    continue
+                title = quizlet.extractTitle(text, name)
+                page = text
+            elif name.startswith('webapi'):
+                # webapi dumps carry no page, build one around the items
+                items = json.loads(text)["responses"][0]["models"]["studiableItem"]
+                diagrams = None
+                title = os.path.splitext(name)[0]
+                page = None
+            else:
+                # the other json files use the old, no longer supported layout
+                continue
+
+            setId = str(items[0]["studiableContainerId"])
+            if setId in self.sets:
+                continue
+
+            if repeat > 1:
+                # grow the deck, fresh item ids keep the media file names apart
+                items = [dict(item, id=item["id"] * 1000 + i)
+                         for i in range(repeat) for item in items]
+                page = None
+
+            if page is None:
+                page = page_template.format(title=title, data=json.dumps({
+                    "studiableDocumentData": {
+                        "studiableItems": items,
+                        "setIdToDiagramImage": diagrams
+                    }
+                }))
+
+            self.sets[setId] = {"title": title, "items": items, "page": page}
+
+    def count(self, route, status):
+        with self.lock:
+            key = "{0} {1}".format(route, status)
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def roll(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def delay(self):
+        with self.lock:
+            jitter = self.random.uniform(0, self.jitter) if self.jitter else 0
+        if self.latency or jitter:
+            time.sleep(self.latency + jitter)
+
+
+def setModified(data):
+    # the set's own lastModified is a field of the set, not of its items: quizlet bumps it for
+    # title and order changes too, so it's later than any item's
+    return data.get("modified") or max([item.get("lastModified", 0) for item in data["items"]] or [0]) + 3600
+
+
+def mediaBytes(path, size):
+    # deterministic content so the same url always gives the same file
+    seed = hashlib.sha1(path.encode('utf-8')).digest()
+    return (seed * (size // len(seed) + 1))[:size]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def base(self):
+        return "http://{0}".format(self.headers.get("Host", "127.0.0.1"))
+
+    def rewrite(self, text):
+        return media_hosts.sub(self.base() + r"/media/\1/", text)
+
+    def send(self, route, status, body, contentType="text/html; charset=utf-8", extra=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        self.mock.count(route, status)
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (extra or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+
+        if not self.mock.bandwidth:
+            self.wfile.write(body)
+            return
+
+        # per connection bandwidth cap
+        chunk = 16384
+        for i in range(0, len(body), chunk):
+            part = body[i:i + chunk]
+            self.wfile.write(part)
+            time.sleep(len(part) / float(self.mock.bandwidth))
+
+    def do_GET(self):
+        self.mock.delay()
+
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+
+        if url.path == "/__stats":
+            return self.send("stats", 200, json.dumps(self.mock.stats), "application/json")
+        if url.path == "/__sets":
+            return self.send("stats", 200, json.dumps(list(self.mock.sets)), "application/json")
+
+        # quizlet-proxy.proto.click
+        if url.path in ("/quizlet-deck", "/quizlet-folders"):
+            inner = urllib.parse.urlparse(query.get("url", [""])[0])
+            return self.page("proxy", inner.path, urllib.parse.parse_qs(inner.query))
+        if url.path == "/quizlet-media":
+            inner = urllib.parse.urlparse(query.get("url", [""])[0])
+            return self.media("proxy-media", inner.netloc + inner.path)
+
+        if url.path == "/latest":
+            # what the diagnostics check a qlts cookie with
+            if "qlts=" in self.headers.get("Cookie", ""):
+                return self.send("page", 200, "<html><title>Latest | Quizlet</title></html>")
+            return self.send("page", 302, "", extra={"Location": self.base() + "/login"})
+        if url.path.startswith("/webapi/3.9/"):
+            return self.webapi(url.path, query)
+        if url.path.lstrip("/").startswith("tts/"):
+            return self.media("tts", url.path + "?" + url.query, self.mock.audioSize, "audio/mpeg")
+        if url.path.startswith("/media/"):
+            return self.media("media", url.path[len("/media/"):])
+
+        return self.page("page", url.path, query)
+
+    # same headers as a GET, send() leaves the body out
+    do_HEAD = do_GET
+
+    def page(self, route, path, query=None):
+        if route == "page" and self.mock.roll(self.mock.captchaRate):
+            return self.send(route, 403, "<html>Just a moment...</html>",
+                             extra={"CF-Chl-Bypass": "1"})
+        if self.mock.roll(self.mock.errorRate):
+            return self.send(route, 500, "Internal Server Error")
+
+        if "/folders" in path:
+            body = "".join('"studyMaterialId":"{0}",'.format(setId) for setId in self.mock.sets)
+            return self.send(route, 200, "<html><script>{" + body + "}</script></html>")
+
+        # search results: the sets with a query word in their title, as links, a few per page
+        if path == "/search":
+            words = (query or {}).get("query", [""])[0].lower().split()
+            page = int((query or {}).get("page", ["1"])[0])
+            found = [setId for setId, data in self.mock.sets.items()
+                     if any(word in data["title"].lower() for word in words)]
+            links = "".join('<a href="https://quizlet.com/{0}/set-{0}-flash-cards/">{1}</a>'.format(
+                setId, self.mock.sets[setId]["title"])
+                for setId in found[(page - 1) * listing_page_size:page * listing_page_size])
+            return self.send(route, 200, "<html><title>Search | Quizlet</title><body>{0}</body></html>".format(links))
+
+        # user sets and class pages list the sets as links, a few per page
+        if re.match(r"/(user/[^/]+/sets|class/\d+)", path):
+            page = int((query or {}).get("page", ["1"])[0])
+            sets = list(self.mock.sets)[(page - 1) * listing_page_size:page * listing_page_size]
+            links = "".join('<a href="https://quizlet.com/{0}/set-{0}-flash-cards/">{1}</a>'.format(
+                setId, self.mock.sets[setId]["title"]) for setId in sets)
+            return self.send(route, 200, "<html><title>Listing {0} | Quizlet</title><body>{1}</body></html>".format(
+                path.strip("/").split("/")[1], links))
+
+        m = re.search(r"\d+", path)
+        data = self.mock.sets.get(m.group(0)) if m else None
+        if not data:
+            return self.send(route, 404, "Not Found")
+
+        return self.send(route, 200, self.rewrite(data["page"]))
+
+    def webapi(self, path, query):
+        if self.mock.roll(self.mock.errorRate):
+            return self.send("webapi", 500, "Internal Server Error")
+
+        m = re.match(r"/webapi/3.9/sets/(\d+)", path)
+        if m:
+            data = self.mock.sets.get(m.group(1))
+            if not data:
+                return self.send("webapi", 404, "Not Found")
+            return self.send("webapi", 200, json.dumps({"responses": [{"models": {"set": [
+                {"id": int(m.group(1)), "title": data["title"], "numTerms": len(data["items"]),
+                 "lastModified": setModified(data)}]}}]}),
+                "application/json")
+
+        if path == "/webapi/3.9/studiable-item-documents":
+            setId = query.get("filters[studiableContainerId]", [""])[0]
+            data = self.mock.sets.get(setId)
+            if not data:
+                return self.send("webapi", 404, "Not Found")
+            perPage = int(query.get("perPage", ["500"])[0])
+            page = int(query.get("page", ["1"])[0])
+            items = data["items"][(page - 1) * perPage:page * perPage]
+            body = json.dumps({"responses": [{
+                "models": {"studiableItem": items},
+                "paging": {"total": len(data["items"]), "page": page, "perPage": perPage}
+            }]})
+            return self.send("webapi", 200, self.rewrite(body), "application/json")
+
+        return self.send("webapi", 404, "Not Found")
+
+    def media(self, route, path, size=None, contentType="image/png"):
+        if self.mock.roll(self.mock.mediaErrorRate):
+            return self.send(route, 503, "Service Unavailable")
+        return self.send(route, 200, mediaBytes(path, size or self.mock.imageSize), contentType)
+
+
+def serve(mock, host="127.0.0.1", port=0):
+    # starts the server in a daemon thread, port 0 picks a free one
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.mock = mock
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def addArguments(parser):
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of page/webapi requests failing with 500")
+    parser.add_argument("--media-error-rate", type=float, default=0.0, help="share of media requests failing with 503")
+    parser.add_argument("--captcha-rate", type=float, default=0.0, help="share of direct page requests answered with a 403 captcha")
+    parser.add_argument("--bandwidth", type=int, default=0, help="bytes per second per connection, 0 is unlimited")
+    parser.add_argument("--repeat", type=int, default=1, help="multiply the items of every example deck")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def mockFromArguments(args):
+    return MockQuizlet(latency=args.latency, jitter=args.jitter, errorRate=args.error_rate,
+                       mediaErrorRate=args.media_error_rate, captchaRate=args.captcha_rate,
+                       bandwidth=args.bandwidth, repeat=args.repeat, seed=args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    addArguments(parser)
+    args = parser.parse_args()
+
+    mock = mockFromArguments(args)
+    server = serve(mock, args.host, args.port)
+    print("Serving {0} on http://{1}:{2}".format(
+        ", ".join("{0} ({1} items)".format(k, len(v["items"])) for k, v in mock.sets.items()),
+        args.host, server.server_port))
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
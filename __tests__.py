@@ -0,0 +1,591 @@
+# -------------------------------------------------------------------------------
+#
+# Focused tests of the parts an import relies on, against the local stand-in
+# server (__mockserver__.py) and temporary collections like __loadtest__.py:
+# the subscription diff, the duplicate policies, listing URLs, the deck cache
+# and the worker's json lines (pip install anki requests).
+#
+#   python __tests__.py
+#   python __tests__.py -v DuplicateTests
+#
+# -------------------------------------------------------------------------------
+
+import io
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import time
+import warnings
+import threading
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import quizlet
+import jsonlib
+from cache import DeckCache
+from duplicates import DuplicateIndex, itemKey, duplicate_tag, link_tag
+from pipeline import ImportPipeline, ImportJob
+from sync import SubscriptionSync, SetChanges, itemHash, config_key
+from pipeline import missingFile
+from prefetch import Prefetch
+from diagnostics import Diagnostics
+from worker import WorkerPipeline, serve as serveWorker, state_fields
+from __mockserver__ import MockQuizlet, serve, page_template
+
+from anki.collection import Collection
+
+# a set with 47 cards, and one of 20 cards that the first already has
+set_id = "690496704"
+copy_id = "999"
+# a diagram set, its cards are label areas on one image
+diagram_id = "363366586"
+
+mock = None
+server = None
+
+
+def setUpModule():
+    global mock, server
+    mock = MockQuizlet()
+    items = [dict(item, id=item["id"] + 7) for item in mock.sets[set_id]["items"][:20]]
+    mock.sets[copy_id] = {"title": "Copy", "items": items, "page": page_template.format(title="Copy", data=json.dumps(
+        {"studiableDocumentData": {"studiableItems": items, "setIdToDiagramImage": None}}))}
+    server = serve(mock)
+    quizlet.quizlet_url = quizlet.proxy_url = "http://127.0.0.1:{0}".format(server.server_port)
+    quizlet.archive = None
+
+
+def tearDownModule():
+    server.shutdown()
+
+
+def fetchItems(quizletDeckID):
+    # the mapped items and lastModified of a set, as an import keeps them
+    fetcher = quizlet.QuizletFetcher(quizlet.deckUrl(quizletDeckID), quizletDeckID, '')
+    fetcher.fetch()
+    return fetcher.results["items"], fetcher.fetchModified()
+
+
+class SubscriptionDiffTests(unittest.TestCase):
+
+    def setUp(self):
+        self.items, self.modified = fetchItems(set_id)
+        # the first item changed since the import, the second is new, "1" was deleted
+        known = dict((str(item["id"]), ["guid{0}".format(item["id"]), itemHash(item)]) for item in self.items[2:])
+        known[str(self.items[0]["id"])] = ["guid0", "outdated"]
+        known["1"] = ["guid1", "deleted"]
+        self.sub = {"modified": self.modified - 1, "items": known, "missing": []}
+
+    def check(self, sub):
+        sync = SubscriptionSync({set_id: sub})
+        try:
+            return sync.check()[0]
+        finally:
+            sync.cleanup()
+
+    def testChangedSet(self):
+        changes = self.check(self.sub)
+        self.assertIsNone(changes.error)
+        self.assertEqual(changes.modified, self.modified)
+        self.assertEqual([item["id"] for item, files, guid in changes.updated], [self.items[0]["id"]])
+        self.assertEqual([guid for item, files, guid in changes.updated], ["guid0"])
+        self.assertEqual([item["id"] for item, files in changes.added], [self.items[1]["id"]])
+        self.assertEqual(changes.deleted, ["1"])
+
+    def testUnchangedSetIsNotFetched(self):
+        pages = mock.stats.get("page 200", 0)
+        changes = self.check(dict(self.sub, modified=self.modified))
+        self.assertFalse(changes.changed())
+        self.assertEqual(mock.stats.get("page 200", 0), pages)
+
+    def testPickedSetGetsNoNewItems(self):
+        changes = self.check(dict(self.sub, picked=True))
+        self.assertEqual(changes.added, [])
+        self.assertEqual(len(changes.updated), 1)
+
+    def testFailedDownloadsAreKept(self):
+        mock.mediaErrorRate = 1.0
+        try:
+            changes = self.check(self.sub)
+        finally:
+            mock.mediaErrorRate = 0.0
+        changed = set([self.items[0]["id"], self.items[1]["id"]])
+        self.assertTrue(changes.failed)
+        self.assertEqual(set(failure["item"] for failure in changes.failed), changed)
+        self.assertTrue(all(not name for item, files, guid in changes.updated for name in files.values()))
+
+    def testAudioQueryStringsDontCount(self):
+        item = dict(self.items[0], termAudio="/tts/en.mp3?v=1")
+        self.assertEqual(itemHash(item), itemHash(dict(item, termAudio="/tts/en.mp3?v=2")))
+        self.assertNotEqual(itemHash(item), itemHash(dict(item, definition="changed")))
+
+
+class SubscriptionApplyTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="quizlet-tests-")
+        self.col = Collection(os.path.join(self.folder, "collection.anki2"))
+        quizlet.addCustomModel(self.col)
+
+    def tearDown(self):
+        self.col.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def testFailedDownloadKeepsTheOldFile(self):
+        item = {"id": 5, "term": "Term", "definition": "Definition", "termAudio": None,
+                "definitionAudio": None, "imageUrl": "http://example.com/5.jpg"}
+        deckId = self.col.decks.id("Set")
+        note = quizlet.addItemNote(self.col, item, {"Image": '<div><img src="5.jpg"></div>'}, deckId=deckId)
+        self.col.set_config(config_key, {set_id: {"deck": "Set", "deckId": deckId, "modified": 1,
+                                                  "items": {"5": [note.guid, "old"]}, "missing": []}})
+
+        # the term changed, the image couldn't be downloaded this time
+        changed = dict(item, term="New term")
+        changes = SetChanges(set_id)
+        changes.modified = 2
+        changes.updated = [(changed, {"image": None}, note.guid)]
+        changes.failed = [missingFile(changed, "image", item["imageUrl"], "5.jpg", True, "timed out")]
+        sync = SubscriptionSync({})
+        self.assertEqual(sync.apply(self.col, [changes]), (0, 1, 0))
+
+        note = self.col.get_note(note.id)
+        self.assertEqual(note["FrontText"], "New term")
+        self.assertEqual(note["Image"], '<div><img src="5.jpg"></div>')
+        missing = self.col.get_config(config_key)[set_id]["missing"]
+        self.assertEqual([(m["item"], m["kind"], m["url"]) for m in missing], [(5, "image", item["imageUrl"])])
+        self.assertNotIn("error", missing[0])
+
+
+class DuplicateTests(unittest.TestCase):
+
+    def card(self, id, term="Term", definition="Definition"):
+        return {"id": id, "term": term, "definition": definition, "imageUrl": None}
+
+    def testOffImportsEverything(self):
+        index = DuplicateIndex("off")
+        self.assertFalse(index.add("a", self.card(1)))
+        self.assertFalse(index.add("b", self.card(2)))
+        self.assertIsNone(index.claim("b", self.card(2)))
+
+    def testUnknownPolicyIsOff(self):
+        self.assertEqual(DuplicateIndex("merge").policy, "off")
+
+    def testKeyIgnoresMarkupAndCase(self):
+        self.assertEqual(itemKey(self.card(1, "<b>Term</b>", "definition ")), itemKey(self.card(2)))
+        self.assertNotEqual(itemKey(self.card(1)), itemKey(self.card(2, definition="Other")))
+
+    def testDuplicateOfAWrittenNote(self):
+        index = DuplicateIndex("skip")
+        first, second = self.card(1), self.card(2)
+        self.assertFalse(index.add("a", first))
+        self.assertTrue(index.add("b", second))
+        # likely duplicates share the first card's downloads until its note is written
+        self.assertIs(index.mediaItem("b", second), first)
+        self.assertIsNone(index.claim("a", first))
+        index.written("a", first, 11)
+        self.assertIsNone(index.mediaItem("b", second))
+        self.assertEqual(index.claim("b", second)["note"], 11)
+
+    def testTaggedDuplicatesKeepTheFirstFiles(self):
+        index = DuplicateIndex("tag")
+        first, second = self.card(1), self.card(2)
+        index.add("a", first)
+        index.add("b", second)
+        index.claim("a", first)
+        index.written("a", first, 11)
+        self.assertIs(index.mediaItem("b", second), first)
+
+    def testUnwrittenFirstCardLeavesTheNoteToTheNextSet(self):
+        # the first set failed or was cancelled before its notes were written
+        index = DuplicateIndex("skip")
+        first, second = self.card(1), self.card(2)
+        index.add("a", first)
+        index.add("b", second)
+        self.assertIsNone(index.claim("b", second))
+        index.written("b", second, 22)
+        # should the first set still write, its card is the duplicate now
+        self.assertEqual(index.claim("a", first)["note"], 22)
+
+    def testRepeatsInOneSet(self):
+        index = DuplicateIndex("skip")
+        self.assertFalse(index.add("a", self.card(1)))
+        self.assertFalse(index.add("a", self.card(2)))
+        self.assertIsNone(index.claim("a", self.card(1)))
+        index.written("a", self.card(1), 11)
+        self.assertIsNone(index.claim("a", self.card(2)))
+
+
+class DuplicateImportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="quizlet-tests-")
+        self.col = Collection(os.path.join(self.folder, "collection.anki2"))
+        quizlet.addCustomModel(self.col)
+
+    def tearDown(self):
+        self.col.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def importSets(self, policy, cancelFirst=False):
+        pipeline = ImportPipeline(self.col, {"duplicate_policy": policy}, skipErrors=True)
+        jobs = [pipeline.add(ImportJob(id, quizlet.deckUrl(id))) for id in (set_id, copy_id)]
+        if cancelFirst:
+            write = pipeline.write
+
+            def cancelling(job, index, chunk, size):
+                if job is jobs[0] and not job.error:
+                    job.error = True
+                    job.errorMessage = "Cancelled"
+                write(job, index, chunk, size)
+            pipeline.write = cancelling
+        pipeline.run()
+        return jobs
+
+    def notes(self, search=""):
+        return len(self.col.find_notes(search))
+
+    def testOff(self):
+        jobs = self.importSets("off")
+        self.assertEqual([job.count for job in jobs], [47, 20])
+        self.assertEqual(self.notes(), 67)
+
+    def testSkip(self):
+        jobs = self.importSets("skip")
+        self.assertEqual(self.notes(), 47)
+        self.assertEqual(sum(job.duplicates for job in jobs), 20)
+        self.assertEqual(sum(1 for job in jobs for item, guid in job.notes if guid is None), 20)
+        self.assertEqual(len(self.col.media.check().unused), 0)
+
+    def testTag(self):
+        jobs = self.importSets("tag")
+        self.assertEqual(sum(job.duplicates for job in jobs), 20)
+        self.assertEqual(self.notes(), 67)
+        self.assertEqual(self.notes("tag:" + duplicate_tag), 20)
+
+    def testLink(self):
+        jobs = self.importSets("link")
+        self.assertEqual(sum(job.duplicates for job in jobs), 20)
+        self.assertEqual(self.notes(), 47)
+        self.assertEqual(self.notes("tag:{0}::*".format(link_tag)), 20)
+
+    def testCancelledFirstSetLosesNoCards(self):
+        # whichever set is written first keeps the cards, a cancelled one can't take them along
+        jobs = self.importSets("skip", cancelFirst=True)
+        self.assertEqual(jobs[0].count, 0)
+        self.assertEqual(jobs[1].count, 20)
+        self.assertEqual(jobs[1].duplicates, 0)
+        self.assertEqual(self.notes(), 20)
+
+
+class MapFailureTests(unittest.TestCase):
+    # sets the mapping can't read fail alone, the import goes on
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="quizlet-tests-")
+        self.col = Collection(os.path.join(self.folder, "collection.anki2"))
+        quizlet.addCustomModel(self.col)
+
+    def tearDown(self):
+        self.col.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def importPage(self, quizletDeckID, page_html):
+        # a pasted page, so the fallback after it is the webapi right away
+        pipeline = ImportPipeline(self.col, skipErrors=True)
+        job = pipeline.add(ImportJob(quizletDeckID, quizlet.deckUrl(quizletDeckID), page_html))
+        thread = threading.Thread(target=pipeline.run, daemon=True)
+        thread.start()
+        thread.join(30)
+        if thread.is_alive():
+            pipeline.cancel()
+            self.fail("the import hangs")
+        return job
+
+    def testSetPageDataLayout(self):
+        # a layout extractItems finds but can't read, for a set the webapi doesn't know either
+        page = ('<html><script>window.Quizlet["setPageData"] = {"set": {}}; '
+                'QLoad("Quizlet.setPageData");</script></html>')
+        job = self.importPage("424242", page)
+        self.assertTrue(job.error)
+        self.assertTrue(job.done)
+
+    def testDiagramFromTheWebapi(self):
+        # the webapi has no diagram image, the cards come without it
+        job = self.importPage(diagram_id, "<html>no cards here</html>")
+        self.assertTrue(job.api)
+        self.assertFalse(job.error)
+        self.assertEqual(job.count, 14)
+        self.assertFalse(any(item.get("shape") for item, guid in job.notes))
+
+
+class MediaLimitTests(unittest.TestCase):
+    # media_limit_mb and media_deadline_seconds count for each set on its own
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="quizlet-tests-")
+        self.col = Collection(os.path.join(self.folder, "collection.anki2"))
+        quizlet.addCustomModel(self.col)
+
+    def tearDown(self):
+        self.col.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def testLimitPerSet(self):
+        # the mock's audio files are 16 KB, the first of each set goes over the limit
+        pipeline = ImportPipeline(self.col, {"media_limit_mb": {"termAudio": 0.01}}, skipErrors=True,
+                                  mediaWorkers=1)
+        jobs = [pipeline.add(ImportJob(id, quizlet.deckUrl(id))) for id in (set_id, copy_id)]
+        pipeline.run()
+        for job in jobs:
+            self.assertGreater(job.mediaBytes["termAudio"], 0)
+            self.assertTrue(any(m["kind"] == "termAudio" for m in job.deferred))
+
+    def testDeadlineOfALaterQueuedSet(self):
+        # one pipeline for the sets of an import queue, the second set comes after the first's deadline
+        pipeline = ImportPipeline(self.col, {"media_deadline_seconds": {"image": 1}}, skipErrors=True)
+        pipeline.start()
+        try:
+            for quizletDeckID in (set_id, copy_id):
+                job = pipeline.add(ImportJob(quizletDeckID, quizlet.deckUrl(quizletDeckID)))
+                while not pipeline.pump():
+                    time.sleep(0.01)
+                self.assertFalse(job.deferred)
+                time.sleep(1.1)
+        finally:
+            pipeline.stop()
+
+
+class StagingTests(unittest.TestCase):
+    # files of different urls keep apart in the staging folder, whatever their names
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="quizlet-tests-")
+        self.col = Collection(os.path.join(self.folder, "collection.anki2"))
+
+    def tearDown(self):
+        self.col.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def testSameNameDifferentContent(self):
+        pipeline = ImportPipeline(self.col)
+        job = ImportJob(set_id, quizlet.deckUrl(set_id))
+        urls = [quizlet.quizlet_url + "/media/" + folder + "/diagram.png" for folder in ("a", "b")]
+        names = [pipeline.downloadFile(url, '', False, job.trace) for url in urls]
+        self.assertNotEqual(names[0], names[1])
+        chunk = [({"id": i}, {"image": name}) for i, name in enumerate(names)]
+        pipeline.registerMedia(job, chunk)
+        media = [pipeline.registered[name] for name in names]
+        self.assertEqual(media[0], "quizlet-diagram.png")
+        self.assertNotEqual(media[0], media[1])
+        pipeline.stop()
+
+
+class PrefetchTests(unittest.TestCase):
+    # the temporary folder goes away however discard() and the end of run() interleave
+
+    def prefetch(self):
+        prefetch = Prefetch(set_id)
+        prefetch.fetchItems = lambda: None
+        return prefetch
+
+    def testDiscardWhileRunning(self):
+        prefetch = self.prefetch()
+        prefetch.thread = SimpleNamespace(is_alive=lambda: True)
+        prefetch.discard()
+        self.assertTrue(os.path.isdir(prefetch.folder))
+        prefetch.run()
+        self.assertFalse(os.path.exists(prefetch.folder))
+
+    def testDiscardAfterRun(self):
+        prefetch = self.prefetch()
+        prefetch.thread = SimpleNamespace(is_alive=lambda: True)
+        prefetch.run()
+        self.assertTrue(os.path.isdir(prefetch.folder))
+        prefetch.discard()
+        self.assertFalse(os.path.exists(prefetch.folder))
+
+
+class SessionTests(unittest.TestCase):
+
+    def testWarningFiltersAreLeftAlone(self):
+        # the session's insecure request warning is off for its own requests, not for other add-ons
+        filters = list(warnings.filters)
+        quizlet.httpGet(quizlet.deckUrl(set_id), timeout=10)
+        self.assertEqual(filters, list(warnings.filters))
+
+
+class DiagnosticsTests(unittest.TestCase):
+    # requests_per_second is only recommended down where quizlet pushed back
+
+    def tearDown(self):
+        mock.captchaRate = 0.0
+
+    def recommend(self, config):
+        return Diagnostics(config, set_id, repeat=1, timeout=10).run()["requests_per_second"]
+
+    def testOffStaysOff(self):
+        self.assertEqual(self.recommend({"requests_per_second": 0}), 0)
+
+    def testCaptchaLimits(self):
+        mock.captchaRate = 1.0
+        self.assertEqual(self.recommend({"requests_per_second": 0}), 2)
+        self.assertEqual(self.recommend({"requests_per_second": 1}), 1)
+
+
+class ListingUrlTests(unittest.TestCase):
+
+    def testSet(self):
+        self.assertEqual(quizlet.parseDeckUrl("https://quizlet.com/690496704/infections-flash-cards/"), "690496704")
+        self.assertEqual(quizlet.parseDeckUrl("quizlet.com/gb/690496704/infections-flash-cards/"), "690496704")
+
+    def testFolder(self):
+        self.assertEqual(quizlet.parseDeckUrl("https://quizlet.com/user/jane/folders/anatomy/sets"), "folder")
+        self.assertEqual(quizlet.parseDeckUrl("quizlet.com/user/jane/folders/anatomy"), "folder")
+        with self.assertRaises(ValueError):
+            quizlet.parseDeckUrl("https://quizlet.com/user/jane/folders")
+
+    def testClass(self):
+        self.assertEqual(quizlet.parseDeckUrl("https://quizlet.com/class/12345/"), "class")
+        self.assertEqual(quizlet.parseDeckUrl("https://quizlet.com/class/12345/biology-101/"), "class")
+
+    def testUserSets(self):
+        self.assertEqual(quizlet.parseDeckUrl("https://quizlet.com/user/jane/sets"), "user")
+        self.assertEqual(quizlet.parseDeckUrl("https://quizlet.com/user/jane/sets/"), "user")
+
+    def testInvalid(self):
+        for url in ("", "https://example.com/690496704/", "https://quizlet.com/", "https://quizlet.com/latest"):
+            with self.assertRaises(ValueError):
+                quizlet.parseDeckUrl(url)
+
+
+class CacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="quizlet-tests-")
+        self.path = os.path.join(self.folder, "cache.sqlite")
+        self.cache = DeckCache(self.path)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def testDeckRoundTrip(self):
+        items = [{"id": 1, "term": "Wärme", "definition": "heat – \U0001F525", "imageUrl": None, "shape": None}]
+        self.cache.put(42, "Física", "hash", 1700000000, items)
+        self.assertIsNone(self.cache.get(43))
+        self.assertEqual(self.cache.get("42"), {"title": "Física", "hash": "hash", "modified": 1700000000,
+                                                "items": items})
+        # a re-import replaces the entry
+        self.cache.put("42", "Física", "other", 1700003600, [])
+        self.assertEqual(self.cache.get(42)["modified"], 1700003600)
+        self.assertEqual(self.cache.get(42)["items"], [])
+
+    def testEntriesSurviveReopening(self):
+        self.cache.put(42, "Set", None, 1, [{"id": 1}])
+        self.cache.close()
+        self.cache = DeckCache(self.path)
+        self.assertEqual(self.cache.get(42)["items"], [{"id": 1}])
+
+    def testOlderFormatIsDropped(self):
+        self.cache.put(42, "Set", None, 1, [{"id": 1}])
+        self.cache.close()
+        db = sqlite3.connect(self.path)
+        db.execute("pragma user_version = 1")
+        db.close()
+        self.cache = DeckCache(self.path)
+        self.assertIsNone(self.cache.get(42))
+
+    def testSearchRoundTrip(self):
+        self.cache.putSearch("anatomy", 1, ["1", "2"])
+        self.assertEqual(self.cache.getSearch("anatomy", 1, 3600), ["1", "2"])
+        self.assertIsNone(self.cache.getSearch("anatomy", 2, 3600))
+        self.assertIsNone(self.cache.getSearch("anatomy", 1, -1))
+
+    def testMediaSizes(self):
+        self.cache.putMediaSizes({"http://a/1.jpg": 1024, "http://a/2.mp3": 0})
+        self.assertEqual(self.cache.getMediaSizes(["http://a/1.jpg", "http://a/2.mp3", "http://a/3.png"]),
+                         {"http://a/1.jpg": 1024, "http://a/2.mp3": 0})
+
+
+class WorkerProtocolTests(unittest.TestCase):
+
+    def setUp(self):
+        # the parent's side, its staging folder is shared with the worker
+        self.parent = WorkerPipeline(None)
+
+    def tearDown(self):
+        self.parent.process = None
+        self.parent.stop()
+
+    def runWorker(self, *jobs):
+        # what the worker answers to the settings and jobs the parent sends it
+        commands = io.BytesIO()
+        commands.write(jsonlib.dumps({"settings": self.parent.settings()}) + b"\n")
+        for number, job in enumerate(jobs):
+            self.parent.numbers[job] = number
+            self.parent.jobs.append(job)
+            self.parent.process = SimpleNamespace(stdin=commands)
+            self.parent.sendJob(job)
+        output = io.BytesIO()
+        serveWorker(io.BytesIO(commands.getvalue()), output)
+        return output.getvalue().splitlines(True)
+
+    def read(self, lines, code=0):
+        # the parent's read stage over the worker's lines, returns what it queued for the write stage
+        self.parent.process = SimpleNamespace(stdout=iter(lines), wait=lambda: code)
+        self.parent.readStage()
+        messages = []
+        while not self.parent.writeQueue.empty():
+            messages.append(self.parent.writeQueue.get_nowait())
+        return messages
+
+    def testSendJob(self):
+        commands = io.BytesIO()
+        self.parent.process = SimpleNamespace(stdin=commands)
+        job = self.parent.add(ImportJob(set_id, quizlet.deckUrl(set_id)))
+        message = jsonlib.loads(commands.getvalue())
+        self.assertEqual(message["add"], 0)
+        self.assertEqual(message["id"], set_id)
+        self.assertEqual(message["url"], quizlet.deckUrl(set_id))
+        self.assertIsNone(message["selected"])
+        self.assertIsNone(job.items)
+
+    def testWorkerLines(self):
+        lines = self.runWorker(ImportJob(set_id, quizlet.deckUrl(set_id)))
+        messages = [jsonlib.loads(line) for line in lines]
+        self.assertTrue(all(line.endswith(b"\n") for line in lines))
+        self.assertTrue(all(message["job"] == 0 for message in messages))
+        self.assertTrue(all(set(state_fields) <= set(message["state"]) for message in messages))
+        chunks = [message["chunk"] for message in messages if "chunk" in message]
+        self.assertEqual(sum(len(chunk) for chunk in chunks), 47)
+        self.assertTrue(all(len(entry) == 2 for chunk in chunks for entry in chunk))
+        self.assertIn("done", messages[-1])
+        self.assertEqual(messages[-1]["state"]["total"], 47)
+
+    def testParentReadsTheLines(self):
+        job = ImportJob(set_id, quizlet.deckUrl(set_id))
+        lines = self.runWorker(job)
+        messages = self.read(lines)
+        self.assertEqual(job.total, 47)
+        self.assertTrue(job.title)
+        self.assertFalse(job.error)
+        self.assertEqual(sum(len(chunk) for job_, index, chunk, size in messages if index == 0), 47)
+        self.assertEqual(messages[-1], (job, None, None, 0))
+        self.assertTrue(job.trace.spans)
+
+    def testWorkerStoppingEarlyFailsTheJob(self):
+        job = ImportJob(set_id, quizlet.deckUrl(set_id))
+        lines = self.runWorker(job)
+        messages = self.read([line for line in lines if b'"done"' not in line], code=3)
+        self.assertTrue(job.error)
+        self.assertIn("exit code 3", job.errorMessage)
+        self.assertEqual(messages[-1], (job, None, None, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
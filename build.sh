@@ -2,7 +2,7 @@
 
 rm -rf ./build \
 && mkdir build \
-&& cp __init__.py config.json meta.json manifest.json ./build \
+&& cp __init__.py __main__.py cache.py diagnostics.py duplicates.py gui.py httparchive.py importqueue.py jsonlib.py package.py pipeline.py planner.py prefetch.py preview.py quizlet.py search.py sync.py timing.py worker.py config.json meta.json manifest.json ./build \
 && cd build \
 && zip -r ../quizlet_importer.ankiaddon * \
 && cd ../ \
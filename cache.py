@@ -0,0 +1,99 @@
+# -------------------------------------------------------------------------------
+#
+# On-disk cache of mapped decks, keyed by Quizlet set id
+#
+# Keeps the mapped items of every imported set (zlib compressed json in
+# SQLite) with the hash of the page or webapi json they came from and the
+# set's lastModified. A re-import asks the webapi for lastModified and takes
+# the items from here when it didn't change; a page (or pasted html) with the
+# same hash skips extraction and mapping. Search result pages are kept for a
+# while too, keyed by query and page, and the sizes of media files the
+# import planner looked up.
+#
+# -------------------------------------------------------------------------------
+
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+try:
+    from . import jsonlib
+except ImportError:
+    import jsonlib
+
+# bumped whenever the mapped items change shape, older entries are dropped
+format_version = 2
+
+
+def contentHash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class DeckCache(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # used from the pipeline threads, the lock keeps it to one at a time
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        if self.db.execute("pragma user_version").fetchone()[0] != format_version:
+            self.db.execute("drop table if exists decks")
+            self.db.execute("pragma user_version = {0}".format(format_version))
+        self.db.execute("""create table if not exists decks (
+            id text primary key, title text, hash text, modified integer, items blob, updated integer)""")
+        self.db.execute("""create table if not exists searches (
+            query text, page integer, ids text, updated integer, primary key (query, page))""")
+        self.db.execute("""create table if not exists media_sizes (
+            url text primary key, bytes integer, updated integer)""")
+        self.db.commit()
+
+    def get(self, quizletDeckID):
+        with self.lock:
+            row = self.db.execute("select title, hash, modified, items from decks where id = ?",
+                                  (str(quizletDeckID),)).fetchone()
+        if not row:
+            return None
+        title, hash, modified, items = row
+        return {"title": title, "hash": hash, "modified": modified,
+                "items": jsonlib.loads(zlib.decompress(items))}
+
+    def put(self, quizletDeckID, title, hash, modified, items):
+        blob = zlib.compress(jsonlib.dumps(items))
+        with self.lock:
+            self.db.execute("insert or replace into decks values (?, ?, ?, ?, ?, strftime('%s', 'now'))",
+                            (str(quizletDeckID), title, hash, modified, blob))
+            self.db.commit()
+
+    def getSearch(self, query, page, maxAge):
+        # set ids of a search result page fetched less than maxAge seconds ago
+        with self.lock:
+            row = self.db.execute("select ids from searches where query = ? and page = ? and "
+                                  "updated > strftime('%s', 'now') - ?", (query, page, maxAge)).fetchone()
+        return jsonlib.loads(row[0]) if row else None
+
+    def putSearch(self, query, page, ids):
+        with self.lock:
+            self.db.execute("insert or replace into searches values (?, ?, ?, strftime('%s', 'now'))",
+                            (query, page, jsonlib.dumps(ids).decode('utf-8')))
+            self.db.commit()
+
+    def getMediaSizes(self, urls):
+        # url -> size in bytes of the ones known
+        sizes = {}
+        with self.lock:
+            for url in urls:
+                row = self.db.execute("select bytes from media_sizes where url = ?", (url,)).fetchone()
+                if row:
+                    sizes[url] = row[0]
+        return sizes
+
+    def putMediaSizes(self, sizes):
+        with self.lock:
+            self.db.executemany("insert or replace into media_sizes values (?, ?, strftime('%s', 'now'))",
+                                list(sizes.items()))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
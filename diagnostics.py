@@ -0,0 +1,266 @@
+# -------------------------------------------------------------------------------
+#
+# Connection diagnostics: what the routes to quizlet look like from here
+#
+# Times a few requests on each route the importer uses (set page, webapi,
+# proxy and the media CDN), notes captcha and 403 answers, checks whether the
+# qlts/cookies setting is still accepted, and downloads the same media with
+# more and more connections to see where the throughput stops growing. The
+# results become recommended settings (route to try first, workers,
+# timeouts, request rate) that the add-on writes into its config.
+#
+#   python diagnostics.py --set 150875612
+#
+# -------------------------------------------------------------------------------
+
+import sys
+import time
+import argparse
+import statistics
+import urllib.parse
+import requests
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import urllib2
+except Exception:
+    import urllib.request as urllib2
+
+try:
+    from . import quizlet
+    from .quizlet import QuizletFetcher, session, unverified, opener, headers, getCookies, deckUrl, itemMedia
+except ImportError:
+    import quizlet
+    from quizlet import QuizletFetcher, session, unverified, opener, headers, getCookies, deckUrl, itemMedia
+
+# a public set with audio and images, used when the config doesn't name one
+default_set = "150875612"
+
+# connections tried for the media CDN
+media_connections = (1, 2, 4, 8, 16)
+
+# the config keys a run recommends
+recommended_keys = ("preferred_route", "fetch_workers", "media_workers", "requests_per_second",
+                    "page_timeout_seconds", "media_timeout_seconds")
+
+
+def probe(url, timeout, **kwargs):
+    # one GET through the importer's session: time to the headers, time to the last byte, size
+    result = {"url": url, "status": None, "latency": None, "seconds": None, "bytes": 0,
+              "captcha": False, "error": None}
+    started = time.perf_counter()
+    try:
+        r = unverified(lambda: session().get(url, stream=True, timeout=timeout, **kwargs))
+        result["latency"] = time.perf_counter() - started
+        body = r.content
+        result["seconds"] = time.perf_counter() - started
+        result["status"] = r.status_code
+        result["bytes"] = len(body)
+        result["captcha"] = "CF-Chl-Bypass" in r.headers or (r.status_code == 403 and b"Just a moment" in body)
+        result["location"] = r.headers.get("Location", "")
+    except requests.RequestException as e:
+        result["error"] = str(e)
+    return result
+
+
+def probeMedia(url, timeout):
+    # media goes through urllib like the downloader does
+    result = {"url": url, "status": None, "latency": None, "seconds": None, "bytes": 0,
+              "captcha": False, "error": None}
+    started = time.perf_counter()
+    try:
+        r = opener().open(urllib2.Request(url, headers=headers), timeout=timeout)
+        result["latency"] = time.perf_counter() - started
+        result["bytes"] = len(r.read())
+        result["seconds"] = time.perf_counter() - started
+        result["status"] = r.getcode()
+    except urllib2.HTTPError as e:
+        result["status"] = e.code
+        result["captcha"] = "CF-Chl-Bypass" in e.headers
+        result["error"] = str(e)
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def summary(route, results):
+    # one line per route out of its probes
+    ok = [r for r in results if r["status"] == 200 and not r["captcha"]]
+    last = results[-1]
+    route = {"route": route, "ok": bool(ok), "status": last["status"], "error": last["error"],
+             "captcha": any(r["captcha"] for r in results), "latency": None, "bandwidth": None, "bytes": 0}
+    if ok:
+        route["latency"] = statistics.median(r["latency"] for r in ok)
+        route["bytes"] = max(r["bytes"] for r in ok)
+        # bytes/second once the first byte is in, the best of the probes
+        route["bandwidth"] = max(r["bytes"] / max(r["seconds"] - r["latency"], 0.001) for r in ok)
+    return route
+
+
+class Diagnostics(object):
+
+    def __init__(self, config=None, quizletDeckID=None, repeat=3, timeout=20):
+        self.config = config or {}
+        self.quizletDeckID = str(quizletDeckID or self.config.get("diagnostics_set") or default_set)
+        self.repeat = repeat
+        self.timeout = timeout
+
+        # route name -> summary()
+        self.routes = {}
+        # parallel connections -> bytes/second over all of them
+        self.media = {}
+        self.cookies = "not set"
+        self.recommended = {}
+
+    def measure(self, route, url, **kwargs):
+        self.routes[route] = summary(route, [probe(url, self.timeout, **kwargs) for i in range(self.repeat)])
+        return self.routes[route]
+
+    def checkRoutes(self):
+        url = deckUrl(self.quizletDeckID)
+        cookies = getCookies(self.config)
+        self.measure("page", url, cookies=cookies)
+        self.measure("webapi", '{0}/webapi/3.9/sets/{1}'.format(quizlet.quizlet_url, self.quizletDeckID))
+        self.measure("proxy", quizlet.proxy_url + '/quizlet-deck?url=' + urllib.parse.quote(url, safe='()*!\''),
+                     cookies=cookies)
+
+    def checkCookies(self):
+        # a logged in session gets the latest page, anyone else is sent to the login
+        cookies = getCookies(self.config)
+        if not cookies:
+            return
+        result = probe(quizlet.quizlet_url + "/latest", self.timeout, cookies=cookies, allow_redirects=False)
+        if result["captcha"]:
+            self.cookies = "not checked, captcha"
+        elif result["error"]:
+            self.cookies = "not checked, {0}".format(result["error"])
+        elif result["status"] == 200:
+            self.cookies = "valid"
+        elif "login" in result["location"]:
+            self.cookies = "expired or invalid"
+        else:
+            self.cookies = "unknown, status {0}".format(result["status"])
+
+    def mediaUrls(self):
+        # the sample set's audio and images, as the downloader would fetch them
+        fetcher = QuizletFetcher(deckUrl(self.quizletDeckID), self.quizletDeckID, '', config=self.config)
+        try:
+            items = fetcher.fetchSample(8)
+        except Exception:
+            return []
+        urls = []
+        for item in items:
+            for kind, url, suffix, fallback in itemMedia(item):
+                url = url.replace('_m', '')
+                if url not in urls:
+                    urls.append(url)
+        return urls
+
+    def checkMedia(self):
+        urls = self.mediaUrls()
+        if not urls:
+            self.routes["media"] = {"route": "media", "ok": False, "status": None, "captcha": False,
+                                    "error": "no media in set {0}".format(self.quizletDeckID),
+                                    "latency": None, "bandwidth": None, "bytes": 0}
+            return
+        self.routes["media"] = summary("media", [probeMedia(url, self.timeout) for url in urls[:self.repeat]])
+        if not self.routes["media"]["ok"]:
+            return
+
+        # twice as many files as connections, so every connection gets a second request
+        for connections in media_connections:
+            batch = [urls[i % len(urls)] for i in range(connections * 2)]
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=connections) as pool:
+                results = list(pool.map(lambda url: probeMedia(url, self.timeout), batch))
+            seconds = time.perf_counter() - started
+            if any(r["error"] for r in results):
+                break
+            self.media[connections] = sum(r["bytes"] for r in results) / seconds
+
+    def recommend(self):
+        page, proxy = self.routes["page"], self.routes["proxy"]
+        media = self.routes.get("media", {})
+        recommended = {}
+
+        # the route that answered is tried first, the other one stays the fallback
+        recommended["preferred_route"] = "proxy" if not page["ok"] and proxy["ok"] else "page"
+
+        # pages of a captcha'd connection come slower and fewer at a time
+        captcha = page["captcha"] or proxy["captcha"]
+        recommended["fetch_workers"] = 1 if captcha else (3 if (page["latency"] or 0) > 0.5 else 2)
+        # a limit only where quizlet pushed back, a configured 0 (off) stays off otherwise
+        limited = captcha or 403 in (page["status"], proxy["status"])
+        configured = self.config.get("requests_per_second", 5)
+        recommended["requests_per_second"] = min(configured or 2, 2) if limited else configured
+
+        # the fewest connections that get 90% of the best media throughput
+        if self.media:
+            best = max(self.media.values())
+            recommended["media_workers"] = min(c for c, rate in self.media.items() if rate >= best * 0.9)
+
+        # ten times the usual wait plus three times the transfer of the largest answer seen
+        def timeout(route, size):
+            if not route.get("latency"):
+                return None
+            seconds = route["latency"] * 10 + size / max(route["bandwidth"], 1) * 3
+            return int(min(max(seconds, 10), 120))
+        chosen = proxy if recommended["preferred_route"] == "proxy" else page
+        if media.get("ok") and self.media:
+            # one small file says little about the bandwidth, one connection of the parallel run does
+            media = dict(media, bandwidth=self.media[min(self.media)])
+        for key, route, size in (("page_timeout_seconds", chosen, chosen["bytes"]),
+                                 ("media_timeout_seconds", media, 1024 * 1024)):
+            seconds = timeout(route, size)
+            if seconds:
+                recommended[key] = seconds
+
+        self.recommended = recommended
+        return recommended
+
+    def run(self):
+        self.checkRoutes()
+        self.checkCookies()
+        self.checkMedia()
+        return self.recommend()
+
+    def report(self):
+        lines = ["Set {0}".format(self.quizletDeckID), ""]
+        for name in ("page", "webapi", "proxy", "media"):
+            route = self.routes.get(name)
+            if not route:
+                continue
+            if route["ok"]:
+                state = "ok, {0:.0f} ms, {1:.0f} KB/s".format(route["latency"] * 1000, route["bandwidth"] / 1024)
+            elif route["captcha"]:
+                state = "captcha (status {0})".format(route["status"])
+            else:
+                state = "failed: {0}".format(route["error"] or "status {0}".format(route["status"]))
+            lines.append("{0:<8} {1}".format(name, state))
+        lines.append("cookies  {0}".format(self.cookies))
+        if self.media:
+            lines.append("media connections: " + ", ".join(
+                "{0}: {1:.0f} KB/s".format(c, rate / 1024) for c, rate in sorted(self.media.items())))
+        lines.append("")
+        lines.append("Recommended settings:")
+        lines.extend("  {0}: {1}".format(key, self.recommended[key])
+                     for key in recommended_keys if key in self.recommended)
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the routes to quizlet and recommends settings")
+    parser.add_argument("--set", help="set id to measure with, {0} by default".format(default_set))
+    parser.add_argument("--repeat", type=int, default=3, help="requests per route")
+    parser.add_argument("--qlts", default="", help="qlts cookie to check")
+    parser.add_argument("--quizlet-url", help=argparse.SUPPRESS)
+    parser.add_argument("--proxy-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.quizlet_url:
+        quizlet.quizlet_url = args.quizlet_url.rstrip("/")
+    if args.proxy_url:
+        quizlet.proxy_url = args.proxy_url.rstrip("/")
+
+    diagnostics = Diagnostics({"qlts": args.qlts}, args.set, args.repeat)
+    diagnostics.run()
+    print(diagnostics.report())
+    sys.exit(0 if diagnostics.routes["page"]["ok"] or diagnostics.routes["proxy"]["ok"] else 1)
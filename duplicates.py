@@ -0,0 +1,122 @@
+# -------------------------------------------------------------------------------
+#
+# Cross-set duplicate cards in folder and batch imports
+#
+# Sets of one class or folder often share most of their cards. Every item of
+# an import goes through one DuplicateIndex, keyed on its normalized term,
+# definition and image, and a card another set of the same import already
+# had is handled by `duplicate_policy`:
+#
+#   off   imported like any other card
+#   skip  not imported
+#   tag   imported with the first card's media files and the quizlet-duplicate tag
+#   link  not imported, the first card's note gets a quizlet-link::<set id> tag
+#
+# Repeats inside one set are left alone, the set's author put them there.
+#
+# Only a written note makes a card a duplicate: the map stage just finds the
+# likely ones to share their media downloads with the first card, the write
+# stage decides. A card whose first set is still in flight, failed or was
+# cancelled gets a note of its own and is the first card from then on.
+#
+# -------------------------------------------------------------------------------
+
+import re
+import html
+import hashlib
+import threading
+
+duplicate_policies = ("off", "skip", "tag", "link")
+
+# tag of the notes imported as duplicates with the tag policy
+duplicate_tag = "quizlet-duplicate"
+# prefix of the tags a linked note gets, one per set that also had it
+link_tag = "quizlet-link"
+
+
+def normalize(text):
+    # what a learner sees: no markup, entities decoded, case and spacing ignored
+    text = html.unescape(re.sub(r'<[^>]+>', ' ', text or ''))
+    return " ".join(text.casefold().split())
+
+
+def itemKey(item):
+    # audio is spoken from the text and left out, the image (and a diagram's shape) is part of the card
+    image = (item.get("imageUrl") or "").replace('_m', '')
+    values = [normalize(item["term"]), normalize(item["definition"]), image, str(item.get("shape") or "")]
+    return hashlib.sha1("\x1f".join(values).encode('utf-8')).hexdigest()
+
+
+class DuplicateIndex(object):
+    # built once per ImportPipeline, so it spans every set of a folder or batch import.
+    # add() runs on the map stage, claim(), written() and link() on the write stage
+
+    def __init__(self, policy="off"):
+        self.policy = policy if policy in duplicate_policies else "off"
+        self.lock = threading.Lock()
+        # item key -> the first item with it: set id, item, its note id once written
+        self.first = {}
+        # (set id, item id) -> key of the first items, and -> first entry of the likely duplicates
+        self.keys = {}
+        self.found = {}
+
+    def add(self, quizletDeckID, item):
+        # records an item, True when another set of this import had the same card so far
+        if self.policy == "off":
+            return False
+        key = itemKey(item)
+        with self.lock:
+            entry = self.first.get(key)
+            if entry is None:
+                self.first[key] = {"set": quizletDeckID, "item": item, "note": None}
+                return False
+            if entry["set"] == quizletDeckID:
+                return False
+            self.found[(quizletDeckID, item["id"])] = entry
+            return True
+
+    def original(self, quizletDeckID, item):
+        # the first item with the same card, None if this isn't a likely duplicate
+        return self.found.get((quizletDeckID, item["id"]))
+
+    def mediaItem(self, quizletDeckID, item):
+        # the item whose files a note is made with. a likely duplicate shares the first one's
+        # (same urls and names, so the download and the media file are shared too), skipped
+        # and linked ones of a first card already written need none
+        entry = self.original(quizletDeckID, item)
+        if entry is None:
+            return item
+        with self.lock:
+            if self.policy != "tag" and entry["note"] is not None:
+                return None
+            return entry["item"]
+
+    def claim(self, quizletDeckID, item):
+        # the entry of the note another set already wrote for this card, None when the item
+        # gets a note of its own; a card nobody wrote yet becomes this item's
+        if self.policy == "off":
+            return None
+        key = itemKey(item)
+        with self.lock:
+            entry = self.first.setdefault(key, {"set": quizletDeckID, "item": item, "note": None})
+            if entry["note"] is not None and entry["set"] != quizletDeckID:
+                return entry
+            if entry["note"] is None:
+                entry["set"], entry["item"] = quizletDeckID, item
+            self.keys[(quizletDeckID, item["id"])] = key
+            return None
+
+    def written(self, quizletDeckID, item, noteId):
+        # a claimed item got its note, later sets with the card are its duplicates
+        key = self.keys.get((quizletDeckID, item["id"]))
+        if key is None:
+            return
+        with self.lock:
+            entry = self.first[key]
+            if entry["note"] is None:
+                entry["note"] = noteId
+
+    def link(self, col, quizletDeckID, entry):
+        note = col.get_note(entry["note"])
+        note.add_tag("{0}::{1}".format(link_tag, quizletDeckID))
+        col.update_note(note)
@@ -0,0 +1,869 @@
+# -------------------------------------------------------------------------------
+#
+# Importer window and the thread fetching folder, class and user listings.
+#
+# Loaded on the first click on Tools > Import from Quizlet, together with
+# requests and the rest of the networking code.
+#
+# -------------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import webbrowser
+from aqt.utils import showText, tooltip
+from aqt.qt import *
+from aqt import mw, gui_hooks
+from anki.collection import OpChanges
+
+try:
+    from PyQt6.QtCore import pyqtSignal
+except Exception:
+    from PyQt5.QtCore import pyqtSignal
+
+from .timing import ImportTrace
+from . import quizlet
+from .quizlet import SetListing, listing_kinds, parseDeckUrl, deckUrl
+from .pipeline import ImportPipeline, ImportJob
+from .worker import WorkerPipeline
+from .package import PackageBuilder, importPackage
+from .cache import DeckCache
+from .sync import SubscriptionSync, subscriptions, subscribe, unsubscribe, dropDeleted
+from .preview import PreviewPane, PreviewLoader
+from .prefetch import Prefetch
+from .importqueue import ImportQueue, QueuePanel
+from .search import SearchPane
+from .diagnostics import Diagnostics, recommended_keys
+from .httparchive import HttpRecorder, HttpReplay
+from .planner import ImportPlan
+
+# traces and profiles are written next to the add-on, anki keeps user_files on update
+user_files = os.path.join(os.path.dirname(__file__), "user_files")
+
+
+def refreshMain(noteText=False):
+    # tells the main window what an import or sync changed instead of a full reset: the deck list,
+    # overview and browser update, and a card being reviewed stays (its queue isn't rebuilt)
+    changes = OpChanges(card=True, note=True, deck=True, browser_table=True, note_text=noteText,
+                        study_queues=mw.state != "review")
+    gui_hooks.operation_did_execute(changes, None)
+
+
+def useArchive(config):
+    # replay_http answers every request from a recorded file, record_http records them
+    # and every import saves its part next to the traces
+    if config.get("replay_http"):
+        quizlet.archive = HttpReplay(config["replay_http"], config.get("replay_latency", 1.0))
+    elif config.get("record_http"):
+        if not isinstance(quizlet.archive, HttpRecorder):
+            quizlet.archive = HttpRecorder()
+    else:
+        quizlet.archive = None
+
+
+class QuizletWindow(QWidget):
+    # main window of Quizlet plugin
+    def __init__(self):
+        super(QuizletWindow, self).__init__()
+
+        self.results = None
+        self.thread = None
+        self.cache = None
+        self.prefetch = None
+        # last refresh of the main window while chunks are written
+        self.refreshed = 0
+        self.config = mw.addonManager.getConfig(__name__)
+        useArchive(self.config)
+        self.queue = ImportQueue(self.queuePipeline, self.queueJob, self.onQueued, self.onQueueDrained, self.config)
+
+        self.initGUI()
+
+    # create GUI skeleton
+    def initGUI(self):
+
+        self.box_top = QVBoxLayout()
+        self.box_upper = QHBoxLayout()
+
+        # left side
+        self.box_left = QVBoxLayout()
+        self.check_boxes = QHBoxLayout()
+
+        self.box_incoming_html = QHBoxLayout()
+        self.box_incoming_html_left = QVBoxLayout()
+        self.box_incoming_html_right = QHBoxLayout()
+
+        self.value_incoming_html = QTextEdit("", self)
+        self.value_incoming_html.setMinimumWidth(300)
+        self.value_incoming_html.setPlaceholderText(
+            """Enter page html if you constantly receive errors
+
+1.Enter the url
+2.Click on the 'Open page' button
+3.Right click, 'View page source'
+4.Copy the html
+5.If you don't need audio, uncheck the box
+""")
+
+        self.label_incoming_html = QLabel("Page html:")
+        self.label_incoming_html.setMinimumWidth(98)
+        self.button_html = QPushButton("Open html", self)
+        self.button_html.clicked.connect(self.onHmtl)
+
+        self.box_incoming_html_left.addWidget(self.label_incoming_html)
+        self.box_incoming_html_left.addWidget(self.button_html)
+        self.box_incoming_html_left.addStretch()
+
+        self.box_incoming_html_right.addWidget(self.value_incoming_html)
+        self.box_incoming_html.addLayout(self.box_incoming_html_left)
+        self.box_incoming_html.addLayout(self.box_incoming_html_right)
+
+        # quizlet url field
+        self.box_name = QHBoxLayout()
+        self.label_url = QLabel("Quizlet URL:")
+        self.text_url = QLineEdit("", self)
+        self.text_url.setMinimumWidth(300)
+        self.text_url.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
+        self.text_url.setFocus()
+
+        # a set URL that stays put for a moment is fetched ahead of the click on Import Deck
+        self.prefetchTimer = QTimer(self)
+        self.prefetchTimer.setSingleShot(True)
+        self.prefetchTimer.setInterval(700)
+        self.prefetchTimer.timeout.connect(self.startPrefetch)
+        self.text_url.textChanged.connect(self.onUrlChanged)
+
+        self.label_url.setMinimumWidth(100)
+        self.box_name.addWidget(self.label_url)
+        self.box_name.addWidget(self.text_url)
+
+        self.box_download_audio = QHBoxLayout()
+        self.value_download_audio = QCheckBox("", self)
+        self.value_download_audio.toggle()
+        self.label_download_audio = QLabel("Download audio:")
+        self.label_download_audio.setMinimumWidth(100)
+        self.box_download_audio.addWidget(self.label_download_audio)
+        self.box_download_audio.addWidget(self.value_download_audio)
+
+        self.box_add_reverse = QHBoxLayout()
+        self.value_add_reverse = QCheckBox("", self)
+        self.label_add_reverse = QLabel("Add reverse:")
+        self.box_add_reverse.addWidget(self.label_add_reverse)
+        self.box_add_reverse.addWidget(self.value_add_reverse)
+
+        self.box_skip_errors = QHBoxLayout()
+        self.value_skip_errors = QCheckBox("", self)
+        self.value_skip_errors.setToolTip(
+            "Won't retry failed audio/images during the import, the next sync tries them again")
+        self.label_skip_errors = QLabel("Skip errors:")
+        self.label_skip_errors.setToolTip(
+            "Won't retry failed audio/images during the import, the next sync tries them again")
+        self.box_skip_errors.addWidget(self.label_skip_errors)
+        self.box_skip_errors.addWidget(self.value_skip_errors)
+
+        self.box_start_phrase = QHBoxLayout()
+        self.value_start_phrase = QLineEdit("", self)
+        self.value_start_phrase.setMinimumWidth(300)
+        self.value_start_phrase.setPlaceholderText(
+            'Start from this phrase. Can be empty')
+        self.label_start_phrase = QLabel("Start Phrase:")
+        self.label_start_phrase.setMinimumWidth(100)
+        self.box_start_phrase.addWidget(self.label_start_phrase)
+        self.box_start_phrase.addWidget(self.value_start_phrase)
+
+        self.box_stop_phrase = QHBoxLayout()
+        self.value_stop_phrase = QLineEdit("", self)
+        self.value_stop_phrase.setMinimumWidth(300)
+        self.value_stop_phrase.setPlaceholderText(
+            'Stop after this phrase. Can be empty')
+        self.label_stop_phrase = QLabel("Stop Phrase:")
+        self.label_stop_phrase.setMinimumWidth(100)
+        self.box_stop_phrase.addWidget(self.label_stop_phrase)
+        self.box_stop_phrase.addWidget(self.value_stop_phrase)
+
+        # add layouts to left
+        self.box_left.addLayout(self.box_name)
+        self.box_left.addLayout(self.check_boxes)
+        self.check_boxes.addLayout(self.box_download_audio)
+        self.check_boxes.addLayout(self.box_add_reverse)
+        self.check_boxes.addLayout(self.box_skip_errors)
+        self.check_boxes.addStretch()
+
+        self.box_left.addLayout(self.box_start_phrase)
+        self.box_left.addLayout(self.box_stop_phrase)
+        self.box_left.addLayout(self.box_incoming_html)
+
+        # right side
+        self.box_right = QVBoxLayout()
+
+        # code (import set) button
+        self.box_code = QVBoxLayout()
+        self.button_code = QPushButton("Import Deck", self)
+        # self.box_code.addStretch(1)
+        self.box_code.addWidget(self.button_code)
+        self.button_code.clicked.connect(self.onCode)
+
+        # preview button, fills the table below without importing
+        self.button_preview = QPushButton("Preview", self)
+        self.button_preview.setToolTip("Show the cards first and pick the ones to import")
+        self.box_code.addWidget(self.button_preview)
+        self.button_preview.clicked.connect(self.onPreview)
+
+        # dry run: cards, media and bytes of the URLs in the field, with an estimated time
+        self.button_plan = QPushButton("Plan", self)
+        self.button_plan.setToolTip("Count the cards, media files and bytes and estimate the import time, "
+                                    "without importing")
+        self.box_code.addWidget(self.button_plan)
+        self.button_plan.clicked.connect(self.onPlan)
+
+        # queues every URL in the field (several can be pasted at once), imports run in the background
+        self.button_queue = QPushButton("Add to queue", self)
+        self.button_queue.setToolTip("Import in the background, several URLs can be pasted at once")
+        self.box_code.addWidget(self.button_queue)
+        self.button_queue.clicked.connect(self.onQueue)
+
+        # shows the search panel
+        self.button_search = QPushButton("Search", self)
+        self.button_search.setToolTip("Find sets on Quizlet")
+        self.box_code.addWidget(self.button_search)
+        self.button_search.clicked.connect(self.onSearch)
+
+        # add layouts to right
+        self.box_right.addLayout(self.box_code)
+        self.box_right.addStretch()
+
+        # add left and right layouts to upper
+        self.box_upper.addLayout(self.box_left)
+        self.box_upper.addSpacing(20)
+        self.box_upper.addLayout(self.box_right)
+
+        # results label
+        self.label_results = QLabel(
+            "\r\n<i>Example: https://quizlet.com/150875612/usmle-flash-cards/</i>")
+
+        # preview table, hidden until used
+        self.preview = PreviewPane(self)
+        self.preview.hide()
+
+        self.queuePanel = QueuePanel(self.queue, self)
+        self.queuePanel.hide()
+
+        self.searchPane = None
+
+        # add all widgets to top layout
+        self.box_top.addLayout(self.box_upper)
+        self.box_top.addWidget(self.preview)
+        self.box_top.addWidget(self.queuePanel)
+        self.box_search = QVBoxLayout()
+        self.box_top.addLayout(self.box_search)
+        self.box_top.addWidget(self.label_results)
+        self.box_top.addStretch(1)
+        self.setLayout(self.box_top)
+
+        # go, baby go!
+        self.setMinimumWidth(600)
+        self.setSizePolicy(QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Minimum)
+        self.setWindowTitle("Improved Quizlet to Anki Importer")
+        self.show()
+
+    def onHmtl(self):
+        """
+        Opens the flascards html page in a browser
+        """
+        quizletDeckID = self.getQuizletDeckID()
+
+        if quizletDeckID == None:
+            return
+
+        webbrowser.open(deckUrl(quizletDeckID))
+
+
+    def onUrlChanged(self, text):
+        if self.prefetch:
+            self.prefetch.discard()
+            self.prefetch = None
+        self.prefetchTimer.start()
+
+    def startPrefetch(self):
+        if not self.config.get("prefetch", True) or self.value_incoming_html.toPlainText():
+            return
+        try:
+            quizletDeckID = parseDeckUrl(self.text_url.text())
+        except ValueError:
+            return
+        if quizletDeckID in listing_kinds:
+            return
+
+        self.prefetch = Prefetch(quizletDeckID, self.config, self.deckCache(), self.value_download_audio.isChecked(),
+                                 ImportTrace(str(quizletDeckID), profile=self.config.get("profile", False)))
+        self.prefetch.start()
+
+    def takePrefetch(self, job):
+        # hands what the prefetch got so far to the job, returns the files it downloaded
+        prefetch = self.prefetch
+        self.prefetch = None
+        if not prefetch or prefetch.quizletDeckID != job.quizletDeckID or job.html:
+            if prefetch:
+                prefetch.discard()
+            return None, {}
+
+        # still fetching: waiting for it beats starting over, media stops after the current file
+        prefetch.cancel()
+        while not prefetch.done():
+            mw.app.processEvents()
+            prefetch.thread.join(0.05)
+
+        if prefetch.items is not None and not prefetch.error and job.items is None:
+            job.items = prefetch.items
+            job.title = prefetch.title
+            job.modified = prefetch.modified
+        job.trace.note("prefetched: {0} items, {1} files{2}".format(
+            len(prefetch.items or []), len(prefetch.media),
+            ", failed: {0}".format(prefetch.errorMessage) if prefetch.errorMessage else ""))
+        return prefetch, prefetch.media
+
+    def closeEvent(self, event):
+        if self.prefetch:
+            self.prefetch.discard()
+            self.prefetch = None
+        super(QuizletWindow, self).closeEvent(event)
+
+    def getQuizletDeckID(self):
+        # grab url input
+        url = self.text_url.text()
+
+        try:
+            quizletDeckID = parseDeckUrl(url)
+        except ValueError as e:
+            self.label_results.setText(str(e))
+            return
+
+        if quizletDeckID in listing_kinds:
+            self.label_results.setText("Going to import a {0} !".format(quizletDeckID))
+
+        return quizletDeckID
+
+    def FolderExtract(self, name, ids):
+            self.label_results.setText(f'Downloading {len(ids)} decks')
+            jobs = self.importDecks([self.newJob(id, parent=name) for id in ids])
+
+            failed = [job for job in jobs if job.error]
+            duplicates = sum(job.duplicates for job in jobs)
+            self.label_results.setText("Imported {0} of {1} decks ({2} cards{3})".format(
+                len(jobs) - len(failed), len(jobs), sum(job.count for job in jobs),
+                ", {0} duplicates {1}".format(duplicates, self.config.get("duplicate_policy"))
+                if duplicates else ""))
+
+    def newJob(self, quizletDeckID, html='', parent=''):
+        return ImportJob(quizletDeckID, deckUrl(quizletDeckID), html,
+                         ImportTrace(str(quizletDeckID), profile=self.config.get("profile", False)),
+                         startPhrase=self.value_start_phrase.text(),
+                         stopPhrase=self.value_stop_phrase.text(), parent=parent)
+
+    def deckCache(self):
+        if self.cache is None and self.config.get("deck_cache", True):
+            if not os.path.isdir(user_files):
+                os.makedirs(user_files)
+            self.cache = DeckCache(os.path.join(user_files, "decks.sqlite"))
+        return self.cache
+
+    def pipelineOptions(self, prefetched=None):
+        return dict(downloadAudio=self.value_download_audio.isChecked(),
+                    addReverse=self.value_add_reverse.isChecked(),
+                    skipErrors=self.value_skip_errors.isChecked(),
+                    fetchWorkers=self.config.get("fetch_workers", 2),
+                    mediaWorkers=self.config.get("media_workers", 4),
+                    chunkSize=self.config.get("chunk_size", 20),
+                    cache=self.deckCache(),
+                    processes=self.config.get("parse_processes", 0),
+                    prefetched=prefetched)
+
+    def pipelineClass(self):
+        # recording stays in this process, and a frozen Anki has no Python to start the worker with
+        if self.config.get("worker_process", False) and not self.config.get("record_http", False) \
+                and not getattr(sys, "frozen", False):
+            return WorkerPipeline
+        return ImportPipeline
+
+    def importDecks(self, jobs, prefetched=None):
+        if self.config.get("native_import", False):
+            return self.importPackage(jobs, prefetched)
+
+        # runs the staged pipeline, notes are written here on the main thread
+        pipeline = self.pipelineClass()(mw.col, self.config, chunkWritten=self.onChunkWritten,
+                                        **self.pipelineOptions(prefetched))
+        for job in jobs:
+            pipeline.add(job)
+
+        self.refreshed = 0
+        try:
+            pipeline.run(poll=mw.app.processEvents, progress=self.onProgress)
+        finally:
+            if jobs:
+                jobs[0].trace.note("peak memory budget use {0:.1f} MB".format(pipeline.budget.peak / 1048576.0))
+            # the chunks written before a failure stay in the collection
+            self.finishImport(jobs)
+
+        return jobs
+
+    def importPackage(self, jobs, prefetched=None):
+        # builds an .apkg in a throwaway collection, then anki's importer adds it in one go
+        builder = PackageBuilder(jobs, self.config, mw.col.models.by_name("Basic Quizlet Extended"),
+                                 **self.pipelineOptions(prefetched))
+        try:
+            path = builder.run(poll=mw.app.processEvents, progress=self.onProgress)
+            if path:
+                self.label_results.setText("Adding the notes to the collection...")
+                mw.app.processEvents()
+                log = importPackage(mw.col, path, jobs[0].trace)
+                jobs[0].trace.note("package import: {0} new, {1} duplicate, {2} missing note type".format(
+                    len(log.new), len(log.duplicate), len(log.missing_notetype)))
+        finally:
+            builder.cleanup()
+
+        for job in jobs:
+            if job.deckId:
+                # the id was the one in the throwaway collection
+                job.deckId = mw.col.decks.id_for_name(job.deckName())
+        self.finishImport(jobs)
+
+        return jobs
+
+    def finishImport(self, jobs):
+        for job in jobs:
+            if job.done and not job.error and job.notes:
+                subscribe(mw.col, job, self.value_add_reverse.isChecked(), self.value_download_audio.isChecked())
+
+        trace = jobs[0].trace if jobs else ImportTrace()
+        with trace.phase("reset"):
+            refreshMain()
+
+        for job in jobs:
+            if job.error:
+                # the first line, a parse error carries the whole page after it
+                message = (job.errorMessage or "").strip() or "error {0}".format(job.errorCode)
+                job.trace.note("failed: {0}".format(message.splitlines()[0]))
+            self.reportTrace(job.trace)
+        self.saveArchive()
+
+    def onChunkWritten(self, job):
+        # written chunks can be studied right away, the main window shows them at most every refresh_seconds
+        interval = self.config.get("refresh_seconds", 5)
+        if not interval or time.perf_counter() - self.refreshed < interval:
+            return
+        self.refreshed = time.perf_counter()
+        refreshMain()
+
+    def onProgress(self, job):
+        self.label_results.setText(
+            ("Imported {0}/{1}".format(job.count, job.total)))
+
+    def showError(self, source, quizletDeckID):
+        if source.errorCode == 403:
+            if source.errorCaptcha:
+                self.label_results.setText(
+                    "Sorry, it's behind a captcha. Try to disable VPN")
+            else:
+                self.label_results.setText(
+                    "Sorry, this is a private deck :(")
+        elif source.errorCode == 404:
+            self.label_results.setText(
+                "Can't find a deck with the ID <i>{0}</i>".format(quizletDeckID))
+        else:
+            self.label_results.setText("Unknown Error")
+            showText(source.errorMessage or "")
+
+    def onCode(self, quizletDeckID):
+        html = self.value_incoming_html.toPlainText()
+        if quizletDeckID == False and len(self.text_url.text().split()) > 1:
+            return self.onQueue()
+        if quizletDeckID == False:
+            self.label_results.setText("Connecting to Quizlet...")
+            quizletDeckID = self.getQuizletDeckID()
+
+        if quizletDeckID == None:
+            return
+
+        # and aaawaaaay we go...
+        if quizletDeckID not in listing_kinds:
+            job = self.newJob(quizletDeckID, html)
+            if self.preview.isVisible() and self.preview.quizletDeckID == quizletDeckID and self.preview.title:
+                # the set is already mapped, only the picked cards (and their media) are imported
+                job.items = list(self.preview.model.items)
+                job.title = self.preview.title
+                job.selected = self.preview.selectedIds()
+            prefetch, prefetched = self.takePrefetch(job)
+            try:
+                job = self.importDecks([job], prefetched)[0]
+            finally:
+                if prefetch:
+                    prefetch.discard()
+
+            if job.error:
+                self.showError(job, quizletDeckID)
+            else:
+                deferred = ", {0} media files left out by the media limits, the next sync adds them".format(
+                    len(job.deferred))
+                failed = ", {0} media files failed, the next sync tries them again".format(len(job.failed))
+                self.label_results.setText(
+                    ("Success! Imported <b>{0}</b> ({1} cards{2}{3})".format(job.title, job.count,
+                                                                            deferred if job.deferred else "",
+                                                                            failed if job.failed else "")))
+            return
+
+        # a folder, class or user sets: the listing is walked here and FolderExtract imports its decks
+        trace = ImportTrace(str(quizletDeckID), profile=self.config.get("profile", False))
+
+        try:
+            thread = QuizletDownloader(self, self.text_url.text(), quizletDeckID, html, trace)
+            # Connect the signal so that FolderExtract is called in the main thread:
+            thread.folderExtracted.connect(self.FolderExtract)
+            thread.start()
+        except Exception as e:
+            thread = None
+
+        if thread is not None:
+            while not thread.isFinished():
+                mw.app.processEvents()
+                thread.wait(50)
+        else:
+            self.label_results.setText("Error: Thread not initialized.")
+
+        # error fetching data
+        if thread and thread.error:
+            self.showError(thread, quizletDeckID)
+
+        if thread and thread.isRunning():
+            thread.quit()
+            thread.wait()
+
+        self.reportTrace(trace)
+        self.saveArchive()
+
+    def onPreview(self):
+        quizletDeckID = self.getQuizletDeckID()
+        if quizletDeckID == None:
+            return
+        if quizletDeckID in listing_kinds:
+            self.label_results.setText("Preview works for single sets only")
+            return
+
+        self.label_results.setText("Loading the cards...")
+        self.preview.start(quizletDeckID)
+        trace = ImportTrace(str(quizletDeckID), profile=self.config.get("profile", False))
+        loader = PreviewLoader(deckUrl(quizletDeckID), quizletDeckID, self.value_incoming_html.toPlainText(),
+                               self.config, self.deckCache(), trace)
+        loader.itemsMapped.connect(self.preview.model.appendItems)
+        loader.start()
+
+        while not loader.isFinished():
+            mw.app.processEvents()
+            loader.wait(50)
+        # chunks emitted just before the end are still queued
+        mw.app.processEvents()
+
+        if loader.error:
+            self.preview.hide()
+            self.showError(loader, quizletDeckID)
+        else:
+            self.preview.title = loader.title
+            self.label_results.setText(
+                "<b>{0}</b>: select cards (Ctrl/Shift for ranges) and click Import Deck".format(loader.title))
+        self.reportTrace(trace)
+        self.saveArchive()
+
+    def onPlan(self):
+        sets, invalid = [], []
+        for url in self.text_url.text().split():
+            try:
+                sets.append((url, parseDeckUrl(url)))
+            except ValueError:
+                invalid.append(url)
+        if not sets:
+            self.label_results.setText("Nothing to plan" + (", not Quizlet URLs: " + " ".join(invalid) if invalid else ""))
+            return
+
+        html = self.value_incoming_html.toPlainText()
+        cache = self.deckCache()
+        importPlan = ImportPlan([], self.config, cache, downloadAudio=self.value_download_audio.isChecked(),
+                                startPhrase=self.value_start_phrase.text(), stopPhrase=self.value_stop_phrase.text(),
+                                trace=ImportTrace("plan", profile=self.config.get("profile", False)))
+
+        def planSets():
+            # listings are read here too, their sets are planned like the ones pasted
+            for url, quizletDeckID in sets:
+                if quizletDeckID in listing_kinds:
+                    listing = SetListing(url, quizletDeckID, config=self.config,
+                                         workers=self.config.get("fetch_workers", 2))
+                    listing.fetch()
+                    ids = listing.ids
+                else:
+                    ids = [quizletDeckID]
+                # pasted html belongs to a single pasted set
+                page = html if len(sets) == 1 and quizletDeckID not in listing_kinds else ''
+                for id in ids:
+                    if id not in [s[0] for s in importPlan.sets]:
+                        importPlan.sets.append((id, deckUrl(id), page))
+            return importPlan.run()
+
+        def done(future):
+            self.button_plan.setEnabled(True)
+            try:
+                future.result()
+            except Exception as e:
+                self.label_results.setText("Planning failed: {0}".format(e))
+                return
+            self.label_results.setText(importPlan.report().splitlines()[0])
+            showText(importPlan.report(), title="Import plan")
+            self.reportTrace(importPlan.trace)
+            self.saveArchive()
+
+        self.button_plan.setEnabled(False)
+        self.label_results.setText("Planning...")
+        mw.taskman.run_in_background(planSets, done)
+
+    def onQueue(self):
+        sets, invalid = [], []
+        for url in self.text_url.text().split():
+            try:
+                sets.append((url, parseDeckUrl(url)))
+            except ValueError:
+                invalid.append(url)
+        if self.queueSets(sets, invalid):
+            self.text_url.clear()
+
+    def queueSets(self, sets, invalid=()):
+        # sets are (url, quizletDeckID), returns how many were added
+        options = dict(downloadAudio=self.value_download_audio.isChecked(),
+                       addReverse=self.value_add_reverse.isChecked(),
+                       skipErrors=self.value_skip_errors.isChecked())
+        added = 0
+        for url, quizletDeckID in sets:
+            if quizletDeckID in listing_kinds or not self.queue.queued(quizletDeckID):
+                self.queue.add(url, quizletDeckID, options)
+                added += 1
+
+        self.label_results.setText("Queued {0} URLs{1}".format(
+            added, "" if not invalid else ", not Quizlet URLs: " + " ".join(invalid)))
+        if added:
+            self.queuePanel.start()
+        return added
+
+    def onSearch(self):
+        if self.searchPane is None:
+            # built on first use, the window opens as fast as before
+            self.searchPane = SearchPane(self.config, self.deckCache(), self)
+            self.searchPane.importRequested.connect(self.onSearchImport)
+            self.searchPane.queueRequested.connect(
+                lambda ids: self.queueSets([(deckUrl(id), id) for id in ids]))
+            self.box_search.addWidget(self.searchPane)
+        self.searchPane.setVisible(not self.searchPane.isVisible())
+        if self.searchPane.isVisible():
+            self.searchPane.text_query.setFocus()
+
+    def onSearchImport(self, ids):
+        # one set is imported right away like a pasted URL, more go through the queue
+        if len(ids) > 1:
+            return self.queueSets([(deckUrl(id), id) for id in ids])
+        self.text_url.setText(deckUrl(ids[0]))
+        self.onCode(ids[0])
+
+    def queuePipeline(self, options):
+        # the queue imports while the user studies: their current deck stays selected
+        pipeline = self.pipelineClass()(mw.col, self.config, chunkWritten=self.onChunkWritten, selectDeck=False,
+                                        **dict(self.pipelineOptions(), **options))
+        pipeline.start()
+        return pipeline
+
+    def queueJob(self, entry):
+        return ImportJob(entry.quizletDeckID, deckUrl(entry.quizletDeckID), '',
+                         ImportTrace(str(entry.quizletDeckID), profile=self.config.get("profile", False)),
+                         parent=entry.parent)
+
+    def onQueued(self, entry):
+        job = entry.job
+        if not job.error and job.notes:
+            subscribe(mw.col, job, entry.options["addReverse"], entry.options["downloadAudio"])
+        self.reportTrace(job.trace)
+
+    def onQueueDrained(self):
+        # one refresh of the main window for the whole queue, not one per set
+        refreshMain()
+        self.label_results.setText("Import queue done")
+        self.saveArchive()
+
+    def reportTrace(self, trace):
+        summary = trace.summary()
+        print(summary)
+        self.label_results.setToolTip(summary)
+
+        if self.config.get("trace", False) or trace.profile:
+            try:
+                print("Trace saved to {0}".format(trace.dump(user_files)))
+            except Exception as e:
+                print("Can't save the trace: {0}".format(e))
+
+    def saveArchive(self):
+        # once per import, after all its jobs: a save empties the recorder
+        if not isinstance(quizlet.archive, HttpRecorder) or not quizlet.archive.exchanges:
+            return
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(user_files, "http-{0}.zip".format(stamp))
+        count = 1
+        while os.path.exists(path):
+            count += 1
+            path = os.path.join(user_files, "http-{0}-{1}.zip".format(stamp, count))
+        try:
+            if not os.path.isdir(user_files):
+                os.makedirs(user_files)
+            print("{0} requests recorded into {1}".format(quizlet.archive.save(path), path))
+        except Exception as e:
+            print("Can't save the recorded requests: {0}".format(e))
+
+
+syncing = False
+
+
+def syncSubscriptions(quiet=True):
+    # checks the imported sets for changes in the background and updates their notes,
+    # called by the timer from __init__.py and by Tools > Sync Quizlet subscriptions
+    global syncing
+    if syncing or not mw.col:
+        return
+    for quizletDeckID in dropDeleted(mw.col):
+        print("Quizlet set {0} unsubscribed, its deck was deleted".format(quizletDeckID))
+    subs = subscriptions(mw.col)
+    if not subs:
+        if not quiet:
+            tooltip("No imported Quizlet sets to sync")
+        return
+
+    col = mw.col
+    config = mw.addonManager.getConfig(__name__)
+    sync = SubscriptionSync(subs, config, workers=config.get("fetch_workers", 2))
+    syncing = True
+
+    def done(future):
+        global syncing
+        syncing = False
+        try:
+            changes = future.result()
+        except Exception as e:
+            print("Quizlet sync failed: {0}".format(e))
+            sync.cleanup()
+            return
+        if mw.col is not col:
+            # profile was switched meanwhile
+            sync.cleanup()
+            return
+
+        added, updated, deleted = sync.apply(col, changes)
+        for change in changes:
+            if change.error:
+                print("Quizlet sync of {0}: {1}".format(change.quizletDeckID, change.error))
+        print(sync.trace.summary())
+
+        if added or updated or deleted:
+            refreshMain(noteText=True)
+        if added or updated or deleted or not quiet:
+            tooltip("Quizlet sync: {0} added, {1} updated, {2} deleted".format(added, updated, deleted))
+
+    mw.taskman.run_in_background(sync.check, done)
+
+
+def manageSubscriptions():
+    # Tools > Quizlet subscriptions: the synced sets, picked ones are unsubscribed (their notes stay)
+    if not mw.col:
+        return
+    dropDeleted(mw.col)
+    subs = subscriptions(mw.col)
+    if not subs:
+        tooltip("No imported Quizlet sets")
+        return
+
+    dialog = QDialog(mw)
+    dialog.setWindowTitle("Quizlet subscriptions")
+    sets = QListWidget(dialog)
+    sets.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+    for quizletDeckID, sub in sorted(subs.items(), key=lambda s: s[1]["deck"]):
+        entry = QListWidgetItem("{0} ({1}, {2} cards)".format(sub["deck"], quizletDeckID, len(sub["items"])))
+        entry.setData(Qt.ItemDataRole.UserRole, quizletDeckID)
+        sets.addItem(entry)
+    button_unsubscribe = QPushButton("Unsubscribe", dialog)
+    button_close = QPushButton("Close", dialog)
+    button_close.clicked.connect(dialog.accept)
+
+    def onUnsubscribe():
+        picked = sets.selectedItems()
+        unsubscribe(mw.col, [entry.data(Qt.ItemDataRole.UserRole) for entry in picked])
+        for entry in picked:
+            sets.takeItem(sets.row(entry))
+    button_unsubscribe.clicked.connect(onUnsubscribe)
+
+    buttons = QHBoxLayout()
+    buttons.addWidget(button_unsubscribe)
+    buttons.addStretch()
+    buttons.addWidget(button_close)
+    box = QVBoxLayout()
+    box.addWidget(QLabel("Synced sets; unsubscribed ones keep their notes", dialog))
+    box.addWidget(sets)
+    box.addLayout(buttons)
+    dialog.setLayout(box)
+    dialog.resize(500, 400)
+    dialog.exec()
+
+
+def runDiagnostics():
+    # Tools > Quizlet connection diagnostics: measures the routes in the background,
+    # writes the recommended settings into the config and shows what it found
+    config = mw.addonManager.getConfig(__name__)
+    diagnostics = Diagnostics(config)
+    mw.progress.start(label="Checking the connection to Quizlet...")
+
+    def done(future):
+        mw.progress.finish()
+        try:
+            recommended = future.result()
+        except Exception as e:
+            showText("Quizlet diagnostics failed: {0}".format(e))
+            return
+        changed = [key for key in recommended_keys if key in recommended and recommended[key] != config.get(key)]
+        config.update(recommended)
+        mw.addonManager.writeConfig(__name__, config)
+        showText(diagnostics.report() + "\n\n" + ("Saved to the add-on config: {0}".format(", ".join(changed))
+                                                  if changed else "The add-on config already had these settings"))
+
+    mw.taskman.run_in_background(diagnostics.run, done)
+
+
+class QuizletDownloader(QThread):
+    # thread that walks a folder, class or user listing, emits its name and set ids
+    folderExtracted = pyqtSignal(str, list)
+
+    def __init__(self, window, url, quizletDeckID, html, trace=None):
+        super(QuizletDownloader, self).__init__()
+        self.window = window
+        self.url = url
+        self.results = None
+        self.quizletDeckID = quizletDeckID
+        config = mw.addonManager.getConfig(__name__)
+        self.fetcher = SetListing(url, quizletDeckID, config=config, trace=trace,
+                                  workers=config.get("fetch_workers", 2))
+        self.trace = self.fetcher.trace
+
+        self.error = False
+        self.errorCode = None
+        self.errorCaptcha = False
+        self.errorReason = None
+        self.errorMessage = None
+
+    def run(self):
+        self.fetcher.fetch()
+
+        self.error = self.fetcher.error
+        self.errorCode = self.fetcher.errorCode
+        self.errorCaptcha = self.fetcher.errorCaptcha
+        self.errorReason = self.fetcher.errorReason
+        self.errorMessage = self.fetcher.errorMessage
+
+        if not self.error:
+            self.folderExtracted.emit(self.fetcher.name, self.fetcher.ids)
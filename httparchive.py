@@ -0,0 +1,171 @@
+# -------------------------------------------------------------------------------
+#
+# HTTP record/replay of everything an import fetches
+#
+# While quizlet.archive is an HttpRecorder, every page, webapi, proxy and
+# media exchange (and the planner's HEAD requests) goes through it: status, headers, body and timings are kept
+# and saved into a zip (exchanges.json plus the bodies, deflated and stored
+# once per content). An HttpReplay of that zip answers the same requests
+# without the network, waiting the recorded time (scaled, 0 for none), so a
+# reported import can be run and benchmarked offline:
+#
+#   python quizlet_importer urls.txt --collection t.anki2 --record import.zip
+#   python quizlet_importer urls.txt --collection t.anki2 --replay import.zip --replay-latency 0
+#
+# -------------------------------------------------------------------------------
+
+import io
+import time
+import zipfile
+import hashlib
+import threading
+import requests
+from collections import deque
+try:
+    import urllib2
+except Exception:
+    import urllib.request as urllib2
+
+try:
+    from . import jsonlib
+except ImportError:
+    import jsonlib
+
+
+class ArchivedResponse(object):
+    # what download_media reads from an urllib response
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def getcode(self):
+        return self.status
+
+    def read(self):
+        return self.body
+
+
+def requestsResponse(url, status, headers, body):
+    r = requests.Response()
+    r.url = url
+    r.status_code = status
+    r.headers = requests.structures.CaseInsensitiveDict(headers)
+    r._content = body
+    r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+    r.reason = "Replayed"
+    return r
+
+
+class HttpRecorder(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.exchanges = []
+        # sha1 -> body
+        self.bodies = {}
+
+    def add(self, url, status, headers, body, latency, seconds, error=None, method="GET"):
+        digest = hashlib.sha1(body).hexdigest() if body else None
+        with self.lock:
+            if digest:
+                self.bodies.setdefault(digest, body)
+            self.exchanges.append({"url": url, "method": method, "status": status, "headers": headers, "body": digest,
+                                   "latency": latency, "seconds": seconds, "error": error})
+
+    def get(self, url, fetch, method="GET"):
+        # fetch() is the real requests call
+        started = time.perf_counter()
+        try:
+            r = fetch()
+        except requests.RequestException as e:
+            self.add(url, None, {}, b'', None, time.perf_counter() - started, "{0}: {1}".format(type(e).__name__, e),
+                     method)
+            raise
+        self.add(url, r.status_code, dict(r.headers), r.content, r.elapsed.total_seconds(),
+                 time.perf_counter() - started, method=method)
+        return r
+
+    def head(self, url, fetch):
+        return self.get(url, fetch, "HEAD")
+
+    def open(self, url, fetch):
+        # fetch() is the real urllib call, the body is read here to keep it
+        started = time.perf_counter()
+        try:
+            r = fetch()
+            latency = time.perf_counter() - started
+            body = r.read()
+        except urllib2.HTTPError as e:
+            body = e.read()
+            self.add(url, e.code, dict(e.headers), body, time.perf_counter() - started,
+                     time.perf_counter() - started)
+            raise urllib2.HTTPError(url, e.code, e.msg, e.headers, io.BytesIO(body))
+        except Exception as e:
+            self.add(url, None, {}, b'', None, time.perf_counter() - started, "{0}: {1}".format(type(e).__name__, e))
+            raise
+        self.add(url, r.getcode(), dict(r.headers), body, latency, time.perf_counter() - started)
+        return ArchivedResponse(r.getcode(), r.headers, body)
+
+    def save(self, path):
+        # writes what was recorded since the last save, returns the number of exchanges
+        with self.lock:
+            exchanges, bodies = self.exchanges, self.bodies
+            self.exchanges, self.bodies = [], {}
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("exchanges.json", jsonlib.dumps(exchanges))
+            for digest, body in bodies.items():
+                archive.writestr("bodies/" + digest, body)
+        return len(exchanges)
+
+
+class HttpReplay(object):
+    # answers from a recorded zip, the exchanges of a method and url in recorded order (the last
+    # one again once they're used up). latency scales the recorded waits, 0 answers at once
+
+    def __init__(self, path, latency=1.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.exchanges = {}
+        self.bodies = {}
+        with zipfile.ZipFile(path) as archive:
+            for exchange in jsonlib.loads(archive.read("exchanges.json")):
+                # archives from before HEAD requests were recorded have GETs only
+                key = (exchange.get("method", "GET"), exchange["url"])
+                self.exchanges.setdefault(key, deque()).append(exchange)
+            for name in archive.namelist():
+                if name.startswith("bodies/"):
+                    self.bodies[name[len("bodies/"):]] = archive.read(name)
+
+    def next(self, url, method="GET"):
+        with self.lock:
+            exchanges = self.exchanges.get((method, url))
+            if not exchanges:
+                return None
+            exchange = exchanges.popleft() if len(exchanges) > 1 else exchanges[0]
+        if self.latency and exchange["seconds"]:
+            time.sleep(exchange["seconds"] * self.latency)
+        return exchange
+
+    def get(self, url, fetch=None, method="GET"):
+        exchange = self.next(url, method)
+        if exchange is None:
+            raise requests.ConnectionError("{0} is not in the replayed archive".format(url))
+        if exchange["error"]:
+            raise requests.ConnectionError(exchange["error"])
+        return requestsResponse(url, exchange["status"], exchange["headers"],
+                                self.bodies.get(exchange["body"], b''))
+
+    def head(self, url, fetch=None):
+        return self.get(url, fetch, "HEAD")
+
+    def open(self, url, fetch=None):
+        exchange = self.next(url)
+        if exchange is None:
+            raise urllib2.URLError("{0} is not in the replayed archive".format(url))
+        if exchange["error"]:
+            raise urllib2.URLError(exchange["error"])
+        body = self.bodies.get(exchange["body"], b'')
+        if exchange["status"] >= 400:
+            raise urllib2.HTTPError(url, exchange["status"], "Replayed", exchange["headers"], io.BytesIO(body))
+        return ArchivedResponse(exchange["status"], exchange["headers"], body)
@@ -0,0 +1,271 @@
+# -------------------------------------------------------------------------------
+#
+# Import queue: many set, folder, class and user URLs imported in the background
+#
+# Queued sets go through one ImportPipeline, at most `queue_concurrency` of
+# them at a time. A timer on the main thread starts the next sets, writes the
+# notes the pipeline has ready and updates the panel, so Anki stays usable
+# while the queue works. Listings are read on a thread and replaced by their
+# sets in place. Sets queued with other audio/reverse/skip options wait until
+# the running ones are done and start a pipeline of their own.
+#
+# -------------------------------------------------------------------------------
+
+import threading
+from aqt.qt import *
+
+from .quizlet import SetListing, listing_kinds, deckUrl
+
+# entry states
+pending = "pending"
+listing = "listing"
+running = "running"
+done = "done"
+failed = "failed"
+cancelled = "cancelled"
+
+
+class QueueEntry(object):
+
+    def __init__(self, url, quizletDeckID, options, parent=''):
+        self.url = url
+        self.quizletDeckID = quizletDeckID
+        # pipeline options (downloadAudio, addReverse, skipErrors) at the time it was queued
+        self.options = options
+        self.parent = parent
+        self.state = pending
+        self.job = None
+        self.listing = None
+        self.thread = None
+        self.cancelling = False
+        self.message = ""
+
+    def name(self):
+        if self.job and self.job.title:
+            return self.job.deckName()
+        return self.url
+
+    def status(self):
+        job = self.job
+        if self.state == pending:
+            return "Waiting"
+        if self.state == listing:
+            return "Reading the {0}".format(self.quizletDeckID)
+        if self.state == running:
+            return "Imported {0}/{1}".format(job.count, job.total) if job.total else "Fetching"
+        if self.state == done:
+            return "Done, {0} cards{1}".format(job.count, ", {0} duplicates".format(job.duplicates)
+                                                if job.duplicates else "")
+        if self.state == failed:
+            return "Failed: {0}".format(self.message)
+        return "Cancelled"
+
+
+class ImportQueue(object):
+    # makePipeline(options) returns a started ImportPipeline, makeJob(entry) an ImportJob,
+    # finished(entry) is called once a set is written (or failed), drained() when nothing is left
+
+    def __init__(self, makePipeline, makeJob, finished=None, drained=None, config=None):
+        self.makePipeline = makePipeline
+        self.makeJob = makeJob
+        self.finished = finished
+        self.drained = drained
+        self.config = config or {}
+        self.concurrency = max(1, self.config.get("queue_concurrency", 2))
+        self.entries = []
+        self.pipeline = None
+        self.options = None
+
+    def add(self, url, quizletDeckID, options, parent=''):
+        entry = QueueEntry(url, quizletDeckID, options, parent)
+        self.entries.append(entry)
+        return entry
+
+    def active(self):
+        return [e for e in self.entries if e.state in (listing, running)]
+
+    def busy(self):
+        return any(e.state in (pending, listing, running) for e in self.entries)
+
+    def queued(self, quizletDeckID):
+        return any(e.quizletDeckID == quizletDeckID and e.state in (pending, running, done) for e in self.entries)
+
+    def readListing(self, entry):
+        entry.listing = SetListing(entry.url, entry.quizletDeckID, config=self.config,
+                                   workers=self.config.get("fetch_workers", 2))
+        entry.thread = threading.Thread(target=entry.listing.fetch, name="quizlet-queue-listing", daemon=True)
+        entry.thread.start()
+
+    def expandListing(self, entry):
+        # the listing's sets take its place in the queue, in listing order
+        fetched = entry.listing
+        if fetched.error:
+            entry.state = failed
+            entry.message = fetched.errorMessage or "error {0}".format(fetched.errorCode)
+            return
+        index = self.entries.index(entry)
+        sets = [QueueEntry(deckUrl(id), id, entry.options, fetched.name)
+                for id in fetched.ids if not self.queued(id)]
+        self.entries[index:index + 1] = sets
+
+    def startNext(self):
+        for entry in list(self.entries):
+            if len(self.active()) >= self.concurrency:
+                return
+            if entry.state != pending:
+                continue
+
+            if entry.quizletDeckID in listing_kinds:
+                entry.state = listing
+                self.readListing(entry)
+                continue
+
+            if self.pipeline is None:
+                self.pipeline = self.makePipeline(entry.options)
+                self.options = entry.options
+            elif entry.options != self.options:
+                # keeps the queue order, this one waits for a pipeline with its options
+                return
+            entry.job = self.makeJob(entry)
+            entry.state = running
+            self.pipeline.add(entry.job)
+
+    # called by the timer on the main thread
+    def tick(self):
+        for entry in self.active():
+            if entry.state == listing and not entry.thread.is_alive():
+                self.expandListing(entry)
+
+        if self.pipeline:
+            self.pipeline.pump()
+            for entry in self.active():
+                if entry.state != running or not entry.job.done:
+                    continue
+                job = entry.job
+                if entry.cancelling:
+                    entry.state = cancelled
+                elif job.error:
+                    entry.state = failed
+                    entry.message = job.errorMessage or "error {0}".format(job.errorCode)
+                else:
+                    entry.state = done
+                if self.finished:
+                    self.finished(entry)
+            if not any(e.state == running for e in self.entries):
+                self.pipeline.stop()
+                self.pipeline = None
+
+        self.startNext()
+        if not self.busy() and self.drained:
+            self.drained()
+
+    def cancel(self, entry):
+        if entry.state in (pending, listing):
+            entry.state = cancelled
+        elif entry.state == running:
+            # the pipeline drops it at the next stage, notes already written stay
+            entry.cancelling = True
+            entry.job.error = True
+            entry.job.errorMessage = "Cancelled"
+
+    def retry(self, entry):
+        if entry.state in (failed, cancelled):
+            entry.state = pending
+            entry.job = None
+            entry.cancelling = False
+            entry.message = ""
+
+    def move(self, entry, step):
+        index = self.entries.index(entry)
+        target = min(max(index + step, 0), len(self.entries) - 1)
+        self.entries.insert(target, self.entries.pop(index))
+
+    def clearFinished(self):
+        self.entries = [e for e in self.entries if e.state in (pending, listing, running)]
+
+
+class QueuePanel(QWidget):
+    columns = ["Set", "Status"]
+
+    def __init__(self, queue, parent=None):
+        super(QueuePanel, self).__init__(parent)
+        self.queue = queue
+
+        self.table = QTableWidget(0, len(self.columns), self)
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.verticalHeader().hide()
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents)
+        self.table.setMinimumHeight(150)
+
+        buttons = QHBoxLayout()
+        for label, action in (("Up", lambda: self.moveSelected(-1)), ("Down", lambda: self.moveSelected(1)),
+                              ("Retry", lambda: self.eachSelected(self.queue.retry)),
+                              ("Cancel", lambda: self.eachSelected(self.queue.cancel)),
+                              ("Clear finished", self.clearFinished)):
+            button = QPushButton(label, self)
+            button.clicked.connect(action)
+            buttons.addWidget(button)
+        buttons.addStretch()
+
+        box = QVBoxLayout()
+        box.setContentsMargins(0, 0, 0, 0)
+        box.addWidget(QLabel("Import queue:", self))
+        box.addWidget(self.table)
+        box.addLayout(buttons)
+        self.setLayout(box)
+
+        # ticks only while the queue has work
+        self.timer = QTimer(self)
+        self.timer.setInterval(100)
+        self.timer.timeout.connect(self.onTick)
+
+    def start(self):
+        self.show()
+        self.refresh()
+        self.timer.start()
+
+    def onTick(self):
+        self.queue.tick()
+        self.refresh()
+        if not self.queue.busy():
+            self.timer.stop()
+
+    def selectedEntries(self):
+        rows = sorted(set(index.row() for index in self.table.selectionModel().selectedRows()))
+        return [self.queue.entries[row] for row in rows if row < len(self.queue.entries)]
+
+    def eachSelected(self, action):
+        for entry in self.selectedEntries():
+            action(entry)
+        self.start()
+
+    def moveSelected(self, step):
+        entries = self.selectedEntries()
+        for entry in (entries if step < 0 else reversed(entries)):
+            self.queue.move(entry, step)
+        self.refresh()
+        self.table.clearSelection()
+        for entry in entries:
+            self.table.selectionModel().select(
+                self.table.model().index(self.queue.entries.index(entry), 0),
+                QItemSelectionModel.SelectionFlag.Select | QItemSelectionModel.SelectionFlag.Rows)
+
+    def clearFinished(self):
+        self.queue.clearFinished()
+        self.table.clearSelection()
+        self.refresh()
+
+    def refresh(self):
+        entries = self.queue.entries
+        self.table.setRowCount(len(entries))
+        for row, entry in enumerate(entries):
+            for column, text in enumerate((entry.name(), entry.status())):
+                cell = self.table.item(row, column)
+                if cell is None:
+                    self.table.setItem(row, column, QTableWidgetItem(text))
+                elif cell.text() != text:
+                    cell.setText(text)
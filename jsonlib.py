@@ -0,0 +1,49 @@
+# -------------------------------------------------------------------------------
+#
+# JSON decoding for set pages, webapi responses and the deck cache
+#
+# Goes through orjson when it can be imported (Anki ships it) and through the
+# standard library otherwise. loads() takes str or bytes, so webapi responses
+# are decoded straight from the response body. Whatever orjson refuses (NaN,
+# integers past 64 bits, lone surrogates) is handed to the standard library,
+# so both backends give the same objects for every payload.
+#
+# -------------------------------------------------------------------------------
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+backend = "orjson" if orjson else "json"
+
+
+def useBackend(name):
+    # "auto", "orjson" or "json"; __jsonbench__.py switches between them
+    global backend
+    if name == "auto":
+        name = "orjson" if orjson else "json"
+    if name not in ("orjson", "json") or (name == "orjson" and not orjson):
+        raise ValueError("json backend {0} is not available".format(name))
+    backend = name
+
+
+def loads(data):
+    if backend == "orjson":
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+def dumps(obj):
+    # compact utf-8 bytes
+    if backend == "orjson":
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
@@ -0,0 +1,124 @@
+# -------------------------------------------------------------------------------
+#
+# Builds imported decks into an .apkg off the live collection and hands it to
+# Anki's own package importer
+#
+# The pipeline runs against a throwaway collection on a worker thread, so the
+# note type, notes and media all end up in one package; the native importer
+# then adds it to the real collection in a single backend operation instead of
+# one add_note() per card on the main thread.
+#
+# -------------------------------------------------------------------------------
+
+import os
+import copy
+import shutil
+import tempfile
+import threading
+
+from anki.collection import (Collection, ExportAnkiPackageOptions, NoteIdsLimit,
+                             ImportAnkiPackageRequest, ImportAnkiPackageOptions)
+
+try:
+    from .pipeline import ImportPipeline
+except ImportError:
+    from pipeline import ImportPipeline
+
+
+# adds a note type from another collection under its original id, the importer matches
+# note types by id and would add a second "Basic Quizlet Extended" otherwise
+def copyNotetype(col, notetype):
+    notetype = copy.deepcopy(notetype)
+    originalId = notetype["id"]
+    notetype["id"] = 0
+    newId = col.models.add_dict(notetype).id
+
+    # the backend always picks a fresh id, fine to rewrite it in a throwaway collection
+    for table, column in (("notetypes", "id"), ("fields", "ntid"), ("templates", "ntid")):
+        col.db.execute("update {0} set {1} = ? where {1} = ?".format(table, column), originalId, newId)
+
+
+class PackageBuilder(object):
+    # options are passed on to ImportPipeline (downloadAudio, addReverse, skipErrors, workers)
+
+    def __init__(self, jobs, config=None, notetype=None, **options):
+        self.jobs = jobs
+        self.config = config or {}
+        # the live "Basic Quizlet Extended", copied with its id so the importer reuses it
+        self.notetype = notetype
+        self.options = options
+        self.folder = tempfile.mkdtemp(prefix="quizlet-apkg-")
+        self.path = os.path.join(self.folder, "import.apkg")
+        self.pipeline = None
+        self.notes = 0
+        self.exception = None
+        self.cancelled = False
+
+    def build(self):
+        col = Collection(os.path.join(self.folder, "collection.anki2"))
+        try:
+            if self.notetype:
+                copyNotetype(col, self.notetype)
+
+            self.pipeline = ImportPipeline(col, self.config, **self.options)
+            if self.cancelled:
+                self.pipeline.cancel()
+            for job in self.jobs:
+                self.pipeline.add(job)
+            self.pipeline.run()
+
+            noteIds = col.find_notes("")
+            self.notes = len(noteIds)
+            if noteIds:
+                trace = self.jobs[0].trace
+                with trace.phase("package", notes=len(noteIds)):
+                    col.export_anki_package(
+                        out_path=self.path,
+                        options=ExportAnkiPackageOptions(with_scheduling=False, with_deck_configs=False,
+                                                         with_media=True, legacy=False),
+                        limit=NoteIdsLimit(note_ids=noteIds))
+        except Exception as e:
+            self.exception = e
+        finally:
+            col.close()
+
+    def cancel(self):
+        self.cancelled = True
+        if self.pipeline:
+            self.pipeline.cancel()
+
+    # builds on a worker thread, poll() and progress(job) are called on the calling thread meanwhile
+    def run(self, poll=None, progress=None):
+        thread = threading.Thread(target=self.build, name="quizlet-package", daemon=True)
+        thread.start()
+
+        seen = {}
+        while thread.is_alive():
+            thread.join(0.05)
+            if poll:
+                poll()
+            if progress:
+                for job in self.jobs:
+                    state = (job.count, job.done)
+                    if seen.get(job) != state:
+                        seen[job] = state
+                        progress(job)
+
+        if self.exception:
+            raise self.exception
+        return self.notes and self.path
+
+    def cleanup(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+# adds a package to the collection through anki's importer, returns the import log
+def importPackage(col, path, trace=None):
+    request = ImportAnkiPackageRequest(
+        package_path=path,
+        options=ImportAnkiPackageOptions(merge_notetypes=True, with_scheduling=False,
+                                         with_deck_configs=False))
+    if trace is None:
+        return col.import_anki_package(request).log
+    with trace.phase("native import"):
+        return col.import_anki_package(request).log
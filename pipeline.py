@@ -0,0 +1,764 @@
+# -------------------------------------------------------------------------------
+#
+# Staged import pipeline: fetch -> extract -> map -> media -> write
+#
+# Every stage runs in its own thread(s) and hands work to the next one through
+# a bounded queue, so a slow stage blocks the ones before it instead of
+# letting pages and items pile up. Memory is accounted against a budget that
+# is enforced when a deck is admitted to the fetch stage; the reservation then
+# travels with the deck (page -> raw items -> mapped chunks) and is released
+# when the notes are written. Media files of all chunks in the stage share
+# one priority queue (term audio, definition audio, images) with optional
+# per-kind byte and time budgets; files are downloaded into a staging folder
+# and added to the collection's media by the write stage. A file that fails
+# doesn't hold up its chunk: once the deck's notes are written, a retry pass
+# tries again with growing pauses, switching between the proxy and the direct
+# route, and fills it into the note. The write stage runs
+# on the calling thread, since the collection may only be touched from there. Chunks are written
+# in deck order, each with its media complete and as one undo step, and are in
+# the collection as soon as they're written; chunkWritten lets the caller show
+# them while the rest of the deck is still coming. With processes set,
+# json decoding and mapping of every page run in a process pool instead of
+# competing for the GIL with the UI and the downloads.
+#
+# -------------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import queue
+import shutil
+import tempfile
+import itertools
+import threading
+import requests
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from .timing import ImportTrace
+    from .quizlet import (QuizletFetcher, mapItems, extractTitle, extractAndMap, isPasswordProtected,
+                          filterItems, itemMedia, mediaFields, media_kinds, downloadStaged, downloadOnce,
+                          preferProxy, stagingFolder, addMediaFile, addItemNote, prepareDeck)
+    from .cache import contentHash
+    from .duplicates import DuplicateIndex, duplicate_tag
+except ImportError:
+    from timing import ImportTrace
+    from quizlet import (QuizletFetcher, mapItems, extractTitle, extractAndMap, isPasswordProtected,
+                         filterItems, itemMedia, mediaFields, media_kinds, downloadStaged, downloadOnce,
+                         preferProxy, stagingFolder, addMediaFile, addItemNote, prepareDeck)
+    from cache import contentHash
+    from duplicates import DuplicateIndex, duplicate_tag
+
+# write queue index of the files the retry pass recovered for a job
+retried_chunk = -1
+
+# decoded studiable items take roughly this many times the size of their json text
+decoded_factor = 4
+# reservation for a page we haven't seen yet
+default_page_size = 1024 * 1024
+
+
+def missingFile(item, kind, url, suffix, fallback, error):
+    # a file a note went without, what the next sync needs to download it and fill it in
+    return {"item": item["id"], "kind": kind, "url": url, "suffix": suffix, "fallback": fallback,
+            "shape": item.get("shape"), "error": error}
+
+
+class MemoryBudget(object):
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, size, cancelled=None):
+        with self.cond:
+            # a payload larger than the whole budget still goes through once nothing else is held
+            while self.used and self.used + size > self.limit:
+                if cancelled and cancelled.is_set():
+                    return False
+                self.cond.wait(0.1)
+            self.used += size
+            self.peak = max(self.peak, self.used)
+            return True
+
+    def adjust(self, size, cancelled=None, held=None):
+        # a growth waits while it doesn't fit and held() says that something it waits for is
+        # still held and will be released, otherwise it goes through at once
+        with self.cond:
+            while size > 0 and held and self.used + size > self.limit and held():
+                if cancelled and cancelled.is_set():
+                    break
+                self.cond.wait(0.1)
+            self.used += size
+            self.peak = max(self.peak, self.used)
+            if size < 0:
+                self.cond.notify_all()
+
+    def release(self, size):
+        self.adjust(-size)
+
+
+class MediaChunk(object):
+    # a chunk in the media stage, handed to the write stage when its last file is in
+
+    def __init__(self, job, index, chunk, size, tasks):
+        self.job = job
+        self.index = index
+        self.chunk = chunk
+        self.size = size
+        # {kind: file name} of every item
+        self.files = [{} for item in chunk]
+        self.remaining = tasks
+        self.lock = threading.Lock()
+
+    def taskDone(self):
+        with self.lock:
+            self.remaining -= 1
+            return self.remaining == 0
+
+
+class ImportJob(object):
+    # one deck going through the pipeline, carries the same error fields as QuizletFetcher
+
+    def __init__(self, quizletDeckID, url, html='', trace=None, startPhrase='', stopPhrase='', parent='',
+                 selected=None):
+        self.quizletDeckID = quizletDeckID
+        self.url = url
+        self.html = html
+        self.trace = trace or ImportTrace(str(quizletDeckID))
+        self.startPhrase = startPhrase
+        self.stopPhrase = stopPhrase
+        # sets of a folder, class or user go into a subdeck of this deck
+        self.parent = parent
+        # ids of the items picked in the preview, None for all
+        self.selected = selected
+
+        self.title = None
+        self.proxy = False
+        self.api = False
+        self.reserved = 0
+        self.total = 0
+        self.chunks = None
+        self.written = 0
+        self.count = 0
+        # seconds from the start until the first chunk of notes was in the collection
+        self.firstChunk = None
+        self.deckId = None
+        # mapped items when they come from the deck cache or the preview, the source hash and lastModified otherwise
+        self.items = None
+        self.contentHash = None
+        self.modified = None
+        # (item, note guid) of every note written, for subscriptions
+        self.notes = []
+        # missingFile() of the files left out by the media budgets, kept like the failed ones
+        self.deferred = []
+        # cards another set of the same import already had, see duplicates.py
+        self.duplicates = 0
+        # start of its fetch and the bytes downloaded per kind, for the media limits
+        self.started = None
+        self.mediaBytes = dict((kind, 0) for kind in media_kinds)
+        self.mediaCounted = set()
+        # (item, kind, url, suffix, fallback, error) of files that failed, for the retry pass
+        self.retrying = []
+        self.retried = False
+        # what still failed after it, saved with the subscription for a repair by the next sync
+        self.failed = []
+        self.pending = {}
+        self.closed = False
+        self.done = False
+
+        self.error = False
+        self.errorCode = None
+        self.errorCaptcha = False
+        self.errorReason = None
+        self.errorMessage = None
+
+    def deckName(self):
+        return "{0}::{1}".format(self.parent, self.title) if self.parent else self.title
+
+
+class ImportPipeline(object):
+
+    def __init__(self, col, config=None, downloadAudio=True, addReverse=False, skipErrors=False,
+                 budget=None, fetchWorkers=2, mediaWorkers=4, queueSize=8, chunkSize=20, cache=None,
+                 processes=0, prefetched=None, chunkWritten=None, staging=None, selectDeck=True):
+        self.col = col
+        self.cache = cache
+        # extract + map in this many processes, 0 keeps them on a thread
+        self.processes = processes
+        self.pool = None
+        # downloads land here, the write stage adds them to the collection's media. a worker
+        # process (worker.py) downloads into its parent's folder and leaves it to the parent
+        self.ownStaging = staging is None
+        self.staging = staging or tempfile.mkdtemp(prefix="quizlet-media-")
+        # staged file name -> name in the collection's media
+        self.registered = {}
+        self.config = config or {}
+        self.downloadAudio = downloadAudio
+        # job.proxy marks the second attempt, which is the direct one when the proxy goes first
+        self.proxyFirst = preferProxy(self.config)
+        self.addReverse = addReverse
+        self.skipErrors = skipErrors
+        self.budget = MemoryBudget(budget or self.config.get("memory_budget_mb", 256) * 1024 * 1024)
+        self.fetchWorkers = fetchWorkers
+        self.mediaWorkers = mediaWorkers
+        self.chunkSize = chunkSize
+        # called with the job on the calling thread after each chunk of notes
+        self.chunkWritten = chunkWritten
+        # an import in the background doesn't switch the user's current deck
+        self.selectDeck = selectDeck
+        # every chunk is one step of the collection's undo (older anki: no undo steps)
+        self.undoSteps = hasattr(col, "add_custom_undo_entry")
+        self.jobs = []
+        self.cancelled = threading.Event()
+        self.pageSize = default_page_size
+        # (url, suffix) -> path of files a Prefetch already downloaded
+        self.prefetched = prefetched or {}
+        # shared by all jobs and media workers, a url is downloaded once per run
+        self.download = downloadOnce(self.downloadFile)
+        # cards of every set this pipeline imports, for duplicate_policy
+        self.duplicateIndex = DuplicateIndex(self.config.get("duplicate_policy", "off"))
+        # files of at most queueSize chunks wait in the priority queue
+        self.mediaTasks = queue.PriorityQueue()
+        self.mediaSlots = threading.Semaphore(queueSize)
+        self.taskOrder = itertools.count()
+        # per kind limits of each job (0 or missing for none): MB downloaded, seconds since its fetch
+        self.mediaLimits = self.config.get("media_limit_mb", {})
+        self.mediaDeadlines = self.config.get("media_deadline_seconds", {})
+        self.mediaLock = threading.Lock()
+
+        self.fetchQueue = queue.Queue()
+        self.extractQueue = queue.Queue(queueSize)
+        self.mapQueue = queue.Queue(queueSize)
+        self.mediaQueue = queue.Queue(queueSize)
+        self.writeQueue = queue.Queue(queueSize)
+        self.retryQueue = queue.Queue()
+
+    def add(self, job):
+        self.jobs.append(job)
+        self.fetchQueue.put(job)
+        return job
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def fetcher(self, job):
+        return QuizletFetcher(job.url, job.quizletDeckID, job.html, config=self.config, trace=job.trace)
+
+    def put(self, q, message):
+        # bounded put that gives up on cancel instead of blocking forever
+        while not self.cancelled.is_set():
+            try:
+                q.put(message, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def finish(self, job):
+        # tells the write stage that no (more) chunks are coming for this job
+        self.budget.release(job.reserved)
+        job.reserved = 0
+        if job.chunks is None:
+            job.chunks = 0
+        self.put(self.writeQueue, (job, None, None, 0))
+
+    # fetch: page html, through the proxy on the second attempt (the first one when it's the
+    # preferred route), webapi as last resort
+    def fetchStage(self):
+        while not self.cancelled.is_set():
+            job = self.fetchQueue.get()
+            if job is None:
+                return
+            if job.error:
+                # cancelled from the import queue before its page came in
+                self.finish(job)
+                continue
+            if job.started is None:
+                job.started = time.perf_counter()
+
+            if not job.reserved:
+                job.reserved = self.pageSize * (1 + decoded_factor)
+                if not self.budget.acquire(job.reserved, self.cancelled):
+                    return
+
+            if job.items is not None:
+                # already mapped by the preview
+                self.put(self.mapQueue, (job, None, None))
+                continue
+
+            fetcher = self.fetcher(job)
+            if job.api:
+                self.fetchApi(job, fetcher)
+                continue
+            if self.cache and not job.html and not job.proxy and self.cachedDeck(job, fetcher):
+                continue
+
+            try:
+                with job.trace.profiled():
+                    page_html = fetcher.fetchPage(job.proxy != self.proxyFirst)
+            except requests.HTTPError as e:
+                if not job.proxy:
+                    job.proxy = True
+                    self.fetchQueue.put(job)
+                    continue
+                fetcher.httpError(e)
+                job.errorCode = fetcher.errorCode
+                job.errorCaptcha = fetcher.errorCaptcha
+                self.fetchApi(job, fetcher)
+                continue
+            except Exception as e:
+                if not job.proxy and not job.html:
+                    job.proxy = True
+                    self.fetchQueue.put(job)
+                    continue
+                self.fetchApi(job, fetcher)
+                continue
+
+            size = len(page_html) * (1 + decoded_factor)
+            self.budget.adjust(size - job.reserved)
+            job.reserved = size
+            self.pageSize = max(self.pageSize, len(page_html))
+
+            self.put(self.extractQueue, (job, page_html))
+
+    def cachedDeck(self, job, fetcher):
+        # a set with the same lastModified as in the cache is mapped from there, no page fetch.
+        # the set's webapi lastModified is what every cache entry and subscription keeps
+        try:
+            job.modified = fetcher.fetchModified()
+        except Exception:
+            return False
+        cached = self.cache.get(job.quizletDeckID)
+        if not cached or job.modified != cached["modified"]:
+            return False
+
+        job.title = cached["title"]
+        job.items = cached["items"]
+        self.put(self.mapQueue, (job, None, None))
+        return True
+
+    def fetchApi(self, job, fetcher):
+        # the page routes failed, the job keeps the page error code if this fails too
+        fetcher.apiText = ''
+        try:
+            with job.trace.profiled():
+                studiableItems, job.title = fetcher.fetchApi()
+        except Exception as e:
+            fetcher.apiError(e)
+            job.error = True
+            job.errorMessage = fetcher.errorMessage
+            return self.finish(job)
+
+        job.contentHash = contentHash(fetcher.apiText)
+        self.put(self.mapQueue, (job, studiableItems, None))
+
+    # extract: regex + json decoding, the page is dropped as soon as the items are out
+    def extractStage(self):
+        while not self.cancelled.is_set():
+            message = self.extractQueue.get()
+            if message is None:
+                return
+            job, page_html = message
+            fetcher = self.fetcher(job)
+
+            if isPasswordProtected(page_html):
+                if not job.proxy:
+                    job.proxy = True
+                    self.fetchQueue.put(job)
+                    continue
+                job.error = True
+                job.errorCode = 403
+                self.finish(job)
+                continue
+
+            job.contentHash = contentHash(page_html)
+            cached = self.cache.get(job.quizletDeckID) if self.cache else None
+            try:
+                if cached and cached["hash"] == job.contentHash:
+                    # same page as last time, nothing to parse
+                    job.items = cached["items"]
+                    if job.modified and job.modified != cached["modified"]:
+                        # the next import takes it from the cache without the page
+                        self.cache.put(job.quizletDeckID, cached["title"], job.contentHash, job.modified, job.items)
+                    job.modified = job.modified or cached["modified"]
+                    studiableItems = setIdToDiagramImage = None
+                elif self.pool:
+                    with job.trace.phase("extract", process=True):
+                        job.items, title = self.pool.submit(extractAndMap, page_html, job.url).result()
+                    if self.cache:
+                        self.cache.put(job.quizletDeckID, title, job.contentHash, job.modified, job.items)
+                    studiableItems = setIdToDiagramImage = None
+                else:
+                    with job.trace.profiled():
+                        studiableItems, setIdToDiagramImage = fetcher.parsePage(page_html)
+                    if studiableItems is None:
+                        # a page layout the extraction doesn't know, the webapi may still have the set
+                        raise ValueError("No cards found in the page")
+                job.title = extractTitle(page_html, job.url)
+            except Exception as e:
+                if not job.proxy and not job.html:
+                    job.proxy = True
+                else:
+                    job.api = True
+                    job.errorMessage = "{}\n-----------------\n{}".format(e, page_html)
+                self.fetchQueue.put(job)
+                continue
+
+            pageSize = len(page_html)
+            del page_html
+            self.budget.release(pageSize)
+            job.reserved -= pageSize
+
+            self.put(self.mapQueue, (job, studiableItems, setIdToDiagramImage))
+
+    # map: filtered, mapped items in fixed size chunks, in deck order
+    def mapStage(self):
+        while not self.cancelled.is_set():
+            message = self.mapQueue.get()
+            if message is None:
+                return
+            job, studiableItems, setIdToDiagramImage = message
+
+            index = 0
+            chunk = []
+            items = job.items
+            try:
+                with job.trace.profiled(), job.trace.phase(
+                        "map", items=len(studiableItems if items is None else items), cached=items is not None):
+                    if items is None:
+                        items = mapItems(studiableItems, setIdToDiagramImage)
+                        if self.cache:
+                            self.cache.put(job.quizletDeckID, job.title, job.contentHash, job.modified, items)
+                    job.total = len(items)
+                    job.items = None
+
+                    for item in filterItems(items, job.startPhrase, job.stopPhrase):
+                        if job.selected is not None and item["id"] not in job.selected:
+                            continue
+                        self.duplicateIndex.add(job.quizletDeckID, item)
+                        chunk.append(item)
+                        if len(chunk) >= self.chunkSize:
+                            self.putChunk(job, index, chunk)
+                            index += 1
+                            chunk = []
+                if chunk:
+                    self.putChunk(job, index, chunk)
+                    index += 1
+            except Exception as e:
+                # one set the mapping can't read fails alone, the stage goes on with the next
+                job.error = True
+                job.errorMessage = "Can't read the cards of this set: {0}".format(e)
+
+            # the chunks already put still come through the write stage, which drops them
+            job.chunks = index
+            del studiableItems, items
+            self.finish(job)
+
+    def putChunk(self, job, index, chunk):
+        # chunks the media stage finished out of order wait in job.pending for the earlier ones,
+        # over the budget the map stage waits until the job's chunks before this one are written
+        size = sum(sys.getsizeof(v) for item in chunk for v in item.values())
+        self.budget.adjust(size, self.cancelled, lambda: job.written < index and not job.error)
+        self.put(self.mediaQueue, (job, index, chunk, size))
+
+    # media, first part: the files of each chunk go into the priority queue
+    def mediaDispatchStage(self):
+        while not self.cancelled.is_set():
+            if not self.mediaSlots.acquire(timeout=0.1):
+                continue
+            message = self.mediaQueue.get()
+            if message is None:
+                return
+            job, index, chunk, size = message
+
+            tasks = []
+            for i, item in enumerate(chunk):
+                # duplicates have the files of the first card, skipped and linked ones of a written card none
+                source = self.duplicateIndex.mediaItem(job.quizletDeckID, item)
+                if source is not None:
+                    tasks.extend((i,) + media for media in itemMedia(source, self.downloadAudio))
+            mediaChunk = MediaChunk(job, index, chunk, size, len(tasks))
+            if not tasks:
+                self.chunkDone(mediaChunk)
+            for i, kind, url, suffix, fallback in tasks:
+                self.mediaTasks.put((media_kinds.index(kind), next(self.taskOrder),
+                                     (mediaChunk, i, kind, url, suffix, fallback)))
+
+    # media, second part: the workers take the most wanted file of any chunk
+    def mediaStage(self):
+        while not self.cancelled.is_set():
+            priority, order, task = self.mediaTasks.get()
+            if task is None or self.cancelled.is_set():
+                return
+            mediaChunk, i, kind, url, suffix, fallback = task
+            job = mediaChunk.job
+
+            if job.error:
+                pass
+            elif not self.mediaAllowed(job, kind):
+                job.deferred.append(missingFile(mediaChunk.chunk[i], kind, url, suffix, fallback,
+                                                "left out by the media limits"))
+            else:
+                try:
+                    with job.trace.profiled():
+                        file_name = self.download(url, suffix, fallback, job.trace)
+                    mediaChunk.files[i][kind] = file_name
+                    self.countMedia(job, kind, file_name)
+                except Exception as e:
+                    # the note goes without it for now, the retry pass tries again once the job is written
+                    job.retrying.append((mediaChunk.chunk[i], kind, url, suffix, fallback, str(e)))
+
+            if mediaChunk.taskDone():
+                self.chunkDone(mediaChunk)
+
+    def chunkDone(self, mediaChunk):
+        self.put(self.writeQueue, (mediaChunk.job, mediaChunk.index, list(zip(mediaChunk.chunk, mediaChunk.files)),
+                                   mediaChunk.size))
+        self.mediaSlots.release()
+
+    def mediaAllowed(self, job, kind):
+        # the limits count for each set on its own, a queue or folder import doesn't use them up
+        limit = self.mediaLimits.get(kind)
+        if limit and job.mediaBytes[kind] >= limit * 1024 * 1024:
+            return False
+        deadline = self.mediaDeadlines.get(kind)
+        return not deadline or job.started is None or time.perf_counter() - job.started < deadline
+
+    def countMedia(self, job, kind, file_name):
+        # a shared diagram image counts once
+        if not file_name:
+            return
+        with self.mediaLock:
+            if file_name in job.mediaCounted:
+                return
+            job.mediaCounted.add(file_name)
+        try:
+            size = os.path.getsize(os.path.join(self.staging, file_name))
+        except OSError:
+            return
+        with self.mediaLock:
+            job.mediaBytes[kind] += size
+
+    def downloadFile(self, url, suffix, fallback, trace):
+        path = self.prefetched.get((url, suffix))
+        if path and os.path.exists(path):
+            file_name = stagingFolder(url) + "/" + os.path.basename(path)
+            with trace.phase("media", file=file_name, route="prefetched"):
+                os.makedirs(os.path.join(self.staging, stagingFolder(url)), exist_ok=True)
+                shutil.move(path, os.path.join(self.staging, file_name))
+            return file_name
+        return downloadStaged(url, self.staging, suffix, fallback, self.config.get("license", None), trace,
+                              self.config.get("media_timeout_seconds") or None)
+
+    # retry: the files a job couldn't get, once its notes are written. a round per pause of
+    # media_retry_seconds * 2^round, alternating proxy and direct route, then the note is updated
+    def retryStage(self):
+        while not self.cancelled.is_set():
+            job = self.retryQueue.get()
+            if job is None:
+                return
+            recovered = []
+            pause = self.config.get("media_retry_seconds", 2)
+            for round in range(self.config.get("media_retries", 3)):
+                if not job.retrying or self.cancelled.wait(pause * 2 ** round):
+                    break
+                left = []
+                for item, kind, url, suffix, fallback, error in job.retrying:
+                    try:
+                        with job.trace.profiled():
+                            file_name = downloadStaged(url, self.staging, suffix, fallback,
+                                                       self.config.get("license", None), job.trace,
+                                                       self.config.get("media_timeout_seconds") or None,
+                                                       proxy=round % 2 == 0)
+                        recovered.append((item, {kind: file_name}))
+                        self.countMedia(job, kind, file_name)
+                    except Exception as e:
+                        left.append((item, kind, url, suffix, fallback, str(e)))
+                job.retrying = left
+            self.put(self.writeQueue, (job, retried_chunk, recovered, 0))
+
+    def extractWorkers(self):
+        # one thread per process, each waits for its page to come back
+        return max(1, self.processes)
+
+    def start(self):
+        self.threads = []
+        if self.processes:
+            self.pool = ProcessPoolExecutor(self.processes)
+        stages = [(self.fetchStage, self.fetchWorkers), (self.extractStage, self.extractWorkers()),
+                  (self.mapStage, 1), (self.mediaDispatchStage, 1), (self.mediaStage, self.mediaWorkers),
+                  (self.retryStage, 1)]
+        for target, count in stages:
+            for i in range(count):
+                thread = threading.Thread(target=target, name="quizlet-" + target.__name__, daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self):
+        for q, count in [(self.fetchQueue, self.fetchWorkers), (self.extractQueue, self.extractWorkers()),
+                         (self.mapQueue, 1), (self.mediaQueue, 1), (self.retryQueue, 1)]:
+            for i in range(count):
+                try:
+                    q.put_nowait(None)
+                except queue.Full:
+                    self.cancel()
+        for i in range(self.mediaWorkers):
+            # sorts after every file, the workers finish the queue first
+            self.mediaTasks.put((len(media_kinds), next(self.taskOrder), None))
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+        # files of failed or cancelled jobs
+        if self.ownStaging:
+            shutil.rmtree(self.staging, ignore_errors=True)
+
+    def finished(self):
+        return self.cancelled.is_set() or all(job.done for job in self.jobs)
+
+    # write: runs on the calling thread until every job is done, poll() is called while waiting
+    def run(self, poll=None, progress=None):
+        self.start()
+        try:
+            while not self.finished():
+                try:
+                    job, index, chunk, size = self.writeQueue.get(timeout=0.05)
+                except queue.Empty:
+                    if poll:
+                        poll()
+                    continue
+                self.write(job, index, chunk, size)
+                if progress:
+                    progress(job)
+        finally:
+            self.stop()
+
+        return self.jobs
+
+    # write without blocking, for callers driving the pipeline from a timer: writes the chunks
+    # that are ready for at most `limit` seconds and returns whether every job is done
+    def pump(self, progress=None, limit=0.05):
+        deadline = time.perf_counter() + limit
+        while not self.finished() and time.perf_counter() < deadline:
+            try:
+                job, index, chunk, size = self.writeQueue.get_nowait()
+            except queue.Empty:
+                break
+            self.write(job, index, chunk, size)
+            if progress:
+                progress(job)
+        return self.finished()
+
+    def undoStep(self, name):
+        # what's written until the last mergeUndo() is undone in one go
+        return self.col.add_custom_undo_entry(name) if self.undoSteps else None
+
+    def mergeUndo(self, undo):
+        # anki keeps 30 undo steps, merged after every note the entry can't drop out of them
+        if undo is not None:
+            self.col.merge_undo_entries(undo)
+
+    def registerMedia(self, job, chunk):
+        # the chunk's files go into the media database together, a shared file only once
+        names = set(name for item, files in chunk for name in files.values()
+                    if name and name not in self.registered)
+        if not names:
+            return
+        with job.trace.phase("register", files=len(names)):
+            for name in names:
+                path = os.path.join(self.staging, name)
+                if os.path.exists(path):
+                    self.registered[name] = addMediaFile(self.col, path)
+                    os.remove(path)
+                    try:
+                        os.rmdir(os.path.dirname(path))
+                    except OSError:
+                        # the url's other file is still staged
+                        pass
+
+    def write(self, job, index, chunk, size):
+        if index is None:
+            job.closed = True
+        elif index == retried_chunk:
+            self.writeRetried(job, chunk)
+        else:
+            # chunks can come back from the media workers out of order
+            job.pending[index] = (chunk, size)
+
+        while job.written in job.pending:
+            chunk, size = job.pending.pop(job.written)
+            if not job.error:
+                self.writeChunk(job, chunk)
+            self.budget.release(size)
+            job.written += 1
+
+        if job.closed and job.written >= job.chunks and not job.done:
+            if job.retrying and not job.retried and not job.error and not self.skipErrors:
+                # done once the retry pass is back
+                job.retried = True
+                self.retryQueue.put(job)
+                return
+            job.failed = [missingFile(item, kind, url, suffix, fallback, error)
+                          for item, kind, url, suffix, fallback, error in job.retrying]
+            job.done = True
+
+    def writeChunk(self, job, chunk):
+        # the notes of a chunk with their media, in the collection as one undo step
+        undo = self.undoStep("Import {0}, cards {1}-{2}".format(
+            job.deckName(), len(job.notes) + 1, len(job.notes) + len(chunk)))
+        # adding the note type and its notes makes it the current one, which stays the user's in the background
+        current = None if self.selectDeck else self.col.models.current()
+        if job.deckId is None:
+            job.deckId = prepareDeck(self.col, job.deckName(), self.selectDeck)
+        with job.trace.profiled():
+            # skipped and linked duplicates leave their files out of the collection
+            chunk = [(item, files, self.duplicateIndex.claim(job.quizletDeckID, item)) for item, files in chunk]
+            self.registerMedia(job, [(item, files) for item, files, duplicate in chunk
+                                     if not duplicate or self.duplicateIndex.policy == "tag"])
+            style = self.config.get("diagram_style", "highlight")
+            for item, files, duplicate in chunk:
+                self.mergeUndo(undo)
+                if duplicate:
+                    job.duplicates += 1
+                if duplicate and self.duplicateIndex.policy != "tag":
+                    if self.duplicateIndex.policy == "link":
+                        self.duplicateIndex.link(self.col, job.quizletDeckID, duplicate)
+                    # no note of its own, a sync of this set leaves the card alone
+                    job.notes.append((item, None))
+                    continue
+                fields = mediaFields(item, dict((kind, self.registered.get(name))
+                                                for kind, name in files.items()), style)
+                note = addItemNote(self.col, item, fields, self.addReverse, job.deckId, job.trace,
+                                   [duplicate_tag] if duplicate else [])
+                self.duplicateIndex.written(job.quizletDeckID, item, note.id)
+                job.notes.append((item, note.guid))
+                job.count += 1
+        if current and self.col.models.current()["id"] != current["id"]:
+            self.col.models.set_current(current)
+        self.mergeUndo(undo)
+        if job.firstChunk is None:
+            job.firstChunk = time.time() - job.trace.started
+        if self.chunkWritten:
+            self.chunkWritten(job)
+
+    def writeRetried(self, job, recovered):
+        # the files the retry pass got go into the notes written without them
+        guids = dict((item["id"], guid) for item, guid in job.notes)
+        undo = self.undoStep("Import {0}, retried media".format(job.deckName()))
+        with job.trace.profiled():
+            self.registerMedia(job, recovered)
+            style = self.config.get("diagram_style", "highlight")
+            for item, files in recovered:
+                self.mergeUndo(undo)
+                noteId = guids.get(item["id"]) and self.col.db.scalar(
+                    "select id from notes where guid = ?", guids[item["id"]])
+                if not noteId:
+                    continue
+                note = self.col.get_note(noteId)
+                fields = mediaFields(item, dict((kind, self.registered.get(name)) for kind, name in files.items()), style)
+                for name, value in fields.items():
+                    note[name] = value
+                self.col.update_note(note)
+        self.mergeUndo(undo)
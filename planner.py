@@ -0,0 +1,228 @@
+# -------------------------------------------------------------------------------
+#
+# Import planner: what an import would fetch, before a note is added
+#
+# Fetches and maps the sets (from the deck cache when they didn't change, and
+# leaves them there, so the import doesn't fetch them again), applies the
+# start/stop phrases and the duplicate policy and collects the media files
+# the import would download, each once. Their sizes come from the deck cache
+# or from concurrent HEAD requests; a few files are downloaded to measure the
+# throughput, which together with the page fetch times gives an estimate of
+# how long the import takes. The media limits show what they would leave out.
+#
+# -------------------------------------------------------------------------------
+
+import time
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .timing import ImportTrace
+    from .quizlet import QuizletFetcher, httpHead, httpOpen, headers, filterItems, itemMedia, media_kinds
+    from .duplicates import DuplicateIndex
+except ImportError:
+    from timing import ImportTrace
+    from quizlet import QuizletFetcher, httpHead, httpOpen, headers, filterItems, itemMedia, media_kinds
+    from duplicates import DuplicateIndex
+
+# files downloaded to measure the throughput
+throughput_samples = 3
+
+
+def megabytes(size):
+    return "{0:.1f} MB".format(size / 1024.0 / 1024.0)
+
+
+def duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return "{0} min {1} s".format(minutes, seconds) if minutes else "{0} s".format(seconds)
+
+
+class ImportPlan(object):
+
+    def __init__(self, sets, config=None, cache=None, downloadAudio=True, startPhrase='', stopPhrase='',
+                 trace=None):
+        # (quizletDeckID, url, html) of every set, in import order
+        self.sets = sets
+        self.config = config or {}
+        self.cache = cache
+        self.downloadAudio = downloadAudio
+        self.startPhrase = startPhrase
+        self.stopPhrase = stopPhrase
+        self.trace = trace or ImportTrace("plan")
+
+        # one line per set: id, title, cards, duplicates, files, bytes, error
+        self.decks = []
+        # (url, suffix) -> (kind, set id) of every file, as the import downloads them
+        self.media = {}
+        # url -> bytes, None when neither the cache nor a HEAD request knew
+        self.sizes = {}
+        self.pageSeconds = []
+        self.headSeconds = []
+        # bytes/second of one connection, None if no file could be downloaded
+        self.throughput = None
+        self.seconds = None
+
+    def fetchSet(self, quizletDeckID, url, html):
+        # (title, mapped items, error) the way the import gets them
+        fetcher = QuizletFetcher(url, quizletDeckID, html, config=self.config, trace=self.trace)
+        started = time.perf_counter()
+        modified = None
+        if not html:
+            try:
+                modified = fetcher.fetchModified()
+            except Exception:
+                pass
+        cached = self.cache.get(quizletDeckID) if self.cache else None
+        if cached and modified and cached["modified"] == modified:
+            return cached["title"], cached["items"], None
+
+        fetcher.fetch()
+        self.pageSeconds.append(time.perf_counter() - started)
+        if fetcher.error:
+            return None, None, fetcher.errorMessage or "error {0}".format(fetcher.errorCode)
+        title, items = fetcher.results['title'], fetcher.results['items']
+        if self.cache and modified:
+            self.cache.put(quizletDeckID, title, None, modified, items)
+        return title, items, None
+
+    def collect(self, results):
+        duplicates = DuplicateIndex(self.config.get("duplicate_policy", "off"))
+        for (quizletDeckID, url, html), (title, items, error) in zip(self.sets, results):
+            deck = {"id": quizletDeckID, "title": title, "cards": 0, "duplicates": 0, "files": [], "error": error}
+            for item in filterItems(items or [], self.startPhrase, self.stopPhrase):
+                deck["cards"] += 1
+                if duplicates.add(quizletDeckID, item):
+                    deck["duplicates"] += 1
+                source = duplicates.mediaItem(quizletDeckID, item)
+                if source is None:
+                    continue
+                for kind, url, suffix, fallback in itemMedia(source, self.downloadAudio):
+                    key = (url.replace('_m', ''), suffix)
+                    if key not in self.media:
+                        self.media[key] = (kind, quizletDeckID)
+                        deck["files"].append(key)
+            self.decks.append(deck)
+
+    def headSize(self, url):
+        started = time.perf_counter()
+        try:
+            r = httpHead(url, allow_redirects=True, timeout=self.config.get("media_timeout_seconds") or None)
+            size = int(r.headers["Content-Length"]) if r.status_code == 200 and "Content-Length" in r.headers else None
+        except Exception:
+            size = None
+        self.headSeconds.append(time.perf_counter() - started)
+        return url, size
+
+    def measureThroughput(self):
+        # the largest known files, one connection each after another (the same ones in a replay)
+        urls = sorted((url for url, size in self.sizes.items() if size), key=lambda url: (self.sizes[url], url),
+                      reverse=True)
+        rates = []
+        for url in urls[:throughput_samples]:
+            started = time.perf_counter()
+            try:
+                r = httpOpen(url, headers, self.config.get("media_timeout_seconds") or None)
+                latency = time.perf_counter() - started
+                size = len(r.read())
+            except Exception:
+                continue
+            rates.append(size / max(time.perf_counter() - started - latency, 0.001))
+        if rates:
+            self.throughput = statistics.median(rates)
+
+    def kindTotals(self, files=None):
+        # kind -> [files, bytes, files of unknown size] of all files or those of one deck,
+        # unknown sizes count as the kind's average over the whole import
+        known = dict((kind, [0, 0]) for kind in media_kinds)
+        for (url, suffix), (kind, quizletDeckID) in self.media.items():
+            if self.sizes.get(url) is not None:
+                known[kind][0] += 1
+                known[kind][1] += self.sizes[url]
+        totals = dict((kind, [0, 0, 0]) for kind in media_kinds)
+        for url, suffix in (self.media if files is None else files):
+            kind = self.media[(url, suffix)][0]
+            totals[kind][0] += 1
+            if self.sizes.get(url) is None:
+                totals[kind][2] += 1
+            else:
+                totals[kind][1] += self.sizes[url]
+        for kind, total in totals.items():
+            count, size = known[kind]
+            if count and total[2]:
+                total[1] += size * total[2] // count
+        return totals
+
+    def estimate(self):
+        totals = self.kindTotals()
+        size = sum(total[1] for total in totals.values())
+        files = sum(total[0] for total in totals.values())
+        fetchWorkers = max(1, self.config.get("fetch_workers", 2))
+        mediaWorkers = max(1, self.config.get("media_workers", 4))
+        latency = statistics.median(self.headSeconds) if self.headSeconds else 0
+        pages = sum(self.pageSeconds) / fetchWorkers
+        media = (files * latency + (size / self.throughput if self.throughput else 0)) / mediaWorkers
+        self.seconds = pages + media
+        return self.seconds
+
+    def run(self):
+        with self.trace.profiled():
+            with ThreadPoolExecutor(max_workers=max(1, self.config.get("fetch_workers", 2))) as pool:
+                results = list(pool.map(lambda s: self.fetchSet(*s), self.sets))
+            self.collect(results)
+
+            urls = list(set(url for url, suffix in self.media))
+            self.sizes = self.cache.getMediaSizes(urls) if self.cache else {}
+            missing = [url for url in urls if url not in self.sizes]
+            with ThreadPoolExecutor(max_workers=max(1, self.config.get("media_workers", 4))) as pool:
+                for url, size in pool.map(self.headSize, missing):
+                    self.sizes[url] = size
+            if self.cache:
+                self.cache.putMediaSizes(dict((url, size) for url, size in self.sizes.items() if size is not None))
+
+            self.measureThroughput()
+            self.estimate()
+        return self
+
+    def report(self):
+        totals = self.kindTotals()
+        cards = sum(deck["cards"] for deck in self.decks)
+        duplicates = sum(deck["duplicates"] for deck in self.decks)
+        files = sum(total[0] for total in totals.values())
+        size = sum(total[1] for total in totals.values())
+        lines = ["{0} sets, {1} cards{2}, {3} media files, {4}".format(
+            len(self.decks), cards, " ({0} duplicates)".format(duplicates) if duplicates else "", files,
+            megabytes(size))]
+
+        limits = self.config.get("media_limit_mb", {})
+        for kind in media_kinds:
+            count, bytes, unknown = totals[kind]
+            if not count:
+                continue
+            line = "  {0:<16} {1:>6} files {2:>10}".format(kind, count, megabytes(bytes))
+            if unknown:
+                line += ", {0} of unknown size".format(unknown)
+            if limits.get(kind) and bytes > limits[kind] * 1024 * 1024:
+                line += ", about {0} over the {1} MB limit".format(
+                    megabytes(bytes - limits[kind] * 1024 * 1024), limits[kind])
+            lines.append(line)
+
+        if self.throughput:
+            lines.append("Estimated import time: {0} ({1} KB/s per connection, {2} connections)".format(
+                duration(self.seconds), int(self.throughput / 1024), self.config.get("media_workers", 4)))
+        else:
+            lines.append("Estimated import time: unknown, no media file could be downloaded")
+
+        lines.append("")
+        for deck in self.decks:
+            if deck["error"]:
+                lines.append("{0}: {1}".format(deck["id"], deck["error"].splitlines()[0]))
+                continue
+            totals = self.kindTotals(deck["files"])
+            unknown = sum(total[2] for total in totals.values())
+            lines.append("{0}: {1}, {2} cards{3}, {4} files, {5}{6}".format(
+                deck["id"], deck["title"], deck["cards"],
+                " ({0} duplicates)".format(deck["duplicates"]) if deck["duplicates"] else "",
+                len(deck["files"]), megabytes(sum(total[1] for total in totals.values())),
+                ", {0} of unknown size".format(unknown) if unknown else ""))
+        return "\n".join(lines)
@@ -0,0 +1,128 @@
+# -------------------------------------------------------------------------------
+#
+# Speculative fetch of the set whose URL is being entered
+#
+# Started by the importer window once a set URL has been typed or pasted:
+# fetches and maps the set (or takes it from the deck cache when it didn't
+# change), then downloads its media into a temporary folder up to a size
+# limit. An import of the same set takes the items from here and the pipeline
+# moves the files that are already down into the media folder instead of
+# downloading them again. A changed URL discards the prefetch.
+#
+# -------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import threading
+
+try:
+    from .timing import ImportTrace
+    from .quizlet import QuizletFetcher, deckUrl, downloadStaged, downloadOnce, downloadItemMedia
+except ImportError:
+    from timing import ImportTrace
+    from quizlet import QuizletFetcher, deckUrl, downloadStaged, downloadOnce, downloadItemMedia
+
+
+class Prefetch(object):
+
+    def __init__(self, quizletDeckID, config=None, cache=None, downloadAudio=True, trace=None):
+        self.quizletDeckID = quizletDeckID
+        self.config = config or {}
+        self.cache = cache
+        self.downloadAudio = downloadAudio
+        self.trace = trace or ImportTrace(str(quizletDeckID))
+        self.limit = self.config.get("prefetch_media_mb", 50) * 1024 * 1024
+        self.folder = tempfile.mkdtemp(prefix="quizlet-prefetch-")
+        self.cancelled = threading.Event()
+        # whichever of run() and discard() comes last removes the folder
+        self.lock = threading.Lock()
+        self.discarded = False
+        self.finished = False
+        self.thread = None
+
+        self.items = None
+        self.title = None
+        self.modified = None
+        # (url, suffix) of every downloaded file -> its path in self.folder
+        self.media = {}
+        self.size = 0
+        self.error = False
+        self.errorMessage = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="quizlet-prefetch", daemon=True)
+        self.thread.start()
+
+    def fetchItems(self):
+        fetcher = QuizletFetcher(deckUrl(self.quizletDeckID), self.quizletDeckID, '',
+                                 config=self.config, trace=self.trace)
+        try:
+            self.modified = fetcher.fetchModified()
+        except Exception:
+            pass
+
+        cached = self.cache.get(self.quizletDeckID) if self.cache else None
+        if cached and self.modified and cached["modified"] == self.modified:
+            self.title, self.items = cached["title"], cached["items"]
+            return
+
+        fetcher.fetch()
+        if fetcher.error:
+            self.error = True
+            return
+        self.title = fetcher.results['title']
+        self.items = fetcher.results['items']
+        if self.cache and self.modified:
+            self.cache.put(self.quizletDeckID, self.title, None, self.modified, self.items)
+
+    def fileDownloader(self, url, suffix, fallback):
+        if self.cancelled.is_set() or self.size >= self.limit:
+            return None
+        try:
+            file_name = downloadStaged(url, self.folder, suffix, fallback,
+                                       self.config.get("license", None), self.trace,
+                                       self.config.get("media_timeout_seconds") or None)
+        except Exception:
+            # left to the import, which reports it
+            return None
+        path = os.path.join(self.folder, file_name)
+        self.size += os.path.getsize(path)
+        self.media[(url, suffix)] = path
+        return file_name
+
+    def run(self):
+        try:
+            with self.trace.profiled():
+                self.fetchItems()
+                # a diagram's image is shared by all its cards, downloaded and counted once
+                download = downloadOnce(self.fileDownloader)
+                for item in self.items or []:
+                    if self.cancelled.is_set() or self.size >= self.limit:
+                        break
+                    downloadItemMedia(item, download, self.downloadAudio)
+        except Exception as e:
+            self.error = True
+            self.errorMessage = str(e)
+        finally:
+            with self.lock:
+                self.finished = True
+                discarded = self.discarded
+            if discarded:
+                shutil.rmtree(self.folder, ignore_errors=True)
+
+    # stops the media downloads after the current file, the fetch itself runs to the end
+    def cancel(self):
+        self.cancelled.set()
+
+    def done(self):
+        return self.thread is None or not self.thread.is_alive()
+
+    def discard(self):
+        # the folder goes with the thread if it's still running
+        self.cancel()
+        with self.lock:
+            self.discarded = True
+            finished = self.finished or self.thread is None
+        if finished:
+            shutil.rmtree(self.folder, ignore_errors=True)
@@ -0,0 +1,214 @@
+# -------------------------------------------------------------------------------
+#
+# Pre-import preview of a set: a table of its cards to filter and pick from
+#
+# The model only keeps the mapped items and a lowercase search text per item;
+# the view asks for the visible rows only, so big sets scroll smoothly. Items
+# are appended in chunks while the loader thread maps them, and the picked
+# items are imported without fetching or parsing the set again.
+#
+# -------------------------------------------------------------------------------
+
+import re
+from aqt.qt import *
+
+try:
+    from PyQt6.QtCore import pyqtSignal
+except Exception:
+    from PyQt5.QtCore import pyqtSignal
+
+from .quizlet import QuizletFetcher, mapItems, extractTitle, isPasswordProtected
+
+# items handed to the table at once while loading
+preview_chunk = 500
+
+
+def plainText(html):
+    return re.sub(r'\s+', ' ', re.sub(r'<[^>]+>', ' ', html or '')).strip()
+
+
+class ItemTableModel(QAbstractTableModel):
+    columns = ["#", "Term", "Definition", "Media"]
+
+    def __init__(self, parent=None):
+        super(ItemTableModel, self).__init__(parent)
+        self.items = []
+        # search text per item and the item index of every visible row
+        self.text = []
+        self.rows = []
+        self.words = []
+
+    def clear(self):
+        self.beginResetModel()
+        self.items = []
+        self.text = []
+        self.rows = []
+        self.endResetModel()
+
+    def matches(self, text):
+        return all(word in text for word in self.words)
+
+    def appendItems(self, items):
+        start = len(self.items)
+        self.items.extend(items)
+        self.text.extend("{0} {1}".format(plainText(item["term"]), plainText(item["definition"])).lower()
+                         for item in items)
+
+        rows = [i for i in range(start, len(self.items)) if self.matches(self.text[i])]
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(rows) - 1)
+            self.rows.extend(rows)
+            self.endInsertRows()
+
+    def setFilter(self, text):
+        self.beginResetModel()
+        self.words = text.lower().split()
+        self.rows = [i for i, t in enumerate(self.text) if self.matches(t)]
+        self.endResetModel()
+
+    def item(self, row):
+        return self.items[self.rows[row]]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return None
+        item = self.item(index.row())
+        column = index.column()
+        if column == 0:
+            return str(self.rows[index.row()] + 1)
+        if column == 1:
+            return plainText(item["term"])
+        if column == 2:
+            return plainText(item["definition"])
+        return " ".join(name for name, key in (("audio", "termAudio"), ("audio", "definitionAudio"),
+                                                ("image", "imageUrl")) if item.get(key))
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.columns[section]
+        return None
+
+
+class PreviewPane(QWidget):
+
+    def __init__(self, parent=None):
+        super(PreviewPane, self).__init__(parent)
+        self.quizletDeckID = None
+        self.title = None
+        self.model = ItemTableModel(self)
+
+        self.text_filter = QLineEdit("", self)
+        self.text_filter.setPlaceholderText("Filter cards")
+        # filtering waits for a pause in typing
+        self.filterTimer = QTimer(self)
+        self.filterTimer.setSingleShot(True)
+        self.filterTimer.setInterval(150)
+        self.filterTimer.timeout.connect(lambda: self.model.setFilter(self.text_filter.text()))
+        self.text_filter.textChanged.connect(lambda text: self.filterTimer.start())
+
+        self.table = QTableView(self)
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.table.setWordWrap(False)
+        self.table.verticalHeader().hide()
+        # fixed row heights, the view never measures rows it doesn't show
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
+        self.table.setMinimumHeight(250)
+
+        self.label_count = QLabel("", self)
+        self.model.rowsInserted.connect(self.updateCount)
+        self.model.modelReset.connect(self.updateCount)
+        self.table.selectionModel().selectionChanged.connect(self.updateCount)
+
+        box = QVBoxLayout()
+        box.setContentsMargins(0, 0, 0, 0)
+        box.addWidget(self.text_filter)
+        box.addWidget(self.table)
+        box.addWidget(self.label_count)
+        self.setLayout(box)
+
+    def start(self, quizletDeckID):
+        self.quizletDeckID = quizletDeckID
+        self.title = None
+        self.text_filter.clear()
+        self.model.words = []
+        self.model.clear()
+        self.show()
+
+    def updateCount(self, *args):
+        selected = len(self.table.selectionModel().selectedRows())
+        self.label_count.setText("{0} of {1} cards shown, {2} selected{3}".format(
+            len(self.model.rows), len(self.model.items), selected,
+            "" if selected else " (all are imported when nothing is selected)"))
+
+    def selectedIds(self):
+        # ids of the picked items, None for the whole set
+        rows = self.table.selectionModel().selectedRows()
+        if not rows:
+            return None
+        return set(self.model.item(index.row())["id"] for index in rows)
+
+
+class PreviewLoader(QThread):
+    # fetches and maps a set without downloading media, items arrive in chunks
+    itemsMapped = pyqtSignal(list)
+
+    def __init__(self, url, quizletDeckID, html, config=None, cache=None, trace=None):
+        super(PreviewLoader, self).__init__()
+        self.fetcher = QuizletFetcher(url, quizletDeckID, html, config=config, trace=trace)
+        self.quizletDeckID = quizletDeckID
+        self.html = html
+        self.cache = cache
+        self.title = None
+
+        self.error = False
+        self.errorCode = None
+        self.errorCaptcha = False
+        self.errorReason = None
+        self.errorMessage = None
+
+    def emitItems(self, items):
+        for i in range(0, len(items), preview_chunk):
+            self.itemsMapped.emit(items[i:i + preview_chunk])
+
+    def unchanged(self, cached):
+        # the cached deck is shown (and imported) only while the set's lastModified is the same
+        try:
+            return self.fetcher.fetchModified() == cached["modified"]
+        except Exception:
+            return False
+
+    def run(self):
+        cached = self.cache.get(self.quizletDeckID) if self.cache and not self.html else None
+        if cached and self.unchanged(cached):
+            self.title = cached["title"]
+            return self.emitItems(cached["items"])
+
+        with self.fetcher.trace.profiled():
+            try:
+                page_html = self.fetcher.fetchPage()
+                if isPasswordProtected(page_html):
+                    raise ValueError("password protected")
+                studiableItems, setIdToDiagramImage = self.fetcher.parsePage(page_html)
+                self.title = extractTitle(page_html, self.fetcher.url)
+            except Exception:
+                # same fallbacks as an import: proxy, then webapi
+                self.fetcher.fetch()
+                for field in ("error", "errorCode", "errorCaptcha", "errorReason", "errorMessage"):
+                    setattr(self, field, getattr(self.fetcher, field))
+                if not self.error:
+                    self.title = self.fetcher.results['title']
+                    self.emitItems(self.fetcher.results['items'])
+                return
+
+            for i in range(0, len(studiableItems), preview_chunk):
+                self.itemsMapped.emit(mapItems(studiableItems[i:i + preview_chunk], setIdToDiagramImage))
@@ -0,0 +1,922 @@
+# -------------------------------------------------------------------------------
+#
+# Quizlet fetching, parsing and note building.
+#
+# Nothing in here touches aqt, so the same code runs inside Anki (driven by
+# QuizletWindow) and headless against a plain anki Collection (the load
+# harness in __loadtest__.py).
+#
+# -------------------------------------------------------------------------------
+
+import os
+import re
+import ssl
+import hashlib
+import time
+import warnings
+import threading
+import urllib.parse
+import requests
+from http.cookies import SimpleCookie
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import urllib2
+except Exception:
+    import urllib.request as urllib2
+
+try:
+    from .timing import ImportTrace
+    from . import jsonlib
+except ImportError:
+    from timing import ImportTrace
+    import jsonlib
+
+headers = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36"
+}
+
+public_api_key = '0b8aa35d-b521-4fe0-bf0e-2ae07d826acf'
+
+# both can be pointed at a local stand-in server (see __mockserver__.py)
+quizlet_url = "https://quizlet.com"
+proxy_url = "https://quizlet-proxy.proto.click"
+
+# certificate checking is off for our own requests only (corporate tls interception),
+# nothing here is installed globally so other add-ons keep their checks
+_local = threading.local()
+_opener = None
+
+# an HttpRecorder or HttpReplay (httparchive.py) that every request goes through, None for neither
+archive = None
+
+# folder, class and user listings, parseDeckUrl returns one of these instead of a set id
+listing_kinds = ('folder', 'class', 'user')
+
+
+def session():
+    # one keep-alive session per thread, requests sessions aren't thread safe
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+        _local.session.verify = False
+        _local.session.headers.update(headers)
+    return _local.session
+
+
+def unverified(request):
+    # urllib3 warns on every request of the session, the warning is off for the request only
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", requests.packages.urllib3.exceptions.InsecureRequestWarning)
+        return request()
+
+
+def opener():
+    global _opener
+    if _opener is None:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        _opener = urllib2.build_opener(urllib2.HTTPSHandler(context=context))
+    return _opener
+
+
+# add custom model if needed
+def addCustomModel(col):
+
+    # create custom model for imported deck
+    mm = col.models
+    existing = mm.by_name("Basic Quizlet Extended")
+    if existing:
+        return existing
+    m = mm.new("Basic Quizlet Extended")
+
+    # add fields
+    mm.addField(m, mm.newField("FrontText"))
+    mm.addField(m, mm.newField("FrontAudio"))
+    mm.addField(m, mm.newField("BackText"))
+    mm.addField(m, mm.newField("BackAudio"))
+    mm.addField(m, mm.newField("Image"))
+    mm.addField(m, mm.newField("Add Reverse"))
+
+    # add cards
+    t = mm.newTemplate("Normal")
+
+    # front
+    t['qfmt'] = "{{FrontText}}\n<br><br>\n{{FrontAudio}}"
+    t['afmt'] = "{{FrontText}}\n<hr id=answer>\n{{BackText}}\n<br><br>\n{{Image}}\n<br><br>\n{{BackAudio}}"
+    mm.addTemplate(m, t)
+
+    # back
+    t = mm.newTemplate("Reverse")
+    t['qfmt'] = "{{#Add Reverse}}{{BackText}}\n<br><br>\n{{BackAudio}}{{/Add Reverse}}"
+    t['afmt'] = "{{BackText}}\n<hr id=answer>\n{{FrontText}}\n<br><br>\n{{FrontAudio}}\n{{Image}}"
+    mm.addTemplate(m, t)
+
+    mm.add(m)
+    return m
+
+
+def getText(d, text=''):
+    if d is None:
+        return text
+    if d['type'] == 'text':
+        text = d['text']
+        if 'marks' in d:
+            for m in d['marks']:
+                if m['type'] in ['b', 'i', 'u']:
+                    text = '<{0}>{1}</{0}>'.format(m['type'], text)
+                if 'attrs' in m:
+                    attrs = " ".join(['{}="{}"'.format(k, v)
+                                     for k, v in m['attrs'].items()])
+                    text = '<span {}>{}</span>'.format(attrs, text)
+        return text
+    text = ''.join([getText(c) for c in d['content']]
+                   ) if d.get('content') else ''
+    if d['type'] == 'paragraph':
+        text = '<div>{}</div>'.format(text)
+    return text
+
+
+def ankify(text):
+    text = text.replace('\n', '<br>')
+    text = text.replace('class="bgY"', 'style="background-color:#fff4e5;"')
+    text = text.replace('class="bgB"', 'style="background-color:#cde7fa;"')
+    text = text.replace('class="bgP"', 'style="background-color:#fde8ff;"')
+    return text
+
+
+def parseTextItem(item):
+    return getText(item["richText"], item["plainText"])
+
+
+def mapItems(studiableItems, setIdToDiagramImage=None):
+    result = []
+
+    for studiableItem in studiableItems:
+        if studiableItem.get("isDeleted"):
+            continue
+
+        image = None
+        shape = None
+        term = None
+        term_audio = None
+        definition = None
+        definition_audio = None
+
+        for side in studiableItem["cardSides"]:
+            if (side["label"] == "word"):
+                for media in side["media"]:
+                    if media["type"] == 4:
+                        term_audio = media["url"]
+
+                    if media["type"] == 1:
+                        term = parseTextItem(media)
+
+                        if media["ttsUrl"] and term_audio == None:
+                            term_audio = media["ttsUrl"]
+
+            if (side["label"] == "definition"):
+                for media in side["media"]:
+                    if media["type"] == 4:
+                        definition_audio = media["url"]
+
+                    if media["type"] == 1:
+                        definition = parseTextItem(media)
+
+                        if media["ttsUrl"] and definition_audio == None:
+                            definition_audio = media["ttsUrl"]
+
+                    if (media["type"] == 2) and (image == None):
+                        image = media["url"]
+
+            # diagram sets: one base image for the set, the item's label area is a shape on it.
+            # the webapi has no diagram images, its cards come without the diagram
+            if (side["label"] == "location"):
+                for media in side["media"]:
+                    diagram = (setIdToDiagramImage or {}).get(str(studiableItem.get("studiableContainerId")))
+                    if (media["type"] == 5) and (image == None) and diagram:
+                        image = diagram["url"]
+                        shape = {"points": shapePoints(media["shape"]),
+                                 "width": diagram.get("width"), "height": diagram.get("height")}
+
+        mapped = {
+            "id": studiableItem["id"],
+            "term": term,
+            "termAudio": term_audio,
+            "definition": definition,
+            "definitionAudio": definition_audio,
+            "imageUrl": image
+        }
+        if shape:
+            mapped["shape"] = shape
+        result.append(mapped)
+
+    return result
+
+
+def shapePoints(shape):
+    # GeoJSON polygon of a diagram label, in image pixels with y pointing up
+    geometry = jsonlib.loads(shape)["geometry"]
+    ring = geometry["coordinates"][0]
+    if geometry["type"] == "MultiPolygon":
+        ring = ring[0]
+    return [[round(x, 1), round(-y, 1)] for x, y in ring]
+
+
+def diagramHtml(file_name, shape, style='highlight'):
+    # the base image with the item's shape drawn over it, the svg scales with the image
+    if not shape.get("width") or not shape.get("height"):
+        return '<div><img src="{0}"></div>'.format(file_name)
+
+    if style == 'occlude':
+        paint = "fill:#ffeba2;stroke:#2d2d2d;stroke-width:2"
+    else:
+        paint = "fill:rgba(255,82,82,0.35);stroke:#ff5252;stroke-width:3"
+    points = " ".join("{0},{1}".format(x, y) for x, y in shape["points"])
+    return ('<div style="position:relative;display:inline-block">'
+            '<img src="{0}" style="display:block;max-width:100%">'
+            '<svg viewBox="0 0 {1} {2}" preserveAspectRatio="none" '
+            'style="position:absolute;left:0;top:0;width:100%;height:100%">'
+            '<polygon points="{3}" style="{4}"/></svg></div>').format(
+                file_name, shape["width"], shape["height"], points, paint)
+
+
+def parseDeckUrl(url):
+    # returns a deck ID, or one of listing_kinds for folder, class and user sets
+    # URLs. raises ValueError with a message for the user otherwise
+
+    # voodoo needed for some error handling
+    if urllib.parse.urlparse(url).scheme:
+        urlDomain = urllib.parse.urlparse(url).netloc
+    else:
+        urlDomain = urllib.parse.urlparse("https://"+url).netloc
+
+    # validate quizlet URL
+    if url == "":
+        raise ValueError("Oops! You forgot the deck URL :(")
+    elif not "quizlet.com" in urlDomain:
+        raise ValueError("Oops! That's not a Quizlet URL :(")
+
+    # voodoo needed for some error handling
+    if urllib.parse.urlparse(url).scheme:
+        urlPath = urllib.parse.urlparse(url).path
+    else:
+        urlPath = urllib.parse.urlparse("https://"+url).path
+    # validate and set Quizlet deck ID
+    quizletDeckID = urlPath.strip("/")
+
+    if quizletDeckID == "":
+        raise ValueError("Oops! Please use the full deck URL :(")
+    elif re.search(r'user/', quizletDeckID) and re.search(r'/folders', quizletDeckID):
+        match_full = re.match(r'user/[^/]+/folders/[^/]*', quizletDeckID)
+        if not match_full:
+            raise ValueError("Oops! Invalid Folder URL")
+        return 'folder'
+    elif re.match(r'user/[^/]+/sets(/|$)', quizletDeckID):
+        return 'user'
+    elif re.match(r'class/\d+', quizletDeckID):
+        return 'class'
+    elif not bool(re.search(r'\d', quizletDeckID)):
+        raise ValueError(
+            "Oops! No deck ID found in path <i>{0}</i> :(".format(quizletDeckID))
+
+    # get first set of digits from url path
+    return re.search(r"\d+", quizletDeckID).group(0)
+
+
+def deckUrl(quizletDeckID):
+    return "{0}/{1}/flashcards".format(quizlet_url, quizletDeckID)
+
+
+def searchUrl(query, page=1):
+    return "{0}/search?{1}".format(quizlet_url, urllib.parse.urlencode(
+        {"query": query, "type": "sets", "page": page}))
+
+
+def getAudioUrl(word_audio):
+    return word_audio if word_audio.startswith('http') else "{0}/{1}".format(quizlet_url, word_audio)
+
+
+def preferProxy(config):
+    # set pages go through the proxy first when the diagnostics found the direct route blocked
+    return config.get("preferred_route") == "proxy"
+
+
+def getCookies(config):
+    cookies = {}
+
+    if config.get("qlts"):
+        cookies = {"qlts": config["qlts"]}
+    elif config.get("cookies"):
+        C = SimpleCookie()
+        C.load(config["cookies"])
+        cookies = {key: morsel.value for key, morsel in C.items()}
+
+    return cookies
+
+
+def isPasswordProtected(page_html):
+    return bool(re.search(re.escape('window.Quizlet["setPasswordData"]'), page_html))
+
+
+def extractItems(page_html):
+    # returns (studiableItems, setIdToDiagramImage) from one of the page formats quizlet used so far
+    regex = re.escape('window.Quizlet["setPageData"] = ')
+    regex += r'(.+?)'
+    regex += re.escape('; QLoad("Quizlet.setPageData");')
+    m = re.search(regex, page_html)
+
+    studiableItems = None
+    setIdToDiagramImage = None
+
+    if not m:
+        regex = re.escape('window.Quizlet["assistantModeData"] = ')
+        regex += r'(.+?)'
+        regex += re.escape('; QLoad("Quizlet.assistantModeData");')
+        m = re.search(regex, page_html)
+        if m:
+            data = jsonlib.loads(m.group(1).strip())
+            studiableDocumentData = data['studiableDocumentData']
+            setIdToDiagramImage = studiableDocumentData.get(
+                'setIdToDiagramImage', None)
+            studiableItems = studiableDocumentData.get(
+                'studiableItems', studiableDocumentData.get('studiableItem'))
+
+    if not m:
+        regex = re.escape('window.Quizlet["cardsModeData"] = ')
+        regex += r'(.+?)'
+        regex += re.escape('; QLoad("Quizlet.cardsModeData");')
+        m = re.search(regex, page_html)
+        if m:
+            data = jsonlib.loads(m.group(1).strip())
+            studiableDocumentData = data['studiableDocumentData']
+            setIdToDiagramImage = studiableDocumentData.get(
+                'setIdToDiagramImage', None)
+            studiableItems = studiableDocumentData.get(
+                'studiableItems', studiableDocumentData.get('studiableItem'))
+
+    if not m:
+        regex = re.escape('dehydratedReduxStateKey":')
+        regex += r'(.+?)'
+        regex += re.escape('},"__N_SSP')
+        m = re.search(regex, page_html)
+        if m:
+            rawData = m.group(1).strip()
+            data = jsonlib.loads(jsonlib.loads(rawData))
+            studiableItems = data["studyModesCommon"]["studiableData"]["studiableItems"]
+            setIdToDiagramImage = data["studyModesCommon"]["studiableData"]["setIdToDiagramImage"]
+        else:
+            raise Exception("Can't extract data")
+
+    return studiableItems, setIdToDiagramImage
+
+
+def extractTitle(page_html, url):
+    title = os.path.basename(url.strip()) or "Quizlet Flashcards"
+
+    m = re.search(r'<title[^>]*>(.+?)</title>', page_html, re.IGNORECASE | re.DOTALL)
+
+    if m:
+        title = m.group(1)
+        title = re.sub(r' \| Quizlet$', '', title)
+        title = re.sub(r'^Flashcards ', '', title)
+        title = re.sub(r'\s+', ' ', title)
+        title = title.strip()
+
+    return title
+
+
+def extractAndMap(page_html, url):
+    # page -> mapped items and title. Runs in a pool process for
+    # multi-deck imports, only the compact mapped items travel back
+    studiableItems, setIdToDiagramImage = extractItems(page_html)
+    return mapItems(studiableItems, setIdToDiagramImage), extractTitle(page_html, url)
+
+
+def extractSetIds(page_html):
+    # set ids of a folder, class or user sets page: study material entries and set links, in page order
+    ids = []
+    for m in re.finditer(r'"studyMaterialId":"(\d+)"|quizlet\.com\\?/(\d+)\\?/[\w-]*flash-cards', page_html):
+        id = m.group(1) or m.group(2)
+        if id not in ids:
+            ids.append(id)
+    return ids
+
+
+def listingPageUrl(url, page):
+    if page == 1:
+        return url
+    parts = urllib.parse.urlparse(url)
+    query = urllib.parse.parse_qs(parts.query)
+    query["page"] = [str(page)]
+    return parts._replace(query=urllib.parse.urlencode(query, doseq=True)).geturl()
+
+
+def listingName(url, kind, page_html=''):
+    # subdeck name for the sets of a listing: the user name, or the folder/class title
+    path = urllib.parse.urlparse(url if "://" in url else "https://" + url).path.strip("/").split("/")
+    if kind == 'user':
+        return path[1]
+    if re.search(r'<title[^>]*>', page_html or '', re.IGNORECASE):
+        return extractTitle(page_html, url)
+    if kind == 'folder' and len(path) > 3:
+        return path[3].replace("-", " ")
+    if kind == 'class' and len(path) > 2:
+        return path[2].replace("-", " ")
+    return " ".join(path[:2])
+
+
+def httpGet(url, **kwargs):
+    # page, webapi and proxy requests
+    if archive:
+        return archive.get(url, lambda: unverified(lambda: session().get(url, **kwargs)))
+    return unverified(lambda: session().get(url, **kwargs))
+
+
+def httpHead(url, **kwargs):
+    # media sizes for the import planner
+    if archive:
+        return archive.head(url, lambda: unverified(lambda: session().head(url, **kwargs)))
+    return unverified(lambda: session().head(url, **kwargs))
+
+
+def httpOpen(url, headers, timeout=None):
+    # media downloads
+    if archive:
+        return archive.open(url, lambda: opener().open(urllib2.Request(url, headers=headers), timeout=timeout))
+    return opener().open(urllib2.Request(url, headers=headers), timeout=timeout)
+
+
+def download_media (url, file_name, headers, media_dir, timeout=None):
+    r = httpOpen(url, headers, timeout)
+    size = 0
+
+    if r.getcode() == 200:
+        data = r.read()
+        size = len(data)
+        with open(media_dir + "/" + file_name, 'wb') as f:
+            f.write(data)
+    return file_name, size
+
+
+# download the images, retries once through the proxy when fallback is set.
+# proxy goes through the proxy right away (the pipeline's retry pass switches routes)
+def downloadFile(url, media_dir, suffix='', fallback=False, license=None, trace=None, timeout=None, proxy=False):
+    trace = trace or ImportTrace()
+    url = url.replace('_m', '')
+    file_name = "quizlet-" + \
+        suffix if suffix else "quizlet-" + url.split('/')[-1]
+    fallback_call = False;
+    request_headers = headers.copy()
+    if proxy:
+        fallback_call = True
+        url = "{0}/quizlet-media?url={1}".format(proxy_url, urllib.parse.quote(url))
+        request_headers["x-api-key"] = license or public_api_key
+
+    while True:
+        route = "proxy" if fallback_call else "media"
+        started = time.perf_counter()
+        try:
+            with trace.phase("media", file=file_name, route=route):
+                file_name, size = download_media(url, file_name, request_headers, media_dir, timeout)
+            trace.request(url, route, 200, size,
+                          time.perf_counter() - started, int(fallback_call))
+            return file_name
+        except urllib2.HTTPError as e:
+            trace.request(url, route, e.code, 0,
+                          time.perf_counter() - started, int(fallback_call))
+            if fallback and not fallback_call:
+                fallback_call = True
+                url = "{0}/quizlet-media?url={1}".format(proxy_url, urllib.parse.quote(url))
+                request_headers["x-api-key"] = license or public_api_key
+                continue
+            raise e
+
+
+# a staging folder downloads into a folder of its own per url: two urls ending in the same name
+# don't overwrite each other before they're registered, or get the other's media name.
+# returns the file's name in the staging folder
+def downloadStaged(url, staging, suffix='', fallback=False, license=None, trace=None, timeout=None, proxy=False):
+    folder = stagingFolder(url)
+    os.makedirs(os.path.join(staging, folder), exist_ok=True)
+    return folder + "/" + downloadFile(url, os.path.join(staging, folder), suffix, fallback, license, trace,
+                                       timeout, proxy)
+
+
+def stagingFolder(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]
+
+
+# adds a downloaded file to the collection through its media database, so anki doesn't have to
+# find it with a folder scan. returns the name it got: the same name for the same content, the
+# name with the content's sha1 appended when another file already has it
+def addMediaFile(col, path):
+    return col.media.add_file(path)
+
+
+def deckName(result):
+    if "set" in result:
+        return result['set']['title']
+    elif "studyable" in result:
+        return result['studyable']['title']
+    return result['title']
+
+
+# create new deck and custom model, returns the deck id
+def prepareDeck(col, name, select=True):
+    # select=False leaves the current deck and note type alone, for imports in the background
+    deck = col.decks.get(col.decks.id(name))
+    model = addCustomModel(col)
+    if not select:
+        return deck["id"]
+
+    # assign custom model to new deck
+    col.decks.select(deck["id"])
+    col.decks.save(deck)
+
+    # assign new deck to custom model
+    col.models.set_current(model)
+    model["did"] = deck["id"]
+    col.models.save(model)
+
+    return deck["id"]
+
+
+# yields the items between the start and the stop phrase, both included
+def filterItems(items, startPhrase='', stopPhrase=''):
+    startProcess = False
+    stopProcess = False
+
+    for item in items:
+        if "".__eq__(startPhrase) or startPhrase == item["term"] or startPhrase == item["definition"]:
+            startProcess = True
+
+        if not stopProcess and startProcess:
+            yield item
+
+        if not "".__eq__(stopPhrase) and (stopPhrase == item["term"] or stopPhrase == item["definition"]):
+            stopProcess = True
+
+
+# wraps a fileDownloader so every url is downloaded once, e.g. the base image of a diagram
+# set that all its cards share. safe to call from several threads
+def downloadOnce(fileDownloader):
+    lock = threading.Lock()
+    files = {}
+
+    def download(url, suffix, fallback, *args):
+        with lock:
+            if (url, suffix) not in files:
+                files[(url, suffix)] = [threading.Lock(), False, None]
+            entry = files[(url, suffix)]
+        with entry[0]:
+            if not entry[1]:
+                entry[2] = fileDownloader(url, suffix, fallback, *args)
+                entry[1] = True
+            return entry[2]
+
+    return download
+
+
+# media kinds of an item in download order, the term audio is what learners need first.
+# a diagram image is shared by all cards of its diagram and downloaded once with the images
+media_kinds = ("termAudio", "definitionAudio", "image")
+
+
+# the files of one item as (kind, url, file name suffix, proxy fallback)
+def itemMedia(item, downloadAudio=True):
+    media = []
+    if item.get('termAudio') and downloadAudio:
+        media.append(("termAudio", getAudioUrl(item['termAudio']), str(item["id"]) + "-front.mp3", True))
+    if item.get('definitionAudio') and downloadAudio:
+        media.append(("definitionAudio", getAudioUrl(item["definitionAudio"]), str(item["id"]) + "-back.mp3", True))
+    if item.get('imageUrl'):
+        media.append(("image", item["imageUrl"], '', True))
+    return media
+
+
+# the media field values of an item from its downloaded files, {kind: file name}
+def mediaFields(item, files, diagramStyle='highlight'):
+    fields = {}
+    if files.get("termAudio"):
+        fields["FrontAudio"] = "[sound:" + files["termAudio"] + "]"
+    if files.get("definitionAudio"):
+        fields["BackAudio"] = "[sound:" + files["definitionAudio"] + "]"
+    if files.get("image") and item.get('shape'):
+        fields["Image"] = diagramHtml(files["image"], item["shape"], diagramStyle)
+    elif files.get("image"):
+        fields["Image"] = '<div><img src="{0}"></div>'.format(files["image"])
+    return fields
+
+
+# downloads the media of one item, returns the media field values
+def downloadItemMedia(item, fileDownloader, downloadAudio=True, diagramStyle='highlight'):
+    files = {}
+    for kind, url, suffix, fallback in itemMedia(item, downloadAudio):
+        files[kind] = fileDownloader(url, suffix, fallback)
+    return mediaFields(item, files, diagramStyle)
+
+
+def addItemNote(col, item, fields, addReverse=False, deckId=None, trace=None, tags=()):
+    trace = trace or ImportTrace()
+
+    # the note type by name, the current one is the user's when importing in the background
+    if hasattr(col, "new_note"):
+        note = col.new_note(col.models.by_name("Basic Quizlet Extended"))
+    else:
+        note = col.newNote()
+    note["FrontText"] = item["term"]
+    note["BackText"] = item["definition"]
+    note["FrontText"] = ankify(note["FrontText"])
+    note["BackText"] = ankify(note["BackText"])
+
+    for name, value in fields.items():
+        note[name] = value
+
+    if addReverse:
+        note["Add Reverse"] = "True"
+
+    for tag in tags:
+        note.add_tag(tag)
+
+    with trace.phase("note", id=item["id"]):
+        if deckId:
+            col.add_note(note, deckId)
+        else:
+            col.addNote(note)
+
+    return note
+
+
+def createDeck(col, result, fileDownloader, startPhrase='', stopPhrase='', downloadAudio=True,
+               addReverse=False, progress=None, trace=None):
+    # fileDownloader(url, suffix, fallback) returns a media file name or None
+    items = result['items']
+    count = 0
+
+    result['term_count'] = len(items)
+
+    prepareDeck(col, deckName(result))
+    fileDownloader = downloadOnce(fileDownloader)
+
+    for item in filterItems(items, startPhrase, stopPhrase):
+        fields = downloadItemMedia(item, fileDownloader, downloadAudio)
+        addItemNote(col, item, fields, addReverse, trace=trace)
+
+        count += 1
+        if progress:
+            progress(count, len(items))
+
+    return count
+
+
+class RateLimit(object):
+    # spaces out quizlet page/webapi requests over all threads, media downloads aren't limited
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next = 0
+
+    def wait(self, perSecond):
+        if not perSecond:
+            return
+        with self.lock:
+            now = time.perf_counter()
+            at = max(now, self.next)
+            self.next = at + 1.0 / perSecond
+        if at > now:
+            time.sleep(at - now)
+
+
+rate_limit = RateLimit()
+
+
+class QuizletFetcher(object):
+    # downloads and parses a deck (or a folder page), the results and error
+    # fields are read by the caller once fetch() returns
+
+    def __init__(self, url, quizletDeckID, html, config=None, trace=None, onFolder=None):
+        self.url = url
+        self.results = None
+        self.html = html
+        self.quizletDeckID = quizletDeckID
+        self.config = config or {}
+        self.trace = trace or ImportTrace(str(quizletDeckID))
+        self.onFolder = onFolder
+
+        self.error = False
+        self.errorCode = None
+        self.errorCaptcha = False
+        self.errorReason = None
+        self.errorMessage = None
+
+    def get(self, url, route, retries=0, **kwargs):
+        rate_limit.wait(self.config.get("requests_per_second", 0))
+        kwargs.setdefault("timeout", self.config.get("page_timeout_seconds") or None)
+        started = time.perf_counter()
+        with self.trace.phase("fetch", url=url, route=route):
+            r = httpGet(url, **kwargs)
+        self.trace.request(url, route, r.status_code, len(r.content),
+                           time.perf_counter() - started, retries)
+        return r
+
+    def fetchSet(self):
+        # the set's webapi model: title, numTerms, lastModified...
+        r = self.get('{0}/webapi/3.9/sets/{1}'.format(quizlet_url, self.quizletDeckID), "webapi")
+        r.raise_for_status()
+        return jsonlib.loads(r.content)["responses"][0]["models"]["set"][0]
+
+    def fetchModified(self):
+        # the set's lastModified from the webapi, a cheap check before fetching the whole deck
+        return self.fetchSet()["lastModified"]
+
+    def fetchSample(self, count):
+        # the first `count` mapped items, for a preview of a set that isn't imported
+        r = self.get('{0}/webapi/3.9/studiable-item-documents?filters%5BstudiableContainerId%5D={1}&filters%5BstudiableContainerType%5D=1&perPage={2}&page=1'.format(
+            quizlet_url, self.quizletDeckID, count), "webapi")
+        r.raise_for_status()
+        return mapItems(jsonlib.loads(r.content)["responses"][0]["models"]["studiableItem"][:count])
+
+    def fetchApi(self):
+        # returns the raw studiable items and the title from the webapi
+        deckUrl = '{0}/webapi/3.9/sets/{1}'.format(
+            quizlet_url, self.quizletDeckID)
+        # TODO download more than 1000 items
+        itemsUrl = '{0}/webapi/3.9/studiable-item-documents?filters%5BstudiableContainerId%5D={1}&filters%5BstudiableContainerType%5D=1&perPage={2}&page=1'.format(
+            quizlet_url, self.quizletDeckID, 1000)
+
+        deckResponse = self.get(deckUrl, "webapi")
+        itemsResponse = self.get(itemsUrl, "webapi")
+        self.apiText = itemsResponse.text
+
+        with self.trace.phase("extract"):
+            studiableItems = jsonlib.loads(
+                itemsResponse.content)["responses"][0]["models"]["studiableItem"]
+            title = jsonlib.loads(deckResponse.content)["responses"][
+                0]['models']['set'][0]['title']
+
+        return studiableItems, title
+
+    def getDataFromApi(self):
+        self.apiText = ''
+        try:
+            studiableItems, title = self.fetchApi()
+
+            with self.trace.phase("map", items=len(studiableItems)):
+                items = mapItems(studiableItems)
+
+            self.results = {}
+            self.results['items'] = items
+            self.results['title'] = title
+            self.error = False
+        except Exception as e:
+            self.apiError(e)
+
+    def apiError(self, e):
+        self.error = True
+        self.errorMessage = "{}\n-----------------\n{}".format(e, self.apiText)
+
+    def fetchPage(self, proxy=False):
+        # returns the page html, through the proxy if asked. raises requests.HTTPError
+        if self.html and self.quizletDeckID != 'folder':
+            return self.html
+
+        route = '/quizlet-folders' if self.quizletDeckID == 'folder' else '/quizlet-deck'
+        url = self.url if not proxy else proxy_url + route + '?url=' + \
+            urllib.parse.quote(self.url, safe='()*!\'')
+        if self.quizletDeckID != 'folder':
+            print(url)
+
+        r = self.get(url, "proxy" if proxy else "page",
+                     int(proxy), cookies=getCookies(self.config))
+        r.raise_for_status()
+        return r.text
+
+    def parsePage(self, page_html):
+        with self.trace.phase("extract"):
+            return extractItems(page_html)
+
+    def getDataFromPage(self):
+        # True on the first attempt, which is the proxy one when it's the preferred route
+        proxyRetry = True
+        proxyFirst = preferProxy(self.config)
+
+        while True:
+            try:
+                page_html = ''
+                page_html = self.fetchPage(proxyRetry == proxyFirst)
+
+                if self.quizletDeckID == 'folder':
+                    if self.onFolder:
+                        self.onFolder(page_html)
+                else:
+                    if isPasswordProtected(page_html):
+                        if (proxyRetry):
+                            proxyRetry = False
+                            continue
+
+                        self.error = True
+                        self.errorCode = 403
+                        return
+
+                    studiableItems, setIdToDiagramImage = self.parsePage(page_html)
+
+                    self.results = {}
+                    with self.trace.phase("map", items=len(studiableItems)):
+                        self.results['items'] = mapItems(
+                            studiableItems, setIdToDiagramImage)
+
+                    self.results['title'] = extractTitle(page_html, self.url)
+
+            except requests.HTTPError as e:
+                if proxyRetry == True:
+                    proxyRetry = False
+                    continue
+                else:
+                    self.httpError(e)
+            except ValueError as e:
+                if proxyRetry == True:
+                    proxyRetry = False
+                    continue
+                else:
+                    self.error = True
+                    self.errorMessage = "Invalid json1: {0}".format(e)
+            except Exception as e:
+                if proxyRetry == True and not self.html:
+                    proxyRetry = False
+                    continue
+                else:
+                    self.error = True
+                    self.errorMessage = "{}\n-----------------\n{}".format(
+                        e, page_html)
+            break
+        # yep, we got it
+
+    def httpError(self, e):
+        self.error = True
+        self.errorCode = e.response.status_code
+        self.errorMessage = e.response.text
+        if "CF-Chl-Bypass" in e.response.headers:
+            self.errorCaptcha = True
+
+    def fetch(self):
+        with self.trace.profiled():
+            self.getDataFromPage()
+
+            if (self.error):
+                self.getDataFromApi()
+
+
+class SetListing(object):
+    # collects the set ids of a folder, class or user sets listing, page by page.
+    # same error fields as QuizletFetcher, name is used for the subdeck
+
+    def __init__(self, url, kind, config=None, trace=None, workers=4):
+        self.url = url
+        self.kind = kind
+        self.config = config or {}
+        self.trace = trace or ImportTrace(kind)
+        self.workers = workers
+        self.name = listingName(url, kind)
+        self.ids = []
+
+        self.error = False
+        self.errorCode = None
+        self.errorCaptcha = False
+        self.errorReason = None
+        self.errorMessage = None
+
+    def fetchListingPage(self, page):
+        # a listing page goes through the same page -> proxy retry as a folder
+        pages = []
+        fetcher = QuizletFetcher(listingPageUrl(self.url, page), 'folder', '', config=self.config,
+                                 trace=self.trace, onFolder=pages.append)
+        fetcher.getDataFromPage()
+        return fetcher, pages[0] if pages else ''
+
+    def addIds(self, page_html):
+        # returns how many of the page's sets weren't seen yet
+        new = [id for id in extractSetIds(page_html) if id not in self.ids]
+        self.ids.extend(new)
+        return len(new)
+
+    def fetch(self):
+        with self.trace.profiled():
+            fetcher, page_html = self.fetchListingPage(1)
+            if fetcher.error:
+                for field in ("error", "errorCode", "errorCaptcha", "errorReason", "errorMessage"):
+                    setattr(self, field, getattr(fetcher, field))
+                return
+            self.name = listingName(self.url, self.kind, page_html)
+            self.addIds(page_html)
+
+            # page 2 alone tells whether the listing is paginated at all, after that
+            # pages are fetched `workers` at a time until one brings nothing new
+            page, window = 2, 1
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                while self.ids:
+                    results = list(pool.map(self.fetchListingPage, range(page, page + window)))
+                    new = [0 if fetcher.error else self.addIds(page_html) for fetcher, page_html in results]
+                    if not all(new):
+                        break
+                    page += window
+                    window = self.workers
@@ -0,0 +1,235 @@
+# -------------------------------------------------------------------------------
+#
+# Quizlet set search: a result table to pick sets from without leaving Anki
+#
+# Result pages are read like a listing (set links in the page) and kept in
+# the deck cache for `search_cache_hours`. The title, card count and first
+# cards of the top results come from the webapi, several sets at once, and
+# fill in the table as they arrive. Picked sets are imported or queued by the
+# importer window, the same way as a pasted URL.
+#
+# -------------------------------------------------------------------------------
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from aqt.qt import *
+
+try:
+    from PyQt6.QtCore import pyqtSignal
+except Exception:
+    from PyQt5.QtCore import pyqtSignal
+
+from .timing import ImportTrace
+from .quizlet import QuizletFetcher, searchUrl, deckUrl, extractSetIds
+from .preview import plainText
+
+# cards shown in the preview column
+preview_cards = 3
+
+
+class SetSearch(object):
+
+    def __init__(self, query, config=None, cache=None, trace=None):
+        self.query = " ".join(query.lower().split())
+        self.config = config or {}
+        self.cache = cache
+        self.trace = trace or ImportTrace("search")
+
+        self.error = False
+        self.errorCode = None
+        self.errorCaptcha = False
+        self.errorReason = None
+        self.errorMessage = None
+
+    def fetchPage(self, page):
+        # set ids of a result page, from the cache when it's recent
+        maxAge = self.config.get("search_cache_hours", 24) * 3600
+        ids = self.cache.getSearch(self.query, page, maxAge) if self.cache else None
+        if ids is not None:
+            return ids
+
+        # same page -> proxy retry as a listing page
+        pages = []
+        fetcher = QuizletFetcher(searchUrl(self.query, page), 'folder', '', config=self.config,
+                                 trace=self.trace, onFolder=pages.append)
+        fetcher.getDataFromPage()
+        if fetcher.error:
+            for field in ("error", "errorCode", "errorCaptcha", "errorReason", "errorMessage"):
+                setattr(self, field, getattr(fetcher, field))
+            return []
+
+        ids = extractSetIds(pages[0] if pages else '')
+        if self.cache:
+            self.cache.putSearch(self.query, page, ids)
+        return ids
+
+    def setInfo(self, quizletDeckID):
+        # title, card count and the first cards of a result
+        fetcher = QuizletFetcher(deckUrl(quizletDeckID), quizletDeckID, '', config=self.config, trace=self.trace)
+        info = {"id": quizletDeckID}
+        try:
+            model = fetcher.fetchSet()
+            info["title"] = model.get("title")
+            info["count"] = model.get("numTerms")
+            info["preview"] = " | ".join("{0} - {1}".format(plainText(item["term"]), plainText(item["definition"]))
+                                         for item in fetcher.fetchSample(preview_cards))
+        except Exception as e:
+            info["error"] = str(e)
+        return info
+
+
+class SearchLoader(QThread):
+    # a result page: its set ids first, then the details of the top results as they come
+    resultsFound = pyqtSignal(list)
+    setLoaded = pyqtSignal(dict)
+
+    def __init__(self, search, page, workers=2, previews=10, parent=None):
+        # owned by the pane, a search replaced while loading runs out on its own
+        super(SearchLoader, self).__init__(parent)
+        self.search = search
+        self.page = page
+        self.workers = workers
+        self.previews = previews
+
+    def run(self):
+        with self.search.trace.profiled():
+            ids = self.search.fetchPage(self.page)
+            self.resultsFound.emit(ids)
+            if not ids or not self.previews:
+                return
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = [pool.submit(self.search.setInfo, id) for id in ids[:self.previews]]
+                for future in as_completed(futures):
+                    self.setLoaded.emit(future.result())
+
+
+class SearchPane(QWidget):
+    columns = ["Title", "Cards", "First cards"]
+    # ids of the picked sets, to import like a pasted URL or to add to the import queue
+    importRequested = pyqtSignal(list)
+    queueRequested = pyqtSignal(list)
+
+    def __init__(self, config=None, cache=None, parent=None):
+        super(SearchPane, self).__init__(parent)
+        self.config = config or {}
+        self.cache = cache
+        self.search = None
+        self.page = 0
+        self.loader = None
+        self.ids = []
+        # results before the page being loaded
+        self.before = 0
+
+        self.text_query = QLineEdit("", self)
+        self.text_query.setPlaceholderText("Search Quizlet sets")
+        self.text_query.returnPressed.connect(self.onSearch)
+        self.button_search = QPushButton("Search", self)
+        self.button_search.clicked.connect(self.onSearch)
+        self.button_more = QPushButton("More results", self)
+        self.button_more.clicked.connect(self.onMore)
+        self.button_more.setEnabled(False)
+
+        self.table = QTableWidget(0, len(self.columns), self)
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setWordWrap(False)
+        self.table.verticalHeader().hide()
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
+        self.table.setMinimumHeight(200)
+        self.table.doubleClicked.connect(lambda index: self.onImport())
+
+        self.button_import = QPushButton("Import", self)
+        self.button_import.clicked.connect(self.onImport)
+        self.button_queue = QPushButton("Add to queue", self)
+        self.button_queue.clicked.connect(lambda: self.queueRequested.emit(self.selectedIds()))
+        self.label_status = QLabel("", self)
+
+        top = QHBoxLayout()
+        top.addWidget(self.text_query)
+        top.addWidget(self.button_search)
+        bottom = QHBoxLayout()
+        bottom.addWidget(self.button_import)
+        bottom.addWidget(self.button_queue)
+        bottom.addWidget(self.button_more)
+        bottom.addWidget(self.label_status)
+        bottom.addStretch()
+
+        box = QVBoxLayout()
+        box.setContentsMargins(0, 0, 0, 0)
+        box.addLayout(top)
+        box.addWidget(self.table)
+        box.addLayout(bottom)
+        self.setLayout(box)
+
+    def onSearch(self):
+        query = self.text_query.text().strip()
+        if not query:
+            return
+        self.search = SetSearch(query, self.config, self.cache,
+                                ImportTrace("search", profile=self.config.get("profile", False)))
+        self.page = 0
+        self.ids = []
+        self.loader = None
+        self.table.setRowCount(0)
+        self.onMore()
+
+    def onMore(self):
+        if not self.search or (self.loader and self.loader.isRunning()):
+            return
+        self.page += 1
+        self.before = len(self.ids)
+        self.button_more.setEnabled(False)
+        self.label_status.setText("Searching...")
+        loader = SearchLoader(self.search, self.page, workers=self.config.get("fetch_workers", 2),
+                              previews=self.config.get("search_previews", 10), parent=self)
+        # results of an older search are dropped
+        loader.resultsFound.connect(lambda ids: loader is self.loader and self.addResults(ids))
+        loader.setLoaded.connect(lambda info: loader is self.loader and self.updateResult(info))
+        loader.finished.connect(lambda: loader is self.loader and self.onLoaded())
+        self.loader = loader
+        loader.start()
+
+    def addResults(self, ids):
+        for id in ids:
+            if id in self.ids:
+                continue
+            self.ids.append(id)
+            row = self.table.rowCount()
+            self.table.insertRow(row)
+            self.table.setItem(row, 0, QTableWidgetItem(id))
+            self.table.setItem(row, 1, QTableWidgetItem(""))
+            self.table.setItem(row, 2, QTableWidgetItem(""))
+
+    def updateResult(self, info):
+        if info["id"] not in self.ids:
+            return
+        row = self.ids.index(info["id"])
+        if info.get("error"):
+            self.table.item(row, 2).setText(info["error"])
+            return
+        self.table.item(row, 0).setText(info.get("title") or info["id"])
+        self.table.item(row, 1).setText(str(info.get("count") or ""))
+        self.table.item(row, 2).setText(info.get("preview", ""))
+        self.table.item(row, 2).setToolTip(info.get("preview", ""))
+
+    def onLoaded(self):
+        search = self.search
+        if search.error:
+            self.label_status.setText("Search failed: {0}".format(
+                "captcha, try to disable VPN" if search.errorCaptcha else search.errorCode or search.errorMessage))
+            return
+        self.label_status.setText("{0} sets".format(len(self.ids)) if self.ids else "Nothing found")
+        # a page that brought nothing new is the last one
+        self.button_more.setEnabled(len(self.ids) > self.before)
+
+    def selectedIds(self):
+        rows = sorted(set(index.row() for index in self.table.selectionModel().selectedRows()))
+        return [self.ids[row] for row in rows]
+
+    def onImport(self):
+        ids = self.selectedIds()
+        if ids:
+            self.importRequested.emit(ids)
@@ -0,0 +1,293 @@
+# -------------------------------------------------------------------------------
+#
+# Subscriptions: keeps imported sets up to date with Quizlet
+#
+# Every imported set is recorded in the collection config with the guid and a
+# hash of the note made from each of its items. A sync asks the webapi for
+# each set's lastModified, fetches only the sets that changed and adds,
+# updates and deletes notes item by item. Media files an import or sync couldn't get
+# are kept with the set and downloaded again by every sync until they come
+# in. check() does the network part and
+# may run on any thread, apply() changes the notes on the collection's thread
+# and adds the downloaded files to the collection's media.
+#
+# -------------------------------------------------------------------------------
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .timing import ImportTrace
+    from .pipeline import missingFile
+    from .quizlet import (QuizletFetcher, deckUrl, downloadStaged, downloadOnce, itemMedia, mediaFields,
+                          addMediaFile, filterItems, addItemNote, ankify)
+except ImportError:
+    from timing import ImportTrace
+    from pipeline import missingFile
+    from quizlet import (QuizletFetcher, deckUrl, downloadStaged, downloadOnce, itemMedia, mediaFields,
+                         addMediaFile, filterItems, addItemNote, ankify)
+
+config_key = "quizletSubscriptions"
+
+# media kind -> the field its file goes into
+media_fields = {"termAudio": "FrontAudio", "definitionAudio": "BackAudio", "image": "Image"}
+
+
+def itemHash(item):
+    # audio urls carry changing query strings, only their path counts
+    values = [item["term"], item["definition"], item["imageUrl"]] + \
+        [urllib.parse.urlparse(item[k] or "").path for k in ("termAudio", "definitionAudio")]
+    return hashlib.sha1(json.dumps(values).encode('utf-8')).hexdigest()[:16]
+
+
+def subscriptions(col):
+    return col.get_config(config_key, {})
+
+
+def subscribe(col, job, addReverse=False, downloadAudio=True):
+    # records an imported set, job.notes holds (item, guid) of every note written
+    subs = subscriptions(col)
+    sub = subs.get(str(job.quizletDeckID), {"items": {}})
+    sub.update({
+        "deck": job.deckName(),
+        # follows a renamed deck, older subscriptions only have the name
+        "deckId": job.deckId,
+        "modified": job.modified,
+        "reverse": addReverse,
+        "audio": downloadAudio,
+        "start": job.startPhrase,
+        "stop": job.stopPhrase,
+        # only some items were picked in the preview, new items of the set aren't added
+        "picked": job.selected is not None
+    })
+    for item, guid in job.notes:
+        sub["items"][str(item["id"])] = [guid, itemHash(item)]
+    # files the import gave up on or left out by the media limits, the next sync tries them again
+    sub["missing"] = [dict((k, v) for k, v in failure.items() if k != "error")
+                      for failure in job.failed + job.deferred]
+    subs[str(job.quizletDeckID)] = sub
+    col.set_config(config_key, subs)
+
+
+def unsubscribe(col, quizletDeckIDs):
+    subs = subscriptions(col)
+    for quizletDeckID in quizletDeckIDs:
+        subs.pop(str(quizletDeckID), None)
+    col.set_config(config_key, subs)
+
+
+def subscribedDeck(col, sub):
+    # id of the set's deck, None once the user deleted it
+    if sub.get("deckId") and col.decks.get(sub["deckId"], default=False):
+        return sub["deckId"]
+    return col.decks.id_for_name(sub["deck"])
+
+
+def dropDeleted(col):
+    # a deleted deck ends its subscription instead of coming back with the next sync
+    subs = subscriptions(col)
+    dropped = [id for id, sub in subs.items() if not subscribedDeck(col, sub)]
+    if dropped:
+        unsubscribe(col, dropped)
+    return dropped
+
+
+class SetChanges(object):
+    # what a sync found for one set, applied to the collection by SubscriptionSync.apply()
+
+    def __init__(self, quizletDeckID):
+        self.quizletDeckID = quizletDeckID
+        self.modified = None
+        self.added = []
+        self.updated = []
+        self.deleted = []
+        # (missing file entry, staged file name) of the files that came in this time
+        self.repaired = []
+        # missingFile() of the files of added and updated items that didn't, for the next sync
+        self.failed = []
+        self.error = None
+
+    def changed(self):
+        return bool(self.added or self.updated or self.deleted or self.repaired)
+
+
+class SubscriptionSync(object):
+
+    def __init__(self, subs, config=None, workers=2, trace=None):
+        self.subs = subs
+        # downloads wait here for apply()
+        self.staging = tempfile.mkdtemp(prefix="quizlet-sync-")
+        self.config = config or {}
+        self.workers = workers
+        self.trace = trace or ImportTrace("sync")
+        self.download = downloadOnce(self.fileDownloader)
+
+    def fileDownloader(self, url, suffix, fallback):
+        return downloadStaged(url, self.staging, suffix, fallback,
+                              self.config.get("license", None), self.trace,
+                              self.config.get("media_timeout_seconds") or None)
+
+    def itemFiles(self, changes, item, audio):
+        # {kind: staged file name}. a missing file doesn't hold up the sync, the note goes
+        # without it (an updated one keeps its old file) and the next sync tries again
+        files = {}
+        for kind, url, suffix, fallback in itemMedia(item, audio):
+            try:
+                files[kind] = self.download(url, suffix, fallback)
+            except Exception as e:
+                files[kind] = None
+                changes.failed.append(missingFile(item, kind, url, suffix, fallback, str(e)))
+        return files
+
+    def checkSet(self, quizletDeckID):
+        sub = self.subs[quizletDeckID]
+        changes = SetChanges(quizletDeckID)
+        fetcher = QuizletFetcher(deckUrl(quizletDeckID), quizletDeckID, '', config=self.config, trace=self.trace)
+
+        for missing in sub.get("missing", []):
+            try:
+                changes.repaired.append((missing, self.download(missing["url"], missing["suffix"],
+                                                                missing["fallback"])))
+            except Exception:
+                # still missing, the next sync tries again
+                pass
+
+        try:
+            changes.modified = fetcher.fetchModified()
+        except Exception as e:
+            changes.error = "Can't check for changes: {0}".format(e)
+            return changes
+        if changes.modified == sub["modified"]:
+            return changes
+
+        fetcher.fetch()
+        if fetcher.error:
+            changes.error = fetcher.errorMessage or "Error {0}".format(fetcher.errorCode)
+            return changes
+
+        known = sub["items"]
+        items = list(filterItems(fetcher.results['items'], sub.get("start", ""), sub.get("stop", "")))
+        for item in items:
+            entry = known.get(str(item["id"]))
+            if entry and entry[1] == itemHash(item):
+                continue
+            if not entry and sub.get("picked"):
+                continue
+            # the fields are made once apply() added the files
+            files = self.itemFiles(changes, item, sub.get("audio", True))
+            if entry:
+                changes.updated.append((item, files, entry[0]))
+            else:
+                changes.added.append((item, files))
+
+        current = set(str(item["id"]) for item in items)
+        changes.deleted = [id for id in known if id not in current]
+        return changes
+
+    # network part: change checks, fetches and media for every subscribed set
+    def check(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(self.checkSet, list(self.subs)))
+
+    def findNote(self, col, guid):
+        noteId = col.db.scalar("select id from notes where guid = ?", guid)
+        return col.get_note(noteId) if noteId else None
+
+    def mediaFields(self, col, item, files):
+        names = {}
+        for kind, name in files.items():
+            if name and name not in self.registered:
+                path = os.path.join(self.staging, name)
+                self.registered[name] = addMediaFile(col, path) if os.path.exists(path) else None
+            names[kind] = name and self.registered[name]
+        return mediaFields(item, names, self.config.get("diagram_style", "highlight"))
+
+    # changes the notes, on the thread owning the collection. returns (added, updated, deleted)
+    def apply(self, col, changes):
+        try:
+            return self.applyChanges(col, changes)
+        finally:
+            self.cleanup()
+
+    def cleanup(self):
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+    def applyChanges(self, col, changes):
+        subs = subscriptions(col)
+        counts = [0, 0, 0]
+        # staged file name -> name in the collection's media
+        self.registered = {}
+
+        for change in changes:
+            sub = subs.get(change.quizletDeckID)
+            if not sub:
+                continue
+            deckId = subscribedDeck(col, sub)
+            if not deckId:
+                # deleted while the sync was checking
+                subs.pop(change.quizletDeckID)
+                continue
+            items = sub["items"]
+
+            for missing, name in change.repaired:
+                entry = items.get(str(missing["item"]))
+                note = entry and self.findNote(col, entry[0])
+                if note:
+                    fields = self.mediaFields(col, {"shape": missing.get("shape")}, {missing["kind"]: name})
+                    for field, value in fields.items():
+                        note[field] = value
+                    col.update_note(note)
+                    counts[1] += 1
+                if missing in sub.get("missing", []):
+                    sub["missing"].remove(missing)
+            if change.error:
+                continue
+
+            if change.added:
+                for item, files in change.added:
+                    fields = self.mediaFields(col, item, files)
+                    note = addItemNote(col, item, fields, sub.get("reverse", False), deckId, self.trace)
+                    items[str(item["id"])] = [note.guid, itemHash(item)]
+                    counts[0] += 1
+
+            for item, files, guid in change.updated:
+                note = self.findNote(col, guid)
+                if note:
+                    fields = self.mediaFields(col, item, files)
+                    # notes deleted by hand stay deleted
+                    note["FrontText"] = ankify(item["term"])
+                    note["BackText"] = ankify(item["definition"])
+                    for kind, name in media_fields.items():
+                        if kind in files and not files[kind]:
+                            # the download failed, the old file stays until a sync gets the new one
+                            continue
+                        note[name] = fields.get(name, "")
+                    col.update_note(note)
+                    counts[1] += 1
+                items[str(item["id"])] = [guid, itemHash(item)]
+
+            noteIds = []
+            for id in change.deleted:
+                guid = items.pop(id)[0]
+                sub["missing"] = [m for m in sub.get("missing", []) if str(m["item"]) != id]
+                note = self.findNote(col, guid)
+                if note:
+                    noteIds.append(note.id)
+            if noteIds:
+                col.remove_notes(noteIds)
+                counts[2] += len(noteIds)
+
+            # what this sync couldn't download replaces older entries of the same item and kind
+            failed = [dict((k, v) for k, v in failure.items() if k != "error") for failure in change.failed]
+            keys = set((m["item"], m["kind"]) for m in failed)
+            sub["missing"] = [m for m in sub.get("missing", []) if (m["item"], m["kind"]) not in keys] + failed
+
+            sub["modified"] = change.modified
+
+        col.set_config(config_key, subs)
+        return tuple(counts)
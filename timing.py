@@ -0,0 +1,149 @@
+# -------------------------------------------------------------------------------
+#
+# Timing spans and profiler capture for a single import.
+#
+# An ImportTrace is created per "Import Deck" click and handed to the
+# downloader thread and to createDeck. Every phase (fetch, extract, map,
+# media, note, ...) records a span, every HTTP request records its url,
+# route, status, size, latency and retries.
+#
+# -------------------------------------------------------------------------------
+
+import os
+import re
+import json
+import time
+import cProfile
+import pstats
+import threading
+from contextlib import contextmanager
+
+
+class ImportTrace(object):
+
+    def __init__(self, name='', profile=False):
+        self.name = name
+        self.started = time.time()
+        self.spans = []
+        self.requests = []
+        self.profiles = []
+        # what the import found worth reporting besides the timings, one line each
+        self.notes = []
+        self.profile = profile
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name, **info):
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            span = dict(info)
+            span['phase'] = name
+            span['start'] = round(start, 6)
+            span['duration'] = time.perf_counter() - start
+            span['thread'] = threading.current_thread().name
+            with self.lock:
+                self.spans.append(span)
+
+    def request(self, url, route, status, size, latency, retries=0):
+        with self.lock:
+            self.requests.append({
+                "url": url,
+                "route": route,
+                "status": status,
+                "bytes": size,
+                "latency": latency,
+                "retries": retries
+            })
+
+    def note(self, text):
+        with self.lock:
+            self.notes.append(text)
+
+    @contextmanager
+    def profiled(self):
+        # cProfile only sees the thread it was enabled in, so the downloader
+        # thread and the main thread each get their own profile and the
+        # stats are merged on dump. python 3.12+ allows one active profiler per process,
+        # a nested or concurrent one is left out instead of failing the stage it wraps
+        if not self.profile:
+            yield
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            profiler = None
+        if profiler is None:
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self.lock:
+                self.profiles.append(profiler)
+
+    def totals(self):
+        result = {}
+        for span in self.spans:
+            total = result.setdefault(span['phase'], {"count": 0, "duration": 0.0})
+            total['count'] += 1
+            total['duration'] += span['duration']
+        return result
+
+    def summary(self):
+        lines = ["Import {0} took {1:.2f}s".format(
+            self.name, time.time() - self.started)]
+
+        for phase, total in sorted(self.totals().items(), key=lambda t: -t[1]['duration']):
+            lines.append("  {0:<10} {1:>5}x {2:>8.2f}s".format(
+                phase, total['count'], total['duration']))
+
+        if self.requests:
+            routes = {}
+            for r in self.requests:
+                route = routes.setdefault(r['route'], [0, 0, 0.0, 0, 0])
+                route[0] += 1
+                route[1] += r['bytes'] or 0
+                route[2] += r['latency']
+                route[3] += r['retries']
+                route[4] += 1 if r['status'] != 200 else 0
+            for name, (count, size, latency, retries, failed) in sorted(routes.items()):
+                lines.append("  {0:<10} {1:>5} requests, {2:.1f} KB, {3:.2f}s, {4} retries, {5} failed".format(
+                    name, count, size / 1024.0, latency, retries, failed))
+
+        lines.extend("  " + note for note in self.notes)
+        return "\n".join(lines)
+
+    def dump(self, folder):
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        # the jobs of one import start in the same second, the set id tells them apart
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        name = re.sub(r'[^\w-]+', '_', str(self.name))
+        stamp = "{0}-{1}".format(stamp, name) if name else stamp
+        path = os.path.join(folder, "trace-{0}.json".format(stamp))
+        count = 1
+        while os.path.exists(path):
+            count += 1
+            path = os.path.join(folder, "trace-{0}-{1}.json".format(stamp, count))
+        stamp = os.path.basename(path)[len("trace-"):-len(".json")]
+
+        with open(path, 'w') as f:
+            json.dump({
+                "name": self.name,
+                "started": self.started,
+                "totals": self.totals(),
+                "spans": self.spans,
+                "requests": self.requests,
+                "notes": self.notes
+            }, f, indent=2)
+
+        if self.profiles:
+            pstats.Stats(*self.profiles).dump_stats(
+                os.path.join(folder, "profile-{0}.prof".format(stamp)))
+
+        return path
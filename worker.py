@@ -0,0 +1,265 @@
+# -------------------------------------------------------------------------------
+#
+# Out-of-process imports: fetch, extract, map and media in a worker process
+#
+# With `worker_process` the importer window runs a WorkerPipeline instead of
+# an ImportPipeline. It starts this file with Anki's Python and sends it the
+# jobs; the worker runs every stage of the pipeline but the collection writes
+# (pages, regex and json decoding, mapping, media downloads and their retries)
+# and streams each finished chunk back as one json line: the mapped items and
+# the names of their files in the staging folder, which the two share. Anki's
+# process only adds the notes and the media, and the memory of the pages and
+# items goes away with the worker when the import is done.
+#
+#   parent -> worker   {"settings": ...}, {"add": n, ...}, {"cancel": n or null}
+#   worker -> parent   {"job": n, "state": ..., "chunk" | "retried" | "done": ...}
+#
+# A closed stdin tells the worker that no more jobs are coming; it exits once
+# those it has are done.
+#
+# -------------------------------------------------------------------------------
+
+import os
+import sys
+import queue
+import shutil
+import threading
+import subprocess
+
+try:
+    from . import quizlet
+    from . import jsonlib
+    from .pipeline import ImportPipeline, ImportJob, retried_chunk
+    from .httparchive import HttpReplay
+    from .cache import DeckCache
+except ImportError:
+    import quizlet
+    import jsonlib
+    from pipeline import ImportPipeline, ImportJob, retried_chunk
+    from httparchive import HttpReplay
+    from cache import DeckCache
+
+# what the parent's job learns from the worker's one
+state_fields = ("title", "total", "chunks", "proxy", "api", "modified", "contentHash",
+                "deferred", "failed")
+error_fields = ("error", "errorCode", "errorCaptcha", "errorReason", "errorMessage")
+
+worker_script = os.path.abspath(__file__)
+
+
+def jobState(job):
+    return dict((field, getattr(job, field)) for field in state_fields + error_fields)
+
+
+def send(output, message):
+    output.write(jsonlib.dumps(message) + b"\n")
+    output.flush()
+
+
+class WorkerPipeline(ImportPipeline):
+    # the write stage of an ImportPipeline, the other stages run in the worker process
+
+    def __init__(self, col, config=None, **options):
+        super(WorkerPipeline, self).__init__(col, config, **options)
+        self.process = None
+        self.reader = None
+        # job -> its number in the messages
+        self.numbers = {}
+
+    def settings(self):
+        return {"config": self.config, "downloadAudio": self.downloadAudio, "skipErrors": self.skipErrors,
+                "budget": self.budget.limit, "fetchWorkers": self.fetchWorkers, "mediaWorkers": self.mediaWorkers,
+                "chunkSize": self.chunkSize, "processes": self.processes, "staging": self.staging,
+                "cache": self.cache.path if self.cache else None,
+                "prefetched": [[url, suffix, path] for (url, suffix), path in self.prefetched.items()],
+                "quizletUrl": quizlet.quizlet_url, "proxyUrl": quizlet.proxy_url}
+
+    def send(self, message):
+        try:
+            send(self.process.stdin, message)
+        except (OSError, ValueError):
+            # the worker is gone, the reader reports it
+            pass
+
+    def sendJob(self, job):
+        self.send({"add": self.numbers[job], "id": job.quizletDeckID, "url": job.url, "html": job.html,
+                   "title": job.title, "startPhrase": job.startPhrase, "stopPhrase": job.stopPhrase,
+                   "parent": job.parent, "items": job.items,
+                   "selected": list(job.selected) if job.selected is not None else None})
+        # the worker has the items now
+        job.items = None
+
+    def add(self, job):
+        self.numbers[job] = len(self.jobs)
+        self.jobs.append(job)
+        if self.process:
+            self.sendJob(job)
+        return job
+
+    def cancel(self):
+        super(WorkerPipeline, self).cancel()
+        if self.process:
+            self.send({"cancel": None})
+
+    def start(self):
+        self.process = subprocess.Popen([sys.executable, worker_script], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+        self.send({"settings": self.settings()})
+        for job in self.jobs:
+            self.sendJob(job)
+        self.reader = threading.Thread(target=self.readStage, name="quizlet-readStage", daemon=True)
+        self.reader.start()
+
+    # read: the worker's messages go into the write queue, a full queue holds up the worker
+    def readStage(self):
+        closed = set()
+        for line in self.process.stdout:
+            message = jsonlib.loads(line)
+            job = self.jobs[message["job"]]
+            state = message["state"]
+            for field in state_fields:
+                setattr(job, field, state[field])
+            if state["error"] and not job.error:
+                for field in error_fields:
+                    setattr(job, field, state[field])
+
+            if "chunk" in message:
+                self.put(self.writeQueue, (job, 0, message["chunk"], 0))
+            elif "retried" in message:
+                self.put(self.writeQueue, (job, retried_chunk, message["retried"], 0))
+            elif "done" in message:
+                done = message["done"]
+                with job.trace.lock:
+                    job.trace.spans.extend(done["spans"])
+                    job.trace.requests.extend(done["requests"])
+                self.budget.peak = max(self.budget.peak, done["peak"])
+                closed.add(job)
+                self.put(self.writeQueue, (job, None, None, 0))
+
+        # a worker that stopped early fails the jobs it didn't finish
+        code = self.process.wait()
+        for job in self.jobs:
+            if job in closed:
+                continue
+            if not job.error:
+                job.error = True
+                job.errorMessage = "The import worker process stopped (exit code {0})".format(code)
+            self.put(self.writeQueue, (job, None, None, 0))
+
+    def write(self, job, index, chunk, size):
+        # the worker keeps the deck order and runs the retries, what comes here is ready to add
+        if index is None:
+            job.done = True
+        elif index == retried_chunk:
+            self.writeRetried(job, [(item, files) for item, files in chunk])
+        elif job.error:
+            # cancelled from the import queue, the worker drops the rest of it
+            self.send({"cancel": self.numbers[job]})
+        else:
+            self.writeChunk(job, [(item, files) for item, files in chunk])
+
+    def stop(self):
+        if self.process:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.reader:
+            self.reader.join(10)
+        if self.ownStaging:
+            shutil.rmtree(self.staging, ignore_errors=True)
+
+
+class StreamingPipeline(ImportPipeline):
+    # the worker's side: every stage but the collection writes, which become messages
+
+    def __init__(self, output, **options):
+        super(StreamingPipeline, self).__init__(None, **options)
+        self.output = output
+        # job -> the parent's number of it
+        self.numbers = {}
+        self.reported = set()
+
+    def add(self, job, number=None):
+        self.numbers[job] = number
+        return super(StreamingPipeline, self).add(job)
+
+    def message(self, job, **message):
+        message.update(job=self.numbers[job], state=jobState(job))
+        send(self.output, message)
+
+    def writeChunk(self, job, chunk):
+        self.message(job, chunk=[[item, files] for item, files in chunk])
+
+    def writeRetried(self, job, recovered):
+        self.message(job, retried=[[item, files] for item, files in recovered])
+
+    def write(self, job, index, chunk, size):
+        super(StreamingPipeline, self).write(job, index, chunk, size)
+        if job.done and job not in self.reported:
+            self.reported.add(job)
+            self.message(job, done={"spans": job.trace.spans, "requests": job.trace.requests,
+                                    "peak": self.budget.peak})
+
+
+def serve(input, output):
+    settings = jsonlib.loads(input.readline())["settings"]
+    quizlet.quizlet_url = settings["quizletUrl"]
+    quizlet.proxy_url = settings["proxyUrl"]
+    config = settings["config"]
+    if config.get("replay_http"):
+        quizlet.archive = HttpReplay(config["replay_http"], config.get("replay_latency", 1.0))
+
+    cache = DeckCache(settings["cache"]) if settings["cache"] else None
+    pipeline = StreamingPipeline(output, config=config, downloadAudio=settings["downloadAudio"],
+                                 skipErrors=settings["skipErrors"], budget=settings["budget"],
+                                 fetchWorkers=settings["fetchWorkers"], mediaWorkers=settings["mediaWorkers"],
+                                 chunkSize=settings["chunkSize"], cache=cache, processes=settings["processes"],
+                                 prefetched=dict(((url, suffix), path) for url, suffix, path in settings["prefetched"]),
+                                 staging=settings["staging"])
+
+    closed = threading.Event()
+
+    def commands():
+        for line in input:
+            message = jsonlib.loads(line)
+            if "add" in message:
+                job = ImportJob(message["id"], message["url"], message["html"], startPhrase=message["startPhrase"],
+                                stopPhrase=message["stopPhrase"], parent=message["parent"],
+                                selected=message["selected"])
+                job.title = message["title"]
+                job.items = message["items"]
+                pipeline.add(job, message["add"])
+            elif message["cancel"] is None:
+                pipeline.cancel()
+            else:
+                for job, number in list(pipeline.numbers.items()):
+                    if number == message["cancel"] and not job.error:
+                        job.error = True
+                        job.errorMessage = "Cancelled"
+        closed.set()
+
+    threading.Thread(target=commands, name="quizlet-commands", daemon=True).start()
+    pipeline.start()
+    try:
+        while not (closed.is_set() and pipeline.finished()):
+            try:
+                job, index, chunk, size = pipeline.writeQueue.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            pipeline.write(job, index, chunk, size)
+    finally:
+        pipeline.stop()
+        if cache:
+            cache.close()
+
+
+if __name__ == "__main__":
+    # stdout carries the messages, prints of the stages go to stderr
+    output = sys.stdout.buffer
+    sys.stdout = sys.stderr
+    serve(sys.stdin.buffer, output)